@@ -1,16 +1,206 @@
+"""
+Summarizing the files of a directory tree.
+
+Run without arguments, CLIInterface asks for a directory and streams a
+completion for each chunk of each file, pausing after every one.
+
+With --root, the tree is summarized headless. Files are walked with ignore
+rules: version control and dependency directories, --exclude patterns,
+files over --max-file-bytes and binary files are skipped. Each file is
+chunked by tokens and summarized, several files at once (--concurrency).
+All requests go through the shared rate-limited dispatcher. Each finished
+file is appended to the --output JSON lines file as soon as it is done. A
+rerun with the same output file resumes the run: it skips every file already
+recorded with the same content hash, so a crashed run picks up where it
+stopped.
+
+    python CliService.py --root path/to/repo --output tree_summary.jsonl
+"""
+
 import os
-import openai
+import sys
+import json
+import fnmatch
+import hashlib
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
+from chunker import chunk_text
+from tokenization import load_tokenizer
+from llm_client import llm_client
+from stream_sink import StreamWriter, ConsoleSink, FileSink
 
 load_dotenv()  # This will load the environment variables from the .env file
 
+# Directories that never hold files worth summarizing
+IGNORED_DIRS = {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv",
+                ".tox", ".mypy_cache", ".pytest_cache", "dist", "build"}
+# How much of a file is checked for NUL bytes to tell if it is binary
+BINARY_PROBE_BYTES = 8192
+FILE_PROMPT = "Summarize this part of the file {path}:\n\n{text}\n\nSummary:"
+
+
+def walk_tree(root, exclude=(), max_file_bytes=1_000_000):
+    """Lists the files under root worth summarizing.
+
+    Parameters:
+    root (str): The directory to walk.
+    exclude (iterable, optional): fnmatch patterns; files and directories whose path
+        relative to root (or name) matches one are skipped.
+    max_file_bytes (int, optional): Larger files are skipped. Default is 1000000.
+
+    Returns:
+    list: The paths relative to root, in order.
+    """
+    def excluded(rel_path):
+        return any(fnmatch.fnmatch(rel_path, pattern) or
+                   fnmatch.fnmatch(os.path.basename(rel_path), pattern) for pattern in exclude)
+
+    paths = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = os.path.relpath(dirpath, root)
+        dirnames[:] = sorted(
+            name for name in dirnames
+            if name not in IGNORED_DIRS and not excluded(os.path.normpath(os.path.join(rel_dir, name))))
+        for filename in sorted(filenames):
+            rel_path = os.path.normpath(os.path.join(rel_dir, filename))
+            path = os.path.join(root, rel_path)
+            if excluded(rel_path) or not os.path.isfile(path):
+                continue
+            if os.path.getsize(path) > max_file_bytes:
+                continue
+            paths.append(rel_path)
+    return paths
+
+
+def read_text(path):
+    """Returns the text of a file, or None if it is binary or not UTF-8."""
+    with open(path, 'rb') as f:
+        data = f.read()
+    if b"\0" in data[:BINARY_PROBE_BYTES]:
+        return None
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+def load_completed(output_path):
+    """Reads the files already summarized into output_path.
+
+    A line cut short by a crash is removed, so the file can be appended to.
+
+    Returns:
+    dict: The content hash of each completed file, by path.
+    """
+    completed = {}
+    try:
+        with open(output_path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return completed
+    end = data.rfind(b"\n") + 1
+    if end < len(data):
+        with open(output_path, 'r+b') as f:
+            f.truncate(end)
+    for line in data[:end].decode("utf-8").splitlines():
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if "error" not in record:
+            completed[record["path"]] = record["sha256"]
+    return completed
+
+
+class TreeSummarizer:
+    def __init__(self, client, enc, engine="text-davinci-002", max_tokens=2048, summary_tokens=256, concurrency=8):
+        """Create a headless summarizer of directory trees.
+
+        Parameters:
+        client (LLMClient): The client completions are requested through.
+        enc (object): The tokenizer files are chunked with.
+        engine (str, optional): The model to use. Default is "text-davinci-002".
+        max_tokens (int, optional): The most tokens of a file in one prompt. Default is 2048.
+        summary_tokens (int, optional): The most tokens of one chunk's summary. Default is 256.
+        concurrency (int, optional): Files summarized at once. Default is 8.
+        """
+        self.client = client
+        self.enc = enc
+        self.engine = engine
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.concurrency = max(1, concurrency)
+
+    def summarize_file(self, root, rel_path):
+        text = read_text(os.path.join(root, rel_path))
+        if text is None:
+            return None
+        record = {"path": rel_path, "sha256": hashlib.sha256(text.encode("utf-8")).hexdigest()}
+        chunks = chunk_text(text, self.enc, self.max_tokens) if text.strip() else []
+        record["tokens"] = sum(chunk.token_count for chunk in chunks)
+        record["summaries"] = []
+        for chunk in chunks:
+            response = self.client.complete(
+                FILE_PROMPT.format(path=rel_path, text=chunk),
+                self.engine,
+                max_tokens=self.summary_tokens,
+                temperature=0.5,
+                label="CliService")
+            record["summaries"].append(response["choices"][0]["text"].strip())
+        return record
+
+    def run(self, root, output_path, exclude=(), max_file_bytes=1_000_000):
+        """Summarizes every file under root into output_path, skipping files already there.
+
+        Returns:
+        dict: The number of files "summarized", "skipped" (binary or not UTF-8),
+            "resumed" (already in the output) and "failed".
+        """
+        completed = load_completed(output_path)
+        paths = walk_tree(root, exclude, max_file_bytes)
+        counts = {"summarized": 0, "skipped": 0, "resumed": 0, "failed": 0}
+        pending = []
+        for rel_path in paths:
+            if rel_path in completed:
+                text = read_text(os.path.join(root, rel_path))
+                if text is not None and hashlib.sha256(text.encode("utf-8")).hexdigest() == completed[rel_path]:
+                    counts["resumed"] += 1
+                    continue
+            pending.append(rel_path)
+        print(f"{len(paths)} files under {root}: {counts['resumed']} already summarized, {len(pending)} to go")
+
+        # Only this thread writes to the output, one line per finished file
+        with open(output_path, 'a') as output, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(self.summarize_file, root, rel_path): rel_path for rel_path in pending}
+            for done, future in enumerate(as_completed(futures), 1):
+                rel_path = futures[future]
+                try:
+                    record = future.result()
+                except Exception as e:
+                    counts["failed"] += 1
+                    record = {"path": rel_path, "error": f"{type(e).__name__}: {e}"}
+                    print(f"[{done}/{len(pending)}] {rel_path} failed: {record['error']}")
+                else:
+                    if record is None:
+                        counts["skipped"] += 1
+                        continue
+                    counts["summarized"] += 1
+                    print(f"[{done}/{len(pending)}] {rel_path}: {len(record['summaries'])} chunks")
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+                os.fsync(output.fileno())
+        return counts
+
 
 class CLIInterface:
     def __init__(self):
         self.running = True
-        openai.api_key = os.getenv('GPT_SECRET_KEY')
         self.max_tokens = 2048
         self.root_dir = ""
+        self.client = llm_client()
+        self.enc = load_tokenizer()
 
     @staticmethod
     def build():
@@ -28,28 +218,28 @@ class CLIInterface:
             choice = input("Enter '1' to continue or '2' for settings: ")
             if choice == "1":
                 with open('stream.txt', 'w') as write_file:
+                    writer = StreamWriter(
+                        [FileSink(write_file), ConsoleSink()])
                     # Iterate over all the files in the file tree
                     for dirpath, dirnames, filenames in os.walk(self.root_dir):
                         for filename in filenames:
                             # Concatenate the contents of each file
                             with open(os.path.join(dirpath, filename), "r") as file:
                                 file_text = file.read()
-                                while file_text:
-                                    text = file_text[:self.max_tokens]
-                                    file_text = file_text[self.max_tokens:]
-                                    response = openai.Completion.create(
-                                        engine="text-davinci-002",
-                                        prompt=text,
+                                # Empty files have nothing to summarize
+                                chunks = chunk_text(file_text, self.enc, self.max_tokens) if file_text.strip() else []
+                                for text in chunks:
+                                    response = self.client.complete(
+                                        text,
+                                        "text-davinci-002",
                                         max_tokens=1024,
                                         temperature=0.5,
                                         n=1,
-                                        stream=True)
-                                    # Stream the response
-                                    for event in openai.Completion.stream(response.id):
-                                        write_file.write(event.get('text'))
-                                        print(event.get('text'))
-                                        print("\n")
-                                        write_file.write('\n')
+                                        stream=True,
+                                        label="CliService")
+                                    # Stream the response to the file and the terminal
+                                    writer.pump(response)
+                                    writer.write("\n")
                                     should_continue = input(
                                         'Continue? (y/n): ')
                                     if should_continue == 'n':
@@ -78,6 +268,35 @@ class CLIInterface:
                 print("Invalid choice, please try again.")
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description="Summarize the files of a directory tree; interactive without --root")
+    parser.add_argument("--root", help="Summarize this directory headless")
+    parser.add_argument("--output", default="tree_summary.jsonl",
+                        help="The JSON lines file summaries are appended to; rerunning resumes from it")
+    parser.add_argument("--engine", default="text-davinci-002", help="The model to use")
+    parser.add_argument("--max-tokens", type=int, default=2048,
+                        help="The most tokens of a file sent in one prompt")
+    parser.add_argument("--summary-tokens", type=int, default=256,
+                        help="The most tokens of one chunk's summary")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("OPENAI_CONCURRENCY", "8")),
+                        help="Files summarized at once")
+    parser.add_argument("--max-file-bytes", type=int, default=1_000_000,
+                        help="Skip files larger than this")
+    parser.add_argument("--exclude", action="append", default=[],
+                        help="Skip files and directories matching this pattern (repeatable)")
+    return parser.parse_args(argv)
+
+
 if __name__ == '__main__':
-    cli = CLIInterface.build()
-    cli.start()
+    args = parse_args(sys.argv[1:])
+    if args.root:
+        summarizer = TreeSummarizer(
+            llm_client(), load_tokenizer(), engine=args.engine, max_tokens=args.max_tokens,
+            summary_tokens=args.summary_tokens, concurrency=args.concurrency)
+        counts = summarizer.run(args.root, args.output, args.exclude, args.max_file_bytes)
+        print(f"Summarized {counts['summarized']} files, resumed {counts['resumed']}, "
+              f"skipped {counts['skipped']}, failed {counts['failed']}")
+    else:
+        cli = CLIInterface.build()
+        cli.start()
@@ -1,6 +1,7 @@
 import os
 from github import Github
 from dotenv import load_dotenv
+from .mirror import RepoMirror, MIRROR_DIR
 
 load_dotenv()  # This will load the environment variables from the .env file
 
@@ -8,11 +9,18 @@ load_dotenv()  # This will load the environment variables from the .env file
 class GithubService:
     def __init__(self, *args, **kwargs):
         self.github_api = kwargs.get('github_api')
+        self.token = kwargs.get('token')
+        self.mirror_dir = kwargs.get('mirror_dir', MIRROR_DIR)
+        self.checkout_dir = kwargs.get('checkout_dir', 'repos')
+        self.mirrors = {}
+        self.mirror = None
 
     @staticmethod
     def build():
         return GithubService(
-            github_api=Github(os.getenv('GITHUB_API_KEY'))
+            github_api=Github(os.getenv('GITHUB_API_KEY')),
+            token=os.getenv('GITHUB_API_KEY'),
+            mirror_dir=os.getenv('REPO_MIRROR_DIR', MIRROR_DIR)
         )
 
     def validate_repo_exists(self, repo_url):
@@ -31,3 +39,21 @@ class GithubService:
             return self.github_api.get_repo(f"{repo_owner}/{repo_name}")
         except:
             return None
+
+    def get_mirror(self, repo_url, refresh=False):
+        """Returns the local mirror of a repository, cloning it (or, if refresh, updating it)
+        the first time it is asked for in this session."""
+        mirror = self.mirrors.get(repo_url)
+        if mirror is None:
+            mirror = self.mirrors[repo_url] = RepoMirror(
+                repo_url, self.mirror_dir, self.token)
+            mirror.refresh()
+        elif refresh:
+            mirror.refresh()
+        self.mirror = mirror
+        return mirror
+
+    def download_file(self, path):
+        """Writes a file of the current mirror to the checkout directory and returns its local path."""
+        return self.mirror.export(path, os.path.join(
+            self.checkout_dir, os.path.basename(self.mirror.git_dir).removesuffix(".git")))
@@ -0,0 +1,192 @@
+"""
+A local mirror of a repository, so browsing it doesn't go over the network.
+
+RepoMirror keeps a bare clone of the repository on disk and an index of its
+tree: every file and directory at HEAD with its blob SHA and size, listed
+once with git ls-tree. Navigation (get_contents, with the same name, path and
+type attributes as PyGithub's contents) and file reads are served from the
+clone. refresh() fetches only new objects, then compares the new tree's SHAs
+with the index to report what was added, modified and removed; export()
+skips files whose local copy already has the right SHA.
+
+Any git URL works, including a local bare repository. For GitHub, a token
+is sent as an HTTP header on each command rather than stored in the clone.
+"""
+
+import os
+import json
+import base64
+import hashlib
+import tempfile
+import threading
+import subprocess
+from collections import namedtuple
+
+MIRROR_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer", "repos")
+
+MirrorEntry = namedtuple("MirrorEntry", ["name", "path", "type", "sha", "size"])
+
+
+def blob_sha(data):
+    """Returns the git blob SHA-1 of data (bytes)."""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def mirror_name(url):
+    """Returns a directory name for the mirror of url, e.g. "TobiahRex-cointosis-1a2b3c4d.git"."""
+    parts = [part for part in url.rstrip("/").removesuffix(".git").split("/") if part]
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:8]
+    return "-".join(parts[-2:] + [digest]) + ".git"
+
+
+class RepoMirror:
+    def __init__(self, url, mirror_dir=MIRROR_DIR, token=None):
+        """Create a mirror of the repository at url; call refresh() to clone or update it.
+
+        Parameters:
+        url (str): The repository's git URL (e.g. https://github.com/owner/repo) or path.
+        mirror_dir (str, optional): The directory the clones are kept in.
+        token (str, optional): A GitHub token for private repositories.
+        """
+        self.url = url
+        self.token = token
+        self.git_dir = os.path.join(mirror_dir, mirror_name(url))
+        self.index_path = self.git_dir + ".index.json"
+        self.commit = None
+        self.entries = {}
+        self.children = {}
+        self.lock = threading.Lock()
+        self.load_index()
+
+    def git(self, *args, clone=False):
+        command = ["git"]
+        if self.token and self.url.startswith("https://"):
+            credentials = base64.b64encode(f"x-access-token:{self.token}".encode("utf-8")).decode("ascii")
+            command += ["-c", f"http.extraHeader=Authorization: Basic {credentials}"]
+        if not clone:
+            command += ["--git-dir", self.git_dir]
+        result = subprocess.run(command + list(args), capture_output=True, check=False)
+        if result.returncode != 0:
+            raise RuntimeError(
+                f"git {args[0]} failed for {self.url}: {result.stderr.decode('utf-8', 'replace').strip()}")
+        return result.stdout
+
+    def load_index(self):
+        try:
+            with open(self.index_path, 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.set_entries(index["commit"], [MirrorEntry(*entry) for entry in index["entries"]])
+
+    def save_index(self):
+        directory = os.path.dirname(self.index_path)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump({"url": self.url, "commit": self.commit,
+                       "entries": [list(entry) for entry in self.entries.values()]}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def set_entries(self, commit, entries):
+        children = {"": []}
+        for entry in entries:
+            children.setdefault(os.path.dirname(entry.path), []).append(entry)
+        for siblings in children.values():
+            siblings.sort(key=lambda entry: (entry.type != "dir", entry.name))
+        self.commit = commit
+        self.entries = {entry.path: entry for entry in entries}
+        self.children = children
+
+    def list_tree(self):
+        # -z: NUL-terminated, unquoted paths; -t: include the directories themselves
+        output = self.git("ls-tree", "-r", "-t", "-l", "-z", "--full-tree", "HEAD")
+        entries = []
+        for line in output.decode("utf-8", "surrogateescape").split("\0"):
+            if not line:
+                continue
+            info, path = line.split("\t", 1)
+            mode, kind, sha, size = info.split()
+            if kind == "commit":
+                # A submodule; its files aren't in this repository
+                continue
+            entries.append(MirrorEntry(
+                os.path.basename(path), path, "dir" if kind == "tree" else "file", sha,
+                0 if size == "-" else int(size)))
+        return entries
+
+    def refresh(self):
+        """Clones the repository, or fetches what changed since the last refresh.
+
+        Returns:
+        dict: The "added", "modified" and "removed" file paths since the previous index.
+        """
+        with self.lock:
+            if not os.path.exists(self.git_dir):
+                os.makedirs(os.path.dirname(self.git_dir), exist_ok=True)
+                print(f"Cloning {self.url}")
+                self.git("clone", "--bare", "--quiet", self.url, self.git_dir, clone=True)
+            else:
+                self.git("fetch", "--quiet", "--prune", "origin", "+refs/heads/*:refs/heads/*")
+            commit = self.git("rev-parse", "HEAD").decode("ascii").strip()
+            changes = {"added": [], "modified": [], "removed": []}
+            if commit == self.commit:
+                return changes
+
+            old_entries = self.entries
+            self.set_entries(commit, self.list_tree())
+            for path, entry in self.entries.items():
+                if entry.type != "file":
+                    continue
+                old = old_entries.get(path)
+                if old is None:
+                    changes["added"].append(path)
+                elif old.sha != entry.sha:
+                    changes["modified"].append(path)
+            changes["removed"] = [path for path, entry in old_entries.items()
+                                  if entry.type == "file" and path not in self.entries]
+            self.save_index()
+            print(f"Mirrored {self.url} at {commit[:12]}: {len(changes['added'])} added, "
+                  f"{len(changes['modified'])} modified, {len(changes['removed'])} removed")
+            return changes
+
+    def get_contents(self, path="/"):
+        """Returns the entries of a directory, directories first.
+
+        Raises:
+        FileNotFoundError: If path is not a directory of the repository.
+        """
+        path = path.strip("/")
+        if path not in self.children:
+            if path in self.entries:
+                return []
+            raise FileNotFoundError(f"{path} is not a directory of {self.url}")
+        return list(self.children[path])
+
+    def read(self, path):
+        """Returns the contents of a file of the repository, as bytes."""
+        entry = self.entries.get(path.strip("/"))
+        if entry is None or entry.type != "file":
+            raise FileNotFoundError(f"{path} is not a file of {self.url}")
+        return self.git("cat-file", "blob", entry.sha)
+
+    def export(self, path, dest_dir):
+        """Writes a file of the repository to dest_dir/path, unless it is already there.
+
+        Returns:
+        str: The local path of the file.
+        """
+        entry = self.entries.get(path.strip("/"))
+        if entry is None or entry.type != "file":
+            raise FileNotFoundError(f"{path} is not a file of {self.url}")
+        local_path = os.path.join(dest_dir, entry.path)
+        try:
+            with open(local_path, 'rb') as f:
+                if blob_sha(f.read()) == entry.sha:
+                    return local_path
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(local_path, 'wb') as f:
+            f.write(self.read(path))
+        return local_path
@@ -1,56 +1,149 @@
 import os
-import openai
-import threading
+import re
+import sys
+import asyncio
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from llm_client import llm_client  # noqa: E402
+from stream_sink import StreamWriter, ConsoleSink  # noqa: E402
+
+DEF_NAME = re.compile(r"(?:async\s+)?def\s+(\w+)")
+
+
+def section_items(sections, prefix=""):
+    """Flattens WranglerService sections into (name, code) pairs; methods are named "Class.method"."""
+    for index, section in enumerate(sections):
+        if isinstance(section, list):
+            yield from section_items(section[1:], prefix + section[0] + ".")
+        else:
+            match = DEF_NAME.search(section)
+            yield prefix + (match.group(1) if match else f"section {index + 1}"), section
 
 
 class GptService:
     def __init__(self, *args, **kwargs):
-        self.openai_service = kwargs.get('openai_service')
+        self.client = kwargs.get('client')
         self.text_model = 'text-davinci-002'
         self.code_model = 'code-davinci-002'
         self.temperture = 0.4
         self.max_response_tokens = 1000
+        self.concurrency = kwargs.get('concurrency', 4)
 
     @staticmethod
     def build():
-        openai.api_key = os.getenv('GPT_SECRET_KEY')
         return GptService(
-            openai_service=openai
+            client=llm_client(),
+            concurrency=int(os.getenv("LEO_CONCURRENCY", "4"))
         )
 
-    def generate_summary(self, code_text, stream=True):
+    def summary_request(self, code_text, stream=True):
+        """Returns the arguments of LLMClient.complete() for a summary of code_text."""
         prompt = """
         Summarize the following code
         ```
         {code}
         ```
         """.format(code=code_text)
-        response = self.openai_service.Completion.create(
-            engine="davinci",
+        return dict(
             prompt=prompt,
+            engine="davinci",
             max_tokens=self.max_response_tokens,
             temperature=self.temperture,
             stop=["\n\n", "\n\t\n", "\n    \n"],
-            stream=stream)
+            stream=stream,
+            label="Leo.generate_summary")
+
+    def generate_summary(self, code_text, stream=True):
+        response = self.client.complete(**self.summary_request(code_text, stream))
         return response
 
     def generate_code(self, generate_prompt, stream=True):
-        response = self.openai_service.Completion.create(
-            engine="davinci",
-            prompt=generate_prompt,
+        response = self.client.complete(
+            generate_prompt,
+            "davinci",
             max_tokens=self.max_response_tokens,
             temperature=self.temperture,
             stop=["\n\n", "\n\t\n", "\n    \n"],
-            stream=stream)
+            stream=stream,
+            label="Leo.generate_code")
         return response
 
-    def read_stream(self, response_stream, stop_event=threading.Event(), should_print=True):
-        text = ""
-        for event in response_stream:
-            if not stop_event.is_set():
-                event_text = event["choices"][0]["text"]
-                text += event_text
-                if should_print:
-                    print(event_text, end="")
-            else:
-                return text
+    def read_stream(self, response_stream, stop_event=None, should_print=True, sinks=()):
+        # Printed in batches rather than per token; a StopSignal cancels the stream at once
+        sinks = list(sinks) + ([ConsoleSink()] if should_print else [])
+        return StreamWriter(sinks).pump(response_stream, stop_event)
+
+    async def aread_stream(self, response_stream, stop_event=None):
+        """Reads a streamed completion from the running event loop.
+
+        The backends' streams block between events, so each wait for the next event runs
+        in the loop's executor; no thread is held for the whole stream. Setting stop_event
+        wakes the loop at once.
+
+        Returns:
+        str: The text of the completion, or as much as was read before stop_event was set.
+        """
+        loop = asyncio.get_running_loop()
+        stopped = loop.create_future()
+
+        def on_stop():
+            loop.call_soon_threadsafe(lambda: stopped.done() or stopped.set_result(None))
+
+        if stop_event is not None:
+            stop_event.add_callback(on_stop)
+        events = iter(response_stream)
+        close = getattr(events, "close", None)
+        parts = []
+        pending = None
+        try:
+            while not stopped.done():
+                pending = loop.run_in_executor(None, next, events, None)
+                await asyncio.wait({pending, stopped}, return_when=asyncio.FIRST_COMPLETED)
+                if not pending.done():
+                    break
+                event = pending.result()
+                if event is None:
+                    break
+                parts.append(event["choices"][0]["text"])
+        finally:
+            if stop_event is not None:
+                stop_event.remove_callback(on_stop)
+            if close is not None:
+                if pending is not None and not pending.done():
+                    # A generator can't be closed while it runs; close it once this read returns
+                    pending.add_done_callback(lambda _: close())
+                else:
+                    # Drops the connection of a stream that was stopped
+                    close()
+        return "".join(parts)
+
+    async def summarize_sections(self, sections, stop_event):
+        """Summarizes sections with up to self.concurrency streams in flight, printing each summary as it finishes.
+
+        Parameters:
+        sections (list): Sections from WranglerService.get_sections().
+        stop_event (StopSignal): Cancels every stream, and the sections not started yet, when set.
+
+        Returns:
+        dict: The summary of each section that finished or was cut short, by name, in file order.
+        """
+        slots = asyncio.Semaphore(self.concurrency)
+        items = list(section_items(sections))
+
+        async def summarize(name, code):
+            async with slots:
+                if stop_event.is_set():
+                    return None
+                response = await self.client.acomplete(**self.summary_request(code))
+                if stop_event.is_set():
+                    response.close()
+                    return None
+                summary = await self.aread_stream(response, stop_event)
+                print(f"\n# {name}\n{summary.strip()}")
+                return summary
+
+        summaries = await asyncio.gather(*(summarize(name, code) for name, code in items))
+        if stop_event.is_set():
+            print(f"\nStopped: {sum(summary is not None for summary in summaries)} of {len(items)} sections summarized")
+        return {name: summary for (name, _), summary in zip(items, summaries) if summary is not None}
@@ -1,12 +1,16 @@
 # https://github.com/TobiahRex/nj2jp
 
-import threading
-import keyboard
+import os
+import sys
+import asyncio
 from wrangler_service import WranglerService
 from github_service import GithubService
 from prompt_service import PromptService
 from gpt_service import GptService
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from stream_sink import StopSignal  # noqa: E402
+
 
 class Leo:
     def __init__(self, *args, **kwargs):
@@ -27,16 +31,15 @@ class Leo:
     def run(self):
         repo_url = None
         target_file = None
-        action = None
         while True:
             if not repo_url:
                 repo_url = self.prompt_service.get_github_repo_menu()
             if not target_file:
-                repo_data = self.github_service.get_repo(repo_url)
+                # Browse a local mirror, fetched once per repository, instead of the API
+                repo_data = self.github_service.get_mirror(repo_url)
                 target_file = self.prompt_service.get_repo_file(repo_data)
             self.prompt_service.get_target_locations()
-            if not action:
-                action = self.prompt_service.get_action_menu()
+            action = self.prompt_service.get_action_menu()
             if action == "summarize":
                 self.summarize_file(target_file)
             elif action == "generate":
@@ -52,21 +55,19 @@ class Leo:
                 print('\nGoodbye...')
                 break
 
-    def summarize_file(self, repo_url, target_file):
+    def summarize_file(self, target_file):
         local_filename = self.github_service.download_file(target_file)
         sections = self.wrangler_service.get_sections(local_filename)
-        stop_event = threading.Event()
-        thread_1 = threading.Thread(
-            target=self.gpt_service.summarize_sections,
-            args=(sections, stop_event))
-        thread_2 = threading.Thread(
-            target=self.prompt_service.get_stop_event,
-            args=(stop_event))
-        self.gpt_service.summarize_sections(sections, stop_event)
-        thread_1.start()
-        thread_2.start()
-        thread_1.join()
-        thread_2.join()
+        return asyncio.run(self.summarize_sections(sections))
+
+    async def summarize_sections(self, sections):
+        # One event loop owns the stop input and the streams; nothing polls while they wait
+        stop_event = StopSignal()
+        stop_watching = self.prompt_service.watch_stop_input(stop_event)
+        try:
+            return await self.gpt_service.summarize_sections(sections, stop_event)
+        finally:
+            stop_watching()
 
 
 if __name__ == '__main__':
@@ -15,6 +15,8 @@
 
 import re
 import os
+import sys
+import asyncio
 import keyboard
 from github import Github
 from dotenv import load_dotenv
@@ -59,7 +61,7 @@ class PromptService:
             print(action_menu)
             action = input("Action: ")
             if action == "1":
-                return self.wrangler_service.summarize_file(self.target_file)
+                return "summarize"
             elif action == "2":
                 return self.wrangler_service.generate_completion(self.target_file)
             elif action == "3":
@@ -125,12 +127,35 @@ class PromptService:
                 current_path = next_content.path
             else:
                 print(f"You selected a file: {next_content.name}")
-                return next_content.name
-
-    def get_stop_event(self, stop_event):
-        while not stop_event.is_set():
-            if keyboard.is_pressed("s"):
-                stop_event.set()
+                return next_content.path
+
+    def watch_stop_input(self, stop_event):
+        """Sets stop_event when the user presses Enter, without polling.
+
+        Must be called from a running event loop, which reads the input. Where the loop
+        can't watch stdin (e.g. on Windows), pressing "s" sets it instead.
+
+        Returns:
+        function: Stops watching.
+        """
+        loop = asyncio.get_running_loop()
+        fd = sys.stdin.fileno()
+
+        def on_input():
+            if not sys.stdin.readline():
+                # End of input; nothing more can ask to stop
+                loop.remove_reader(fd)
+                return
+            stop_event.set()
+
+        try:
+            loop.add_reader(fd, on_input)
+        except (NotImplementedError, ValueError, OSError):
+            hotkey = keyboard.add_hotkey("s", stop_event.set)
+            print('Press "s" to stop')
+            return lambda: keyboard.remove_hotkey(hotkey)
+        print("Press Enter to stop")
+        return lambda: loop.remove_reader(fd)
 
     @ staticmethod
     def validate_repo_name(repo_url):
@@ -0,0 +1,100 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+# Import the module itself; the github_service package needs PyGithub
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "github_service"))
+from mirror import RepoMirror, blob_sha  # noqa: E402
+
+
+def git(cwd, *args):
+    return subprocess.run(
+        ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, capture_output=True, check=True).stdout
+
+
+class TestRepoMirror(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # A local bare repository stands in for GitHub
+        self.origin = os.path.join(self.tmp, "origin.git")
+        self.work = os.path.join(self.tmp, "work")
+        git(self.tmp, "init", "--quiet", "--bare", "--initial-branch=main", self.origin)
+        git(self.tmp, "init", "--quiet", "--initial-branch=main", self.work)
+        self.write("README.md", "# Example\n")
+        self.write("src/app.py", "print('hello')\n")
+        self.commit("Initial commit")
+        self.mirror = RepoMirror(self.origin, mirror_dir=os.path.join(self.tmp, "mirrors"))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, path, text):
+        full_path = os.path.join(self.work, path)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, 'w') as f:
+            f.write(text)
+
+    def commit(self, message):
+        git(self.work, "add", "-A")
+        git(self.work, "commit", "--quiet", "-m", message)
+        git(self.work, "push", "--quiet", self.origin, "main")
+
+    def test_clone_indexes_the_tree(self):
+        changes = self.mirror.refresh()
+        self.assertEqual(sorted(changes["added"]), ["README.md", "src/app.py"])
+        self.assertEqual(changes["modified"], [])
+        self.assertTrue(os.path.isdir(self.mirror.git_dir))
+        self.assertEqual(self.mirror.commit, git(self.work, "rev-parse", "HEAD").decode("ascii").strip())
+
+        entry = self.mirror.entries["src/app.py"]
+        self.assertEqual(entry.type, "file")
+        self.assertEqual(entry.sha, blob_sha(b"print('hello')\n"))
+        self.assertEqual(entry.size, len("print('hello')\n"))
+        self.assertEqual(self.mirror.read("src/app.py"), b"print('hello')\n")
+
+    def test_get_contents_lists_directories_first(self):
+        self.mirror.refresh()
+        root = self.mirror.get_contents("/")
+        self.assertEqual([(entry.name, entry.type) for entry in root], [("src", "dir"), ("README.md", "file")])
+        self.assertEqual([entry.path for entry in self.mirror.get_contents("src")], ["src/app.py"])
+        self.assertEqual(self.mirror.get_contents("README.md"), [])
+        with self.assertRaises(FileNotFoundError):
+            self.mirror.get_contents("missing")
+
+    def test_refresh_fetches_changes(self):
+        self.mirror.refresh()
+        self.write("src/app.py", "print('goodbye')\n")
+        self.write("src/util.py", "")
+        os.remove(os.path.join(self.work, "README.md"))
+        self.commit("Change files")
+
+        changes = self.mirror.refresh()
+        self.assertEqual(changes, {"added": ["src/util.py"], "modified": ["src/app.py"], "removed": ["README.md"]})
+        self.assertEqual(self.mirror.read("src/app.py"), b"print('goodbye')\n")
+        self.assertEqual(self.mirror.refresh(), {"added": [], "modified": [], "removed": []})
+
+    def test_index_is_reloaded(self):
+        self.mirror.refresh()
+        reopened = RepoMirror(self.origin, mirror_dir=os.path.join(self.tmp, "mirrors"))
+        self.assertEqual(reopened.commit, self.mirror.commit)
+        self.assertEqual(reopened.entries, self.mirror.entries)
+        self.assertEqual(reopened.refresh(), {"added": [], "modified": [], "removed": []})
+
+    def test_export_skips_unchanged_files(self):
+        self.mirror.refresh()
+        dest_dir = os.path.join(self.tmp, "checkout")
+        local_path = self.mirror.export("src/app.py", dest_dir)
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b"print('hello')\n")
+
+        os.utime(local_path, (0, 0))
+        self.assertEqual(self.mirror.export("src/app.py", dest_dir), local_path)
+        self.assertEqual(os.stat(local_path).st_mtime, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
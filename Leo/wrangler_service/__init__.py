@@ -1,54 +1,167 @@
+import os
+import sys
 import ast
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.dirname(
+    os.path.dirname(os.path.abspath(__file__)))))
+from summary_cache import SummaryCache  # noqa: E402
+
+# Bump when the shape of the extracted sections changes, so cached ones are not reused
+SECTIONS_VERSION = "2"
+SECTIONS_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer", "sections")
+FUNCTION_NODES = (ast.FunctionDef, ast.AsyncFunctionDef)
+SKIPPED_DIRS = {".git", "__pycache__", "node_modules", ".venv", "venv", ".tox"}
+
+
+def node_source(lines, node):
+    """Returns the source of a function or class node, from its first decorator to its end.
+
+    Parameters:
+    lines (list): The lines of the file, split once.
+    node (ast.AST): A function or class node.
+    """
+    start_line = min([node.lineno] + [dec.lineno for dec in node.decorator_list])
+    section = lines[start_line - 1:node.end_lineno]
+    # end_col_offset counts UTF-8 bytes; cut anything after the node on its last line
+    section[-1] = section[-1].encode("utf-8")[:node.end_col_offset].decode("utf-8", "ignore")
+    return "\n".join(section)
+
+
+def class_sections(lines, node):
+    """Returns [class name, member sections...]: a string per method and a list per nested class."""
+    class_section = [node.name]
+    for body_node in node.body:
+        if isinstance(body_node, FUNCTION_NODES):
+            class_section.append(node_source(lines, body_node))
+        elif isinstance(body_node, ast.ClassDef):
+            class_section.append(class_sections(lines, body_node))
+    return class_section
+
+
+def extract_sections(code):
+    """Splits Python source into its top-level functions and classes.
+
+    Parameters:
+    code (str): The source of a Python file.
+
+    Returns:
+    list: A string per function (including async ones) and a class_sections() list per class,
+        in file order, or None if the code doesn't parse.
+    """
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return None
+    lines = code.splitlines()
+    sections = []
+    for node in tree.body:
+        if isinstance(node, FUNCTION_NODES):
+            sections.append(node_source(lines, node))
+        elif isinstance(node, ast.ClassDef):
+            sections.append(class_sections(lines, node))
+    return sections
+
+
+def sections_key(code):
+    return hashlib.sha256((SECTIONS_VERSION + "\0" + code).encode("utf-8")).hexdigest()
 
 
 class WranglerService:
-    def __init__(self) -> None:
-        pass
+    def __init__(self, *args, **kwargs) -> None:
+        self.cache = kwargs.get('cache')
 
     @staticmethod
     def build():
-        return WranglerService()
+        return WranglerService(
+            cache=SummaryCache(cache_dir=os.getenv("SECTIONS_CACHE_DIR", SECTIONS_CACHE_DIR)))
+
+    def cached_sections(self, code):
+        if self.cache is None:
+            return None
+        sections = self.cache.get(sections_key(code))
+        return None if sections is None else json.loads(sections)
+
+    def cache_sections(self, code, sections):
+        if self.cache is not None:
+            self.cache.put(sections_key(code), json.dumps(sections))
 
     def get_sections(self, filename):
         with open(filename, 'r') as file:
             code = file.read()
-        tree = ast.parse(code)
-        sections = []
-        for node in tree.body:
-            if isinstance(node, ast.FunctionDef):
-                start_line = node.lineno
-                end_line = node.body[-1].lineno
-                decorators = [dec.lineno for dec in node.decorator_list]
-                for dec in decorators:
-                    if dec < start_line:
-                        start_line = dec
-                section = code.splitlines()[start_line - 1:end_line]
-                sections.append("\n".join(section))
-            elif isinstance(node, ast.ClassDef):
-                class_section = [node.name]
-                for body_node in node.body:
-                    if isinstance(body_node, ast.FunctionDef):
-                        start_line = body_node.lineno
-                        end_line = body_node.body[-1].lineno
-                        decorators = [
-                            dec.lineno for dec in body_node.decorator_list]
-                        for dec in decorators:
-                            if dec < start_line:
-                                start_line = dec
-                        method_section = code.splitlines()[
-                            start_line - 1:end_line]
-                        class_section.append("\n".join(method_section))
-                sections.append(class_section)
+        sections = self.cached_sections(code)
+        if sections is None:
+            sections = extract_sections(code)
+            if sections is None:
+                raise SyntaxError(f"Can't parse {filename}")
+            self.cache_sections(code, sections)
         return sections
 
+    def index_repository(self, root, workers=None):
+        """Extracts the sections of every Python file under root.
+
+        Files whose content was indexed before are read from the cache; the rest
+        are parsed across a process pool.
+
+        Parameters:
+        root (str): The repository directory.
+        workers (int, optional): The number of parsing processes. Defaults to the CPU count.
+
+        Returns:
+        dict: The sections of each file that parses, by path relative to root.
+        """
+        sources = {}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(name for name in dirnames if name not in SKIPPED_DIRS)
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        with open(path, 'r', encoding='utf-8') as file:
+                            sources[os.path.relpath(path, root)] = file.read()
+                    except (OSError, UnicodeDecodeError):
+                        continue
+
+        index = {}
+        misses = []
+        for path, code in sources.items():
+            sections = self.cached_sections(code)
+            if sections is None:
+                misses.append(path)
+            else:
+                index[path] = sections
+
+        workers = workers or os.cpu_count() or 1
+        codes = [sources[path] for path in misses]
+        if workers > 1 and len(misses) > workers:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = list(pool.map(extract_sections, codes,
+                                       chunksize=max(1, len(codes) // (workers * 4))))
+        else:
+            # Too few files to be worth starting processes for
+            parsed = [extract_sections(code) for code in codes]
+
+        for path, code, sections in zip(misses, codes, parsed):
+            if sections is None:
+                print(f"Skipping {path}: can't parse it")
+                continue
+            self.cache_sections(code, sections)
+            index[path] = sections
+        print(f"Indexed {len(sources)} files under {root}: {len(sources) - len(misses)} cached, {len(misses)} parsed")
+        return dict(sorted(index.items()))
+
     def parse_function(self, code, node):
-        start_line = node.lineno
-        end_line = node.body[-1].lineno
-        function_code = code.splitlines()[start_line - 1:end_line]
-        function_code = "\n".join(function_code)
-        return function_code
+        return node_source(code.splitlines(), node)
 
 
 if __name__ == '__main__':
     wrangler = WranglerService.build()
-    get_sections = wrangler.get_sections('test.py')
+    target = sys.argv[1] if len(sys.argv) > 1 else 'test.py'
+    if os.path.isdir(target):
+        index = wrangler.index_repository(target)
+        print(sum(len(sections) for sections in index.values()), "sections")
+    else:
+        get_sections = wrangler.get_sections(target)
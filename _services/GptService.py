@@ -1,7 +1,9 @@
+import os
+import sys
 
-import openai
-api_key = os.getenv("GPT_SECRET_KEY")
-openai.api_key = api_key
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from summary_cache import SummaryCache, cache_key  # noqa: E402
+from llm_client import llm_client  # noqa: E402
 
 
 class GPTService:
@@ -13,6 +15,8 @@ class GPTService:
         self.presence_penalty = kwargs.get('presence_penalty', 0)
         self.user = kwargs.get('user', '')
         self.doctype = kwargs.get('doctype', 'article')
+        self.cache = kwargs.get('cache')
+        self.client = kwargs.get('client')
 
     @staticmethod
     def build(*args, **kwargs):
@@ -20,16 +24,49 @@ class GPTService:
         max_tokens = kwargs.get('max_tokens', 3000)
         temperature = kwargs.get('temperature', 0)
         doctype = kwargs.get('doctype', 'article')
-        return GPTService(model_engine, max_tokens, doctype, temperature)
+        return GPTService(
+            model_engine=model_engine,
+            max_tokens=max_tokens,
+            doctype=doctype,
+            temperature=temperature,
+            # Only built when not passed in
+            cache=kwargs['cache'] if 'cache' in kwargs else SummaryCache.build(),
+            client=kwargs['client'] if 'client' in kwargs else llm_client())
 
     def set_doc_type(self, doctype):
         self.doctype = doctype
 
     def answer_question(self, prompt, max_tokens=100, temperature=0.5):
         # Generate completions
-        completions = openai.Completion.create(
-            engine=self.model_engine,
-            prompt=prompt,
+        completions = self.client.complete(
+            prompt,
+            self.model_engine,
             max_tokens=max_tokens or self.max_tokens,
             temperature=temperature or self.temperature,
+            label="GPTService.answer_question",
         )
+
+    def generate_summary(self, content, prompt_template, output_language_prompt=""):
+        """
+        Summarize content with prompt_template (which must contain a {content}
+        placeholder), reusing a cached summary of the same request if one exists.
+        """
+        key = cache_key(self.model_engine, prompt_template,
+                        content, output_language_prompt)
+        if self.cache:
+            summary = self.cache.get(key)
+            if summary is not None:
+                return summary
+        prompt = prompt_template.format(
+            content=content, output_language_prompt=output_language_prompt)
+        completions = self.client.complete(
+            prompt,
+            self.model_engine,
+            max_tokens=1000 if self.model_engine == 'text-davinci-003' else 500,
+            temperature=self.temperature,
+            label="GPTService.generate_summary",
+        )
+        summary = completions.choices[0].text
+        if self.cache:
+            self.cache.put(key, summary)
+        return summary
@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+
+"""
+Where summarize.py keeps the files it produces.
+
+Every artifact (extracted text, chunks, summaries, tree nodes, manifests and
+HTML pages) is addressed by the path it has always been written to. By
+default a FileStore writes each one to that path. With --store (or
+SUMMARY_STORE) set to a database file, a SQLiteStore keeps them all in a
+single SQLite file instead, so thousands of documents don't mean tens of
+thousands of small files. Each row holds the artifact's content, kind, sha256
+hash, token count (for chunks) and modification time. Rows are found by path,
+by path prefix (every artifact of a document starts with "<base_name>."), by
+kind or by hash, all through indexes. The store also records one row of
+metadata per summarization run.
+
+The exporter writes a store's artifacts back out in the usual file layout
+for tools that read the files:
+
+    python artifact_store.py summaries.db export [--prefix /tmp/paper] [--dest out/]
+    python artifact_store.py summaries.db list [--prefix /tmp/paper]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+
+# Artifact kinds, by path suffix; the first match wins
+ARTIFACT_KINDS = [
+    (".manifest.json", "manifest"),
+    (".overall_summary.txt", "overall_summary"),
+    (".section_summary.txt", "section_summary"),
+    (".summary.txt", "summary"),
+    (".summary.html", "html"),
+    (".full.txt", "text"),
+]
+
+
+def artifact_kind(path):
+    """Returns the kind of artifact stored at path, e.g. "summary" or "tree_node"."""
+    if ".tree" + os.sep in path:
+        return "tree_node"
+    for suffix, kind in ARTIFACT_KINDS:
+        if path.endswith(suffix):
+            return kind
+    return "other"
+
+
+class FileStore:
+    """Keeps every artifact in its own file, at its path."""
+
+    def read(self, path):
+        """Returns the artifact at path.
+
+        Raises:
+        FileNotFoundError: If there is none.
+        """
+        with open(path, 'r') as f:
+            return f.read()
+
+    def write(self, path, text, tokens=None):
+        # Write to a temporary file first, so readers never see half an artifact
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.{os.urandom(6).hex()}.tmp")
+        # Created 0666 less the umask, like open() (mkstemp() would make it 0600)
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @contextmanager
+    def writer(self, path):
+        """Opens path for writing a stream of text, e.g. text as it is extracted."""
+        with open(path, 'w') as f:
+            yield f
+
+    def delete(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def paths(self, prefix=""):
+        """Returns the paths of the files in prefix's directory whose path starts with prefix, in order."""
+        directory = os.path.dirname(prefix)
+        try:
+            names = os.listdir(directory or ".")
+        except FileNotFoundError:
+            return []
+        paths = (os.path.join(directory, name) for name in names)
+        return sorted(path for path in paths if path.startswith(prefix) and os.path.isfile(path))
+
+    def record_run(self, document, metadata):
+        # The document's manifest already records its runs' counts
+        pass
+
+
+class SQLiteStore:
+    def __init__(self, db_path, timeout=30.0):
+        """Open (creating if needed) the store in the SQLite file db_path.
+
+        Parameters:
+        db_path (str): The database file.
+        timeout (float, optional): How long to wait for another process's write, in seconds. Default is 30.
+        """
+        self.db_path = db_path
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pid = None
+        self.connection = None
+
+    def connect(self):
+        # One connection per process, shared by its threads under the lock; a
+        # connection inherited from a parent process must not be used
+        if self.pid != os.getpid():
+            self.connection = sqlite3.connect(
+                self.db_path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    path TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    hash TEXT NOT NULL,
+                    tokens INTEGER,
+                    updated REAL NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS artifacts_kind ON artifacts (kind);
+                CREATE INDEX IF NOT EXISTS artifacts_hash ON artifacts (hash);
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY,
+                    document TEXT NOT NULL,
+                    finished REAL NOT NULL,
+                    metadata TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS runs_document ON runs (document);
+            """)
+            self.pid = os.getpid()
+        return self.connection
+
+    def execute(self, sql, parameters=()):
+        with self.lock:
+            return self.connect().execute(sql, parameters).fetchall()
+
+    def read(self, path):
+        rows = self.execute("SELECT content FROM artifacts WHERE path = ?", (path,))
+        if not rows:
+            raise FileNotFoundError(f"No artifact {path} in {self.db_path}")
+        return rows[0][0]
+
+    def write(self, path, text, tokens=None):
+        self.execute(
+            "INSERT OR REPLACE INTO artifacts (path, kind, content, hash, tokens, updated) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, artifact_kind(path), text, hashlib.sha256(text.encode("utf-8")).hexdigest(),
+             tokens, time.time()))
+
+    @contextmanager
+    def writer(self, path):
+        buffer = io.StringIO()
+        yield buffer
+        self.write(path, buffer.getvalue())
+
+    def delete(self, path):
+        self.execute("DELETE FROM artifacts WHERE path = ?", (path,))
+
+    def record_run(self, document, metadata):
+        self.execute("INSERT INTO runs (document, finished, metadata) VALUES (?, ?, ?)",
+                     (document, time.time(), json.dumps(metadata)))
+
+    def paths(self, prefix=""):
+        """Returns the paths of the artifacts whose path starts with prefix, in order."""
+        # A range rather than LIKE, so the primary key index is used
+        return [row[0] for row in self.execute(
+            "SELECT path FROM artifacts WHERE path >= ? AND path < ? ORDER BY path",
+            (prefix, prefix + "\U0010ffff"))]
+
+    def paths_with_hash(self, text_hash, kind=None):
+        """Returns the paths of the artifacts with the given content hash (and kind)."""
+        if kind is None:
+            rows = self.execute("SELECT path FROM artifacts WHERE hash = ?", (text_hash,))
+        else:
+            rows = self.execute(
+                "SELECT path FROM artifacts WHERE hash = ? AND kind = ?", (text_hash, kind))
+        return [row[0] for row in rows]
+
+    def runs(self, document):
+        """Returns the metadata of the document's runs, oldest first."""
+        return [dict(json.loads(metadata), finished=finished) for finished, metadata in self.execute(
+            "SELECT finished, metadata FROM runs WHERE document = ? ORDER BY id", (document,))]
+
+
+def open_store(db_path=None):
+    """Returns a SQLiteStore on db_path, or a FileStore if db_path is empty."""
+    if db_path:
+        return SQLiteStore(db_path)
+    return FileStore()
+
+
+def export(store, prefix="", dest=None):
+    """Writes the store's artifacts out as files, in the layout a FileStore would have made.
+
+    Parameters:
+    store (SQLiteStore): The store to export.
+    prefix (str, optional): Only export artifacts whose path starts with prefix, e.g. a document's base name.
+    dest (str, optional): A directory to recreate the paths under. By default each artifact
+        is written to its own path.
+
+    Returns:
+    int: The number of files written.
+    """
+    files = FileStore()
+    paths = store.paths(prefix)
+    for path in paths:
+        target = path if dest is None else os.path.join(dest, path.lstrip(os.sep))
+        files.write(target, store.read(path))
+    return len(paths)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Export or list the artifacts in a summary store")
+    parser.add_argument("db", help="The SQLite store, as passed to summarize.py --store")
+    parser.add_argument("command", choices=["export", "list"])
+    parser.add_argument("--prefix", default="",
+                        help="Only artifacts whose path starts with this, e.g. a document's base name")
+    parser.add_argument("--dest", help="Recreate the paths under this directory instead of at the paths themselves")
+    args = parser.parse_args(argv)
+
+    store = SQLiteStore(args.db)
+    if args.command == "list":
+        for path in store.paths(args.prefix):
+            print(path)
+    else:
+        print(f"Exported {export(store, args.prefix, args.dest)} files")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,160 @@
+"""
+Batch corpus mode for summarize.py.
+
+collect_sources() turns a directory, a glob pattern or a list file (a JSON
+list of paths/URLs like files.txt, or one per line) into the documents to
+summarize. run_batch() extracts and chunks the documents in a process pool,
+since PDF layout analysis and tokenization are CPU-bound. Each document is
+summarized in a thread of the parent process as soon as it is ready, so all
+documents share the parent's tokenizer, summary cache and rate-limited
+API dispatcher.
+It then writes a run report with per-document timings and corpus throughput.
+"""
+
+import os
+import glob
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from profiler import profiler
+
+# Inputs summarize.py can read
+SOURCE_EXTENSIONS = (".pdf", ".html", ".htm", ".txt")
+# Files summarize.py writes next to its inputs, which must not be picked up as inputs
+OUTPUT_SUFFIXES = (".full.txt", "summary.txt", ".summary.html")
+
+
+def is_source_file(path):
+    name = os.path.basename(path).lower()
+    return name.endswith(SOURCE_EXTENSIONS) and not name.endswith(OUTPUT_SUFFIXES)
+
+
+def collect_sources(spec):
+    """Lists the documents of a corpus.
+
+    Parameters:
+    spec (str): A directory (its PDF, HTML and text files are used), a glob pattern,
+        or a file listing paths/URLs, either as a JSON list or one per line.
+
+    Returns:
+    list: The document paths and URLs, in order.
+    """
+    if os.path.isdir(spec):
+        return sorted(path for path in (os.path.join(spec, name) for name in os.listdir(spec))
+                      if os.path.isfile(path) and is_source_file(path))
+    if any(c in spec for c in "*?["):
+        return sorted(path for path in glob.glob(spec) if is_source_file(path))
+
+    with open(spec, 'r') as f:
+        contents = f.read()
+    try:
+        sources = json.loads(contents)
+    except json.JSONDecodeError:
+        sources = [line.strip() for line in contents.splitlines()]
+    return [source for source in sources if source and not source.startswith("#")]
+
+
+def timed_prepare(prepare, source, *args):
+    # Runs in a worker process; returns how long the document took to prepare
+    start = time.perf_counter()
+    result = prepare(source, *args)
+    return time.perf_counter() - start, result
+
+
+def run_batch(sources, prepare, prepare_args, summarize, workers=1, concurrency=8, report_path=None, metrics=None):
+    """Prepares documents in a process pool and summarizes each one as soon as it is ready.
+
+    Parameters:
+    sources (list): The document paths and URLs.
+    prepare (callable): A picklable module-level function called in a worker process as
+        prepare(source, *prepare_args); it returns (base_name, doctype, url, sections, stats).
+    prepare_args (tuple): The extra arguments of prepare.
+    summarize (callable): Called in the parent as summarize(base_name, doctype, url, sections).
+        If it returns a dict, its entries are added to the document's report.
+    workers (int, optional): The number of worker processes. Default is 1.
+    concurrency (int, optional): The number of documents summarized at once. Default is 8.
+    report_path (str, optional): Where to write the run report as JSON.
+    metrics (callable, optional): Returns API request metrics to include in the report.
+
+    Returns:
+    dict: The run report.
+    """
+    start = time.perf_counter()
+    documents = [{"source": source, "status": "pending"} for source in sources]
+
+    def summarize_timed(document, base_name, doctype, url, sections):
+        summarize_start = time.perf_counter()
+        counts = summarize(base_name, doctype, url, sections)
+        if isinstance(counts, dict):
+            document.update(counts)
+        document["summarize_seconds"] = round(
+            time.perf_counter() - summarize_start, 3)
+
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as processes, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as threads:
+        preparing = {processes.submit(timed_prepare, prepare, source, *prepare_args): document
+                     for source, document in zip(sources, documents)}
+        summarizing = {}
+        for future in as_completed(preparing):
+            document = preparing[future]
+            try:
+                prepare_seconds, (base_name, doctype, url, sections, stats) = future.result()
+            except Exception as e:
+                document.update(status="failed", error=f"prepare: {e!r}")
+                print(f"Failed to prepare {document['source']}: {e!r}")
+                continue
+            # Spans the worker recorded, if profiling
+            profiler.merge(stats.pop("profile_events", []))
+            document.update(
+                base_name=base_name,
+                tokens=stats["tokens"],
+                sections=stats["sections"],
+                chunks=stats["packed_requests"],
+                prepare_seconds=round(prepare_seconds, 3))
+            summarizing[threads.submit(
+                summarize_timed, document, base_name, doctype, url, sections)] = document
+
+        for future in as_completed(summarizing):
+            document = summarizing[future]
+            try:
+                future.result()
+            except Exception as e:
+                document.update(status="failed", error=f"summarize: {e!r}")
+                print(f"Failed to summarize {document['source']}: {e!r}")
+                continue
+            document.update(status="done", finished_seconds=round(
+                time.perf_counter() - start, 3))
+
+    wall_seconds = time.perf_counter() - start
+    done = [document for document in documents if document["status"] == "done"]
+    tokens = sum(document["tokens"] for document in done)
+    report = {
+        "documents": len(documents),
+        "succeeded": len(done),
+        "failed": len(documents) - len(done),
+        "workers": workers,
+        "concurrency": concurrency,
+        "wall_seconds": round(wall_seconds, 3),
+        "docs_per_minute": round(len(done) * 60 / wall_seconds, 2) if wall_seconds else 0.0,
+        "tokens": tokens,
+        "tokens_per_second": round(tokens / wall_seconds, 1) if wall_seconds else 0.0,
+        "per_document": documents,
+    }
+    if metrics is not None:
+        report["api"] = metrics()
+    print_report(report)
+    if report_path:
+        with open(report_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Run report written to {report_path}")
+    return report
+
+
+def print_report(report):
+    print(f"{'status':>7} {'tokens':>8} {'chunks':>7} {'prepare s':>10} {'summarize s':>12}  source")
+    for document in report["per_document"]:
+        print(f"{document['status']:>7} {document.get('tokens', 0):>8} {document.get('chunks', 0):>7} "
+              f"{document.get('prepare_seconds', 0):>10.2f} {document.get('summarize_seconds', 0):>12.2f}  "
+              f"{document['source']}")
+    print(f"{report['succeeded']}/{report['documents']} documents in {report['wall_seconds']:.1f} s: "
+          f"{report['docs_per_minute']} docs/min, {report['tokens_per_second']} tokens/s")
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+"""
+Throughput benchmark for the chunker on the examples/*.full.txt corpus.
+
+Every file is encoded once and chunked at several token budgets. The script
+reports encode and chunk throughput, how full the chunks are, and how many
+chunks went over budget (which should always be zero).
+
+Usage:
+    python benchmarks/bench_chunker.py
+    python benchmarks/bench_chunker.py --budgets 500 1000 3000 --repeat 10
+"""
+
+import os
+import sys
+import glob
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from transformers import GPT2TokenizerFast  # noqa: E402
+from tokenization import TokenizedText  # noqa: E402
+from chunker import chunk_tokens  # noqa: E402
+
+
+def best_time(fn, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--pattern", default=os.path.join(
+        ROOT, "examples", "*.full.txt"))
+    parser.add_argument("--budgets", type=int, nargs="+",
+                        default=[500, 1000, 3000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--verify", action="store_true",
+                        help="Re-encode every chunk and report token count drift")
+    args = parser.parse_args(argv)
+
+    enc = GPT2TokenizerFast.from_pretrained("gpt2")
+    paths = sorted(glob.glob(args.pattern))
+    texts = []
+    for path in paths:
+        with open(path, "r") as f:
+            texts.append(f.read())
+    n_chars = sum(len(text) for text in texts)
+    print(f"Corpus: {len(paths)} files, {n_chars} characters")
+
+    encode_time, documents = best_time(
+        lambda: [TokenizedText.from_text(enc, text) for text in texts], args.repeat)
+    n_tokens = sum(doc.token_count for doc in documents)
+    print(f"Encode: {n_tokens} tokens in {encode_time * 1000:.1f} ms "
+          f"({n_tokens / encode_time:,.0f} tokens/s, {n_chars / encode_time / 1e6:.2f} MB/s)")
+
+    print(f"\n{'budget':>7} {'chunks':>7} {'ms':>8} {'tokens/s':>12} "
+          f"{'min fill':>9} {'mean fill':>10} {'over':>5} {'drift':>6}")
+    for budget in args.budgets:
+        chunk_time, chunked = best_time(
+            lambda: [chunk_tokens(doc, budget) for doc in documents], args.repeat)
+        chunks = [chunk for doc_chunks in chunked for chunk in doc_chunks]
+        # Only chunks that had to be cut count towards fill; the last chunk of a
+        # document is whatever is left over
+        cut_chunks = [chunk for doc_chunks in chunked for chunk in doc_chunks[:-1]]
+        fills = [chunk.token_count / budget for chunk in cut_chunks] or [1.0]
+        over = sum(1 for chunk in chunks if chunk.token_count > budget)
+        drift = "-"
+        if args.verify:
+            drift = sum(abs(len(enc.encode(chunk)) - chunk.token_count)
+                        for chunk in chunks)
+        print(f"{budget:>7} {len(chunks):>7} {chunk_time * 1000:>8.1f} "
+              f"{n_tokens / chunk_time:>12,.0f} {min(fills):>9.2f} "
+              f"{sum(fills) / len(fills):>10.2f} {over:>5} {drift:>6}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
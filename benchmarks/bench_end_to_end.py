@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+
+"""
+End-to-end benchmark of summarize.py against a fake completion backend.
+
+Each input is copied to a scratch directory and summarized from scratch
+(--no-cache) in a fresh process, with the in-process fake backend
+(LLM_BACKEND=fake) or through HTTP against benchmarks/stub_server.py. The
+script reports wall time, completion calls (including simulated 429s),
+prompt and completion tokens, and the process's peak memory.
+
+With --compress, each input is summarized twice, without and with
+extractive pre-compression, to compare their prompt tokens and wall time.
+
+Usage:
+    python benchmarks/bench_end_to_end.py
+    python benchmarks/bench_end_to_end.py --backend server --latency lognormal:-1,0.5 --error-rate 0.05
+    python benchmarks/bench_end_to_end.py --compress [--compress-ratio paper=0.6,article=0.4]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_server import serve, add_backend_arguments, backend_from_args  # noqa: E402
+
+DEFAULT_INPUTS = [
+    os.path.join(ROOT, "examples", "ai-impact.html"),
+    os.path.join(ROOT, "examples", "NEJM-OpenSourceAID-DanaMLewis-AuthorCopy.pdf"),
+]
+
+
+def backend_env(args, stats_path):
+    return {
+        "LLM_BACKEND": "fake",
+        "FAKE_LLM_LATENCY": args.latency,
+        "FAKE_LLM_TOKEN_SECONDS": str(args.token_seconds),
+        "FAKE_LLM_CHUNK_TOKENS": str(args.chunk_tokens),
+        "FAKE_LLM_ERROR_RATE": str(args.error_rate),
+        "FAKE_LLM_RETRY_AFTER": str(args.retry_after),
+        "FAKE_LLM_OUTPUT_WORDS": str(args.output_words),
+        "FAKE_LLM_SEED": str(args.seed),
+        "FAKE_LLM_STATS": stats_path,
+    }
+
+
+def run_summarize(source, workdir, env, concurrency, extra_args=()):
+    """Runs summarize.py on source in workdir.
+
+    Returns:
+    tuple: (wall seconds, peak resident memory in MB).
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "summarize.py"), os.path.basename(source),
+         "--no-cache", "--concurrency", str(concurrency), *extra_args],
+        cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    stderr = process.stderr.read().decode("utf-8", "replace")
+    process.stderr.close()
+    if status != 0:
+        raise RuntimeError(f"summarize.py failed on {source}:\n{stderr}")
+    # ru_maxrss is in kilobytes on Linux
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("inputs", nargs="*", default=DEFAULT_INPUTS)
+    parser.add_argument("--backend", choices=["fake", "server"], default="fake",
+                        help="In-process fake, or the HTTP stub server via the openai package (default: fake)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--compress", action="store_true",
+                        help="Run each input without and with extractive pre-compression")
+    parser.add_argument("--compress-ratio", default="",
+                        help="Passed to summarize.py --compress-ratio (default: its per-doctype defaults)")
+    parser.add_argument("--compress-method", default="textrank", choices=["textrank", "tfidf"])
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = None
+    if args.backend == "server":
+        server = serve(backend_from_args(args))
+
+    modes = [("", [])]
+    if args.compress:
+        modes.append((" [compressed]", ["--compress", "--compress-ratio", args.compress_ratio,
+                                        "--compress-method", args.compress_method]))
+
+    print(f"{'input':<48} {'wall s':>8} {'calls':>6} {'429s':>5} {'prompt tok':>11} "
+          f"{'compl tok':>10} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for source, (mode, extra_args) in ((source, mode) for source in args.inputs for mode in modes):
+            workdir = tempfile.mkdtemp(dir=tmp)
+            shutil.copy(source, workdir)
+            stats_path = os.path.join(tmp, "stats.json")
+            env = dict(os.environ)
+            if server is None:
+                env.update(backend_env(args, stats_path))
+            else:
+                env.update(LLM_BACKEND="openai", GPT_SECRET_KEY="stub",
+                           OPENAI_API_BASE=f"http://127.0.0.1:{server.server_port}/v1")
+                before = server.backend.stats()
+
+            wall, peak_mb = run_summarize(source, workdir, env, args.concurrency, extra_args)
+
+            if server is None:
+                with open(stats_path) as f:
+                    stats = json.load(f)
+            else:
+                after = server.backend.stats()
+                stats = {key: after[key] - before[key] for key in after}
+            name = os.path.basename(source)[:48 - len(mode)] + mode
+            print(f"{name:<48} {wall:>8.2f} {stats['calls']:>6} "
+                  f"{stats['errors']:>5} {stats['prompt_tokens']:>11} "
+                  f"{stats['completion_tokens']:>10} {peak_mb:>8.1f}")
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+
+"""
+Extraction-throughput benchmark for the page-level PDF extractor.
+
+For each worker count, the PDF is extracted page by page and the script
+reports the time to the first page (when sectioning and summarizing can
+start), the total time, and pages and characters per second.
+
+Usage:
+    python benchmarks/bench_pdf_extract.py
+    python benchmarks/bench_pdf_extract.py path/to/file.pdf --workers 1 2 4
+"""
+
+import os
+import sys
+import time
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from pdf_extract import iter_pdf_pages, count_pages  # noqa: E402
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("pdf", nargs="?", default=os.path.join(
+        ROOT, "examples", "NEJM-OpenSourceAID-DanaMLewis-AuthorCopy.pdf"))
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, os.cpu_count() or 1}))
+    parser.add_argument("--pages-per-task", type=int, default=2)
+    args = parser.parse_args(argv)
+
+    print(f"{os.path.basename(args.pdf)}: {count_pages(args.pdf)} pages, "
+          f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>8} {'first page s':>13} {'total s':>9} "
+          f"{'pages/s':>9} {'chars/s':>10}")
+    for workers in args.workers:
+        start = time.perf_counter()
+        first_page = None
+        n_pages = 0
+        n_chars = 0
+        for page in iter_pdf_pages(args.pdf, workers, args.pages_per_task):
+            if first_page is None:
+                first_page = time.perf_counter() - start
+            n_pages += 1
+            n_chars += len(page)
+        total = time.perf_counter() - start
+        print(f"{workers:>8} {first_page:>13.2f} {total:>9.2f} "
+              f"{n_pages / total:>9.2f} {n_chars / total:>10,.0f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""
+Startup benchmark for summarize.py: time to the first API request.
+
+For each input type, summarize.py is started in a fresh interpreter and
+timed from process launch until it makes its first completion request, at
+which point the process exits without calling the API. Each input is run
+without a tokenizer snapshot (cold: transformers is imported and the
+snapshot written) and with one (warm). The script also reports whether
+transformers and pdfminer were imported by then.
+
+Usage:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 5 --inputs txt html
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+INPUTS = {
+    "txt": os.path.join(ROOT, "examples", "ai-impact.full.txt"),
+    "html": os.path.join(ROOT, "examples", "ai-impact.html"),
+    "pdf": os.path.join(ROOT, "examples", "NEJM-OpenSourceAID-DanaMLewis-AuthorCopy.pdf"),
+}
+
+# Run summarize.py, exiting at the first openai.Completion.create call. The
+# patch is applied when summarize.py itself imports openai, so the import cost
+# is measured where it really happens.
+PROBE = r'''
+import importlib.abc, importlib.util, json, os, runpy, sys, threading
+
+first = threading.Lock()
+
+class OpenAIProbe(importlib.abc.MetaPathFinder):
+    def find_spec(self, name, path, target=None):
+        if name != "openai":
+            return None
+        sys.meta_path.remove(self)
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def patched(module):
+            exec_module(module)
+
+            def first_request(*args, **kwargs):
+                # Requests are sent from several threads; report only the first
+                first.acquire()
+                print("PROBE " + json.dumps({
+                    "transformers": "transformers" in sys.modules,
+                    "pdfminer": "pdfminer" in sys.modules}), flush=True)
+                os._exit(0)
+
+            module.Completion.create = first_request
+        spec.loader.exec_module = patched
+        return spec
+
+sys.meta_path.insert(0, OpenAIProbe())
+script = sys.argv[1]
+sys.path.insert(0, os.path.dirname(script))
+sys.argv = sys.argv[1:]
+runpy.run_path(script, run_name="__main__")
+'''
+
+
+def time_first_request(source, workdir, snapshot_path):
+    env = dict(os.environ, SUMMARY_TOKENIZER=snapshot_path, PDF_WORKERS="1")
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, os.path.join(ROOT, "summarize.py"),
+         os.path.basename(source), "--no-cache"],
+        cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    probes = [line for line in result.stdout.splitlines()
+              if line.startswith("PROBE ")]
+    if not probes:
+        raise RuntimeError(
+            f"{source} made no request:\n{result.stdout}{result.stderr}")
+    return elapsed, json.loads(probes[-1][len("PROBE "):])
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--inputs", nargs="+", choices=sorted(INPUTS),
+                        default=["txt", "html", "pdf"])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    print(f"interpreter startup: {time.perf_counter() - start:.2f} s")
+    print(f"{'input':>6} {'tokenizer':>10} {'median s':>9} {'min s':>7} "
+          f"{'transformers':>13} {'pdfminer':>9}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_path = os.path.join(tmp, "gpt2.json")
+        for name in args.inputs:
+            workdir = os.path.join(tmp, name)
+            os.makedirs(workdir)
+            source = shutil.copy(INPUTS[name], workdir)
+            if name == "txt":
+                # A .txt input is read as is, not as a previous run's output
+                source = shutil.move(source, os.path.join(workdir, "input.txt"))
+
+            for mode in ("cold", "warm"):
+                times = []
+                for _ in range(args.repeat):
+                    if mode == "cold" and os.path.exists(snapshot_path):
+                        os.remove(snapshot_path)
+                    elapsed, imported = time_first_request(
+                        source, workdir, snapshot_path)
+                    times.append(elapsed)
+                print(f"{name:>6} {mode:>10} {statistics.median(times):>9.2f} "
+                      f"{min(times):>7.2f} {str(imported['transformers']):>13} "
+                      f"{str(imported['pdfminer']):>9}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+"""
+A local stand-in for the OpenAI Completions API.
+
+It serves POST .../completions (including /v1/engines/<engine>/completions,
+which openai 0.x uses) from a FakeCompletionBackend. Responses are
+deterministic, plain or streamed as server-sent events, and simulated rate
+limits come back as HTTP 429 with a Retry-After header. Point the openai
+package at it with OPENAI_API_BASE; the key can be anything.
+
+Usage:
+    python benchmarks/stub_server.py --port 8808 --latency lognormal:-1,0.5
+    OPENAI_API_BASE=http://127.0.0.1:8808/v1 GPT_SECRET_KEY=stub python summarize.py examples/ai-impact.html
+"""
+
+import os
+import sys
+import json
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from llm_backend import FakeCompletionBackend, FakeRateLimitError  # noqa: E402
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/completions"):
+            self.send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        try:
+            request = json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            self.send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+        # openai 0.x puts the engine in the path rather than the body
+        if "/engines/" in self.path:
+            request.setdefault("engine", self.path.split("/engines/")[1].split("/")[0])
+
+        try:
+            response = self.server.backend.create(**request)
+        except FakeRateLimitError as e:
+            self.send_json(429, {"error": {"message": str(e), "type": "requests", "code": None}},
+                           {"Retry-After": e.headers["retry-after"]})
+            return
+
+        if not request.get("stream"):
+            self.send_json(200, response)
+            return
+
+        # Stream server-sent events until the connection is closed
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for event in response:
+                self.wfile.write(b"data: " + json.dumps(event).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading, e.g. a cancelled stream
+            pass
+
+
+def serve(backend, host="127.0.0.1", port=0):
+    """Starts the stub server in a background thread.
+
+    Parameters:
+    backend (FakeCompletionBackend): Answers the requests.
+    host (str, optional): The address to listen on. Default is "127.0.0.1".
+    port (int, optional): The port to listen on; 0 picks a free one. Default is 0.
+
+    Returns:
+    ThreadingHTTPServer: The running server; its API base is http://host:server.server_port/v1.
+    """
+    server = ThreadingHTTPServer((host, port), CompletionHandler)
+    server.daemon_threads = True
+    server.backend = backend
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--latency", default="constant:0",
+                        help="Time-to-first-token distribution, e.g. constant:0.5, uniform:0.2,1, lognormal:-1,0.5")
+    parser.add_argument("--token-seconds", type=float, default=0.0,
+                        help="Generation time per completion token (default: 0)")
+    parser.add_argument("--chunk-tokens", type=int, default=4,
+                        help="Tokens per streamed chunk (default: 4)")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests answered with a 429 (default: 0)")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After of the simulated 429s, in seconds (default: 1)")
+    parser.add_argument("--output-words", type=int, default=60,
+                        help="Words per completion (default: 60)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def backend_from_args(args):
+    return FakeCompletionBackend(
+        latency=args.latency, token_seconds=args.token_seconds, chunk_tokens=args.chunk_tokens,
+        error_rate=args.error_rate, retry_after=args.retry_after,
+        output_words=args.output_words, seed=args.seed)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8808)
+    add_backend_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = serve(backend_from_args(args), args.host, args.port)
+    print(f"Serving completions at http://{args.host}:{server.server_port}/v1")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(server.backend.stats())
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,117 @@
+"""
+Token-accurate, boundary-aware chunking of TokenizedText.
+
+Chunks are packed up to an exact token budget. Each cut is placed at the
+last paragraph break ("\n\n") that keeps the chunk within budget, falling
+back to the last sentence end, then the last word boundary, and only then
+to a hard cut at the budget. Boundaries are found in the text and mapped to
+token positions through the offset mapping, so nothing is re-encoded and no
+chunk ever exceeds the budget.
+"""
+
+import re
+
+from tokenization import TokenizedText
+
+# The end of a sentence: terminal punctuation and optional closing quotes or
+# brackets, followed by whitespace
+SENTENCE_END = re.compile(r'[.!?]["\'”’)\]]*(?=\s)')
+# The end of a word: the position right before whitespace
+WORD_END = re.compile(r'\S(?=\s)')
+
+
+def last_paragraph_end(text, start, end):
+    pos = text.rfind('\n\n', start, end)
+    return pos + 2 if pos != -1 else None
+
+
+def last_match_end(pattern):
+    def find(text, start, end):
+        cut = None
+        for match in pattern.finditer(text, start, end):
+            cut = match.end()
+        return cut
+    return find
+
+
+# Boundary finders, most preferred first
+BOUNDARIES = (
+    last_paragraph_end,
+    last_match_end(SENTENCE_END),
+    last_match_end(WORD_END),
+)
+
+
+def find_boundary(text, start, end, min_end):
+    """Finds the best place to cut text between start and end.
+
+    Parameters:
+    text (str): The text being chunked.
+    start (int): The character position where the current chunk starts.
+    end (int): The furthest character position the chunk may extend to.
+    min_end (int): The earliest cut that fills enough of the chunk. A weaker kind
+        of boundary past min_end is preferred over a stronger one before it.
+
+    Returns:
+    int: The character position to cut at, or end if there is no boundary at all.
+    """
+    fallback = None
+    for find in BOUNDARIES:
+        cut = find(text, start, end)
+        if cut is None or cut <= start:
+            continue
+        if cut >= min_end:
+            return cut
+        if fallback is None or cut > fallback:
+            fallback = cut
+    return fallback if fallback is not None else end
+
+
+def chunk_tokens(text, max_tokens, min_fill=0.5):
+    """Splits a TokenizedText into chunks of at most max_tokens tokens.
+
+    Parameters:
+    text (TokenizedText): The text to split.
+    max_tokens (int): The token budget of each chunk.
+    min_fill (float, optional): A boundary is preferred over a weaker kind of
+        boundary only if it fills at least this fraction of the budget. Default is 0.5.
+
+    Returns:
+    list: A list of TokenizedText chunks that together cover the whole text.
+    """
+    if max_tokens < 1:
+        raise ValueError("max_tokens must be at least 1")
+    if text.token_count <= max_tokens:
+        return [text]
+
+    chunks = []
+    start = 0
+    n_tokens = text.token_count
+    while start < n_tokens:
+        limit = start + max_tokens
+        if limit >= n_tokens:
+            end = n_tokens
+        else:
+            start_char = text.token_to_char(start)
+            limit_char = text.token_to_char(limit)
+            min_char = text.token_to_char(
+                start + max(1, int(max_tokens * min_fill)))
+            cut = find_boundary(text, start_char, limit_char, min_char)
+            # Keep only the tokens that end at or before the cut
+            end = text.char_to_token(cut)
+            if end > start and text.offsets[end - 1][1] > cut:
+                end -= 1
+            if end <= start:
+                # No usable boundary; cut at the budget
+                end = limit
+        chunks.append(text.slice_tokens(start, end))
+        start = end
+
+    return chunks
+
+
+def chunk_text(text, enc, max_tokens, min_fill=0.5):
+    """Encodes text once, unless it is already a TokenizedText, and chunks it."""
+    if not isinstance(text, TokenizedText):
+        text = TokenizedText.from_text(enc, text)
+    return chunk_tokens(text, max_tokens, min_fill)
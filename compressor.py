@@ -0,0 +1,183 @@
+"""
+Extractive pre-compression of chunks before they are summarized.
+
+Most of a chunk is usually low-information: repetition, hedging, asides,
+boilerplate. A Compressor shrinks each chunk to a share of its tokens before
+it goes into the prompt, by keeping its highest-scoring sentences in their
+original order. The chunk's first sentence (usually its header or topic
+sentence) is always kept.
+
+Sentences are scored with TF-IDF vectors, computed with NumPy:
+
+- "textrank" ranks sentences with PageRank over their cosine similarities,
+  so sentences that share vocabulary with many others score highest.
+- "tfidf" scores each sentence by its cosine similarity to the chunk's
+  centroid, which is cheaper.
+
+Papers are denser than web articles, so the share kept is set per document
+type (the doctype summarize.py infers from the source).
+"""
+
+import re
+import threading
+
+from chunker import SENTENCE_END
+from tokenization import as_tokenized
+
+WORD = re.compile(r"\w+")
+# The share of each chunk's tokens kept, by doctype; "" is any other document
+DEFAULT_RATIOS = {"paper": 0.6, "article": 0.4, "": 0.5}
+
+
+def parse_ratios(spec):
+    """Parses "0.5" (every doctype) or "paper=0.7,article=0.3" into ratios by doctype."""
+    ratios = dict(DEFAULT_RATIOS)
+    for part in filter(None, (part.strip() for part in spec.split(","))):
+        doctype, _, value = part.rpartition("=")
+        if doctype:
+            ratios[doctype] = float(value)
+        else:
+            ratios = {doctype: float(value) for doctype in ratios}
+    for doctype, ratio in ratios.items():
+        if not 0 < ratio <= 1:
+            raise ValueError(f"Compression ratio for {doctype or 'other documents'} must be in (0, 1], not {ratio}")
+    return ratios
+
+
+def split_sentences(text):
+    """Returns the (start, end) character spans of text's sentences, in order."""
+    cuts = {match.end() for match in SENTENCE_END.finditer(text)}
+    cuts.update(match.start() for match in re.finditer(r"\n\s*\n", text))
+    spans = []
+    start = 0
+    for cut in sorted(cuts) + [len(text)]:
+        segment = text[start:cut]
+        if segment.strip():
+            # Trim the whitespace between sentences
+            lead = len(segment) - len(segment.lstrip())
+            spans.append((start + lead, start + len(segment.rstrip())))
+        start = cut
+    return spans
+
+
+def sentence_scores(sentences, method="textrank", damping=0.85, iterations=50):
+    """Scores sentences by how central they are to the text.
+
+    Parameters:
+    sentences (list): The sentences, as strings.
+    method (str, optional): "textrank" or "tfidf". Default is "textrank".
+    damping (float, optional): TextRank's damping factor. Default is 0.85.
+    iterations (int, optional): The most TextRank power iterations. Default is 50.
+
+    Returns:
+    numpy.ndarray: One score per sentence; higher is more important.
+    """
+    import numpy as np
+
+    words = [WORD.findall(sentence.lower()) for sentence in sentences]
+    vocabulary = {}
+    ids = [[vocabulary.setdefault(word, len(vocabulary)) for word in sentence] for sentence in words]
+    count = len(sentences)
+    tf = np.zeros((count, max(1, len(vocabulary))))
+    for row, sentence_ids in enumerate(ids):
+        np.add.at(tf[row], sentence_ids, 1)
+    tf = np.log1p(tf)
+    idf = np.log((1 + count) / (1 + (tf > 0).sum(axis=0))) + 1
+    vectors = tf * idf
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+
+    if method == "tfidf":
+        return vectors @ vectors.mean(axis=0)
+    if method != "textrank":
+        raise ValueError(f"Unknown sentence scoring method {method!r}")
+
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, 0)
+    out_weight = similarity.sum(axis=1, keepdims=True)
+    # A sentence sharing no words with the others links to all of them equally
+    transition = np.where(out_weight > 0, similarity / np.where(out_weight == 0, 1, out_weight), 1 / count)
+    scores = np.full(count, 1 / count)
+    for _ in range(iterations):
+        updated = (1 - damping) / count + damping * (transition.T @ scores)
+        converged = np.abs(updated - scores).sum() < 1e-6
+        scores = updated
+        if converged:
+            break
+    return scores
+
+
+class Compressor:
+    def __init__(self, ratios=None, method="textrank", min_sentences=4):
+        """Create a compressor.
+
+        Parameters:
+        ratios (dict, optional): The share of each chunk's tokens to keep, by doctype, with ""
+            for any other document. Defaults to DEFAULT_RATIOS.
+        method (str, optional): How sentences are scored, "textrank" or "tfidf". Default is "textrank".
+        min_sentences (int, optional): Chunks with fewer sentences are left as they are. Default is 4.
+        """
+        self.ratios = dict(ratios or DEFAULT_RATIOS)
+        self.method = method
+        self.min_sentences = min_sentences
+        self.lock = threading.Lock()
+        self.counters = {"chunks": 0, "compressed": 0, "tokens_in": 0, "tokens_out": 0}
+
+    def ratio(self, doctype):
+        return self.ratios.get(doctype, self.ratios.get("", 1.0))
+
+    def settings(self):
+        """Returns what a compressed chunk depends on; summaries made with other settings aren't reused."""
+        return {"ratios": self.ratios, "method": self.method, "min_sentences": self.min_sentences}
+
+    def compress(self, text, enc, doctype=""):
+        """Shrinks text to its highest-scoring sentences, at most ratio(doctype) of its tokens.
+
+        Parameters:
+        text (str): The chunk.
+        enc (object): The tokenizer, used if text is not already a TokenizedText.
+        doctype (str, optional): The kind of document the chunk is from, e.g. "paper" or "article".
+
+        Returns:
+        str: The kept sentences in their original order, or text itself if it is too short to compress.
+        """
+        text = as_tokenized(text, enc)
+        ratio = self.ratio(doctype)
+        spans = split_sentences(text)
+        if ratio >= 1 or len(spans) < self.min_sentences:
+            self.count(text.token_count, text.token_count, False)
+            return text
+
+        tokens = [text.char_to_token(end) - text.char_to_token(start) for start, end in spans]
+        scores = sentence_scores([str.__getitem__(text, slice(start, end)) for start, end in spans], self.method)
+        budget = ratio * text.token_count
+        keep = {0}
+        used = tokens[0]
+        for index in sorted(range(1, len(spans)), key=lambda index: -scores[index]):
+            if used + tokens[index] <= budget:
+                keep.add(index)
+                used += tokens[index]
+
+        parts = []
+        previous_end = None
+        for index in sorted(keep):
+            start, end = spans[index]
+            if previous_end is not None:
+                # Keep paragraph breaks between the kept sentences
+                parts.append("\n\n" if "\n\n" in text[previous_end:start] else " ")
+            parts.append(text[start:end])
+            previous_end = end
+        compressed = "".join(parts)
+        self.count(text.token_count, used, True)
+        return compressed
+
+    def count(self, tokens_in, tokens_out, compressed):
+        with self.lock:
+            self.counters["chunks"] += 1
+            self.counters["compressed"] += compressed
+            self.counters["tokens_in"] += tokens_in
+            self.counters["tokens_out"] += tokens_out
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
@@ -0,0 +1,459 @@
+"""
+A long-running summarizer that jobs are submitted to over HTTP.
+
+Starting summarize.py costs Python startup, imports and the tokenizer load
+on every document. A daemon (python summarize.py --daemon) pays that once:
+the tokenizer, the pooled HTTP sessions, the rate-limited dispatcher and the
+caches stay loaded between jobs.
+
+Jobs are a file path or URL (as summarize.py takes them) or raw text, with an
+optional output language and priority. They wait in a priority queue,
+higher priorities first and then in submission order, and --jobs of them are
+summarized at once. Each job's progress is kept as a list of events
+(queued, started, one per chunk and section, overall, then done, failed or
+cancelled), and clients can stream them as they happen.
+
+Jobs only read files under the daemon's root directories (--daemon-root),
+and each job's outputs are written to its own directory under JOBS_DIR, not
+next to its source. Every request but GET /health must carry the daemon's
+token as "Authorization: Bearer <token>"; it is $SUMMARY_DAEMON_TOKEN, or
+one generated at startup and saved, readable only by its owner, at
+TOKEN_PATH, where --submit finds it. POST bodies must be application/json,
+so a web page can't submit jobs with a cross-site form post.
+
+The API, on 127.0.0.1 by default:
+
+    POST   /jobs              {"source": path or URL} or {"text": ..., "name": ...},
+                              plus "language", "priority", "incremental"; returns the job
+    GET    /jobs              every job
+    GET    /jobs/<id>         one job
+    GET    /jobs/<id>/events  its events as JSON lines, streamed until it finishes
+    DELETE /jobs/<id>         cancels a job that hasn't started
+    GET    /health            queue and worker counts
+
+Finished jobs are remembered for an hour, and at most 1000 of them.
+
+python summarize.py --submit <source> submits a job to a running daemon and
+prints its events as they arrive.
+"""
+
+import os
+import re
+import sys
+import hmac
+import json
+import time
+import queue
+import secrets
+import itertools
+import threading
+from urllib.parse import urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+JOBS_DIR = os.path.join(os.path.expanduser("~"), ".cache", "gpt-summarizer", "jobs")
+TOKEN_PATH = os.path.join(os.path.expanduser("~"), ".cache", "gpt-summarizer", "daemon.token")
+FINAL_STATUSES = {"done", "failed", "cancelled"}
+JOB_OPTIONS = ("language", "incremental")
+
+
+def load_token(create=False):
+    """Returns the daemon's token: $SUMMARY_DAEMON_TOKEN, or the one saved at TOKEN_PATH.
+
+    With create, a new token is generated and saved if there is none; otherwise None is returned.
+    """
+    token = os.getenv("SUMMARY_DAEMON_TOKEN")
+    if token:
+        return token
+    try:
+        with open(TOKEN_PATH, 'r') as f:
+            token = f.read().strip()
+    except OSError:
+        token = None
+    if token or not create:
+        return token
+    os.makedirs(os.path.dirname(TOKEN_PATH), exist_ok=True)
+    token = secrets.token_urlsafe(32)
+    fd = os.open(TOKEN_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+class Job:
+    def __init__(self, job_id, source, options, priority=0, output_dir=None):
+        """Create a queued job.
+
+        Parameters:
+        job_id (str): The job's id.
+        source (str): The file path or URL to summarize.
+        options (dict): Per-job settings passed to the runner, e.g. {"language": "French"}.
+        priority (int, optional): Higher priorities run first. Default is 0.
+        output_dir (str, optional): Where the job's outputs are written.
+        """
+        self.id = job_id
+        self.source = source
+        self.output_dir = output_dir
+        self.options = options
+        self.priority = priority
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.condition = threading.Condition()
+
+    def emit(self, event, status=None):
+        """Records a progress event, and optionally a new status, waking anyone streaming them."""
+        with self.condition:
+            if status is not None:
+                self.status = status
+            self.events.append(dict(event, job=self.id, ts=round(time.time(), 3)))
+            self.condition.notify_all()
+
+    def events_after(self, index, timeout=None):
+        """Waits until there are events past index or the job is finished.
+
+        Returns:
+        tuple: (the new events, whether the job is finished).
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: len(self.events) > index or self.status in FINAL_STATUSES, timeout)
+            return self.events[index:], self.status in FINAL_STATUSES
+
+    def describe(self):
+        with self.condition:
+            return {"id": self.id, "source": self.source, "output_dir": self.output_dir, "options": self.options,
+                    "priority": self.priority, "status": self.status, "submitted": self.submitted,
+                    "started": self.started, "finished": self.finished,
+                    "result": self.result, "error": self.error}
+
+
+class SummaryDaemon:
+    def __init__(self, run_job, workers=4, jobs_dir=JOBS_DIR, roots=None, token=None, keep_finished=1000, finished_seconds=3600.0):
+        """Create a daemon; serve() starts it.
+
+        Parameters:
+        run_job (callable): Summarizes one document, called as run_job(source, options, progress,
+            output_dir) on a worker thread; progress takes an event dict. Returns a
+            JSON-serializable result.
+        workers (int, optional): Jobs run at once. Default is 4.
+        jobs_dir (str, optional): Each job's submitted text and outputs are written to a directory here.
+        roots (list, optional): The directories jobs may read files from. Defaults to the current directory.
+        token (str, optional): The token clients must send. Defaults to load_token(create=True).
+        keep_finished (int, optional): The most finished jobs remembered; older ones are forgotten
+            (their outputs stay on disk). Default is 1000.
+        finished_seconds (float, optional): How long a finished job is remembered. Default is an hour.
+        """
+        self.run_job = run_job
+        self.workers = max(1, workers)
+        self.jobs_dir = jobs_dir
+        self.roots = [os.path.realpath(root) for root in (roots or [os.getcwd()])]
+        self.token = token or load_token(create=True)
+        self.keep_finished = keep_finished
+        self.finished_seconds = finished_seconds
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.queue = queue.PriorityQueue()
+        self.sequence = itertools.count(1)
+        self.running = 0
+
+    def submit(self, request):
+        """Queues a job from a POST /jobs request body.
+
+        Raises:
+        ValueError: If the request doesn't name a readable source or give text.
+        """
+        if not isinstance(request, dict):
+            raise ValueError("A job must be a JSON object")
+        try:
+            priority = int(request.get("priority", 0))
+        except (TypeError, ValueError):
+            raise ValueError("priority must be an integer")
+        number = next(self.sequence)
+        job_id = f"{int(time.time())}-{number}"
+        output_dir = os.path.join(self.jobs_dir, job_id)
+        if request.get("text"):
+            if not isinstance(request["text"], str):
+                raise ValueError("text must be a string")
+            source = None
+        else:
+            source = self.check_source(request.get("source"))
+        os.makedirs(output_dir, exist_ok=True)
+        if source is None:
+            # Raw text is summarized like a text file
+            name = re.sub(r"[^\w.-]+", "_", request.get("name") or "text")[:64]
+            source = os.path.join(output_dir, name + ".txt")
+            with open(source, 'w') as f:
+                f.write(request["text"])
+
+        job = Job(job_id, source, {key: request[key] for key in JOB_OPTIONS if key in request}, priority, output_dir)
+        with self.lock:
+            self.prune()
+            self.jobs[job_id] = job
+            position = sum(other.status == "queued" and other.priority >= priority
+                           for other in self.jobs.values())
+        job.emit({"event": "queued", "position": position})
+        self.queue.put((-priority, number, job))
+        return job
+
+    def check_source(self, source):
+        """Returns source as the daemon will read it: a URL, or the real path of a file under a root.
+
+        Raises:
+        ValueError: If source is neither.
+        """
+        if not isinstance(source, str) or not source:
+            raise ValueError("A job needs a source (a file path or URL) or text")
+        if source.startswith(("http://", "https://")):
+            return source
+        path = os.path.realpath(source)
+        if not any(os.path.commonpath([path, root]) == root for root in self.roots):
+            raise ValueError(f"{source} is not under the daemon's roots")
+        if not os.path.isfile(path):
+            raise ValueError(f"{source} is not a file the daemon can read")
+        return path
+
+    def cancel(self, job):
+        """Cancels a queued job; returns False if it has already started."""
+        # The condition's lock is reentrant, so emit() can take it again
+        with job.condition:
+            if job.status != "queued":
+                return False
+            job.finished = time.time()
+            job.emit({"event": "cancelled"}, "cancelled")
+        return True
+
+    def work(self):
+        while True:
+            _, _, job = self.queue.get()
+            with job.condition:
+                if job.status != "queued":
+                    # Cancelled while it waited
+                    continue
+                job.started = time.time()
+            with self.lock:
+                self.running += 1
+            job.emit({"event": "started"}, "running")
+            try:
+                result = self.run_job(job.source, job.options, job.emit, job.output_dir)
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.finished = time.time()
+                print(f"Job {job.id} ({job.source}) failed: {job.error}")
+                job.emit({"event": "failed", "error": job.error}, "failed")
+            else:
+                job.result = result
+                job.finished = time.time()
+                job.emit({"event": "done", "result": result,
+                          "seconds": round(job.finished - job.started, 3)}, "done")
+            finally:
+                with self.lock:
+                    self.running -= 1
+                    self.prune()
+
+    def prune(self):
+        # Called under the lock; forgets finished jobs past keep_finished or finished_seconds
+        now = time.time()
+        finished = sorted((job for job in self.jobs.values() if job.status in FINAL_STATUSES),
+                          key=lambda job: job.finished)
+        excess = len(finished) - self.keep_finished
+        for index, job in enumerate(finished):
+            if index < excess or now - job.finished > self.finished_seconds:
+                del self.jobs[job.id]
+
+    def health(self):
+        with self.lock:
+            statuses = [job.status for job in self.jobs.values()]
+            running = self.running
+        return {"status": "ok", "workers": self.workers, "running": running,
+                "queued": statuses.count("queued"), "done": statuses.count("done"),
+                "failed": statuses.count("failed")}
+
+    def serve(self, url):
+        """Serves the job API at url (e.g. http://127.0.0.1:8765) until interrupted."""
+        address = urlsplit(url)
+        Handler = type("Handler", (JobHandler,), {"daemon": self})
+
+        for _ in range(self.workers):
+            threading.Thread(target=self.work, daemon=True).start()
+        server = ThreadingHTTPServer((address.hostname or "127.0.0.1", address.port or 8765), Handler)
+        server.daemon_threads = True
+        print(f"Summarization daemon listening on {url} with {self.workers} job workers")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("Shutting down")
+        finally:
+            server.server_close()
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    # Set on the subclass serve() creates
+    daemon = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def authorized(self):
+        expected = f"Bearer {self.daemon.token}"
+        if hmac.compare_digest(self.headers.get("Authorization", "").encode("utf-8"), expected.encode("utf-8")):
+            return True
+        self.send_json(401, {"error": "Missing or wrong daemon token"})
+        return False
+
+    def find_job(self, parts):
+        with self.daemon.lock:
+            job = self.daemon.jobs.get(parts[1]) if len(parts) > 1 else None
+        if job is None:
+            self.send_json(404, {"error": "No such job"})
+        return job
+
+    def do_GET(self):
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts == ["health"]:
+            self.send_json(200, self.daemon.health())
+        elif not self.authorized():
+            return
+        elif parts == ["jobs"]:
+            with self.daemon.lock:
+                jobs = list(self.daemon.jobs.values())
+            self.send_json(200, [job.describe() for job in jobs])
+        elif parts[0] == "jobs" and len(parts) == 2:
+            job = self.find_job(parts)
+            if job is not None:
+                self.send_json(200, job.describe())
+        elif parts[0] == "jobs" and len(parts) == 3 and parts[2] == "events":
+            job = self.find_job(parts)
+            if job is not None:
+                self.stream_events(job)
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def stream_events(self, job):
+        # No Content-Length: the response ends when the connection closes, after the last event
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        index = 0
+        finished = False
+        try:
+            while not finished:
+                events, finished = job.events_after(index, timeout=30)
+                index += len(events)
+                for event in events:
+                    self.wfile.write((json.dumps(event) + "\n").encode("utf-8"))
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped listening; the job carries on
+            pass
+        self.close_connection = True
+
+    def do_POST(self):
+        if not self.authorized():
+            return
+        if urlsplit(self.path).path.rstrip("/") != "/jobs":
+            self.send_json(404, {"error": "Not found"})
+            return
+        if self.headers.get_content_type() != "application/json":
+            self.send_json(415, {"error": "Jobs must be submitted as application/json"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+            job = self.daemon.submit(request)
+        except (ValueError, AttributeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        self.send_json(202, job.describe())
+
+    def do_DELETE(self):
+        if not self.authorized():
+            return
+        parts = urlsplit(self.path).path.strip("/").split("/")
+        if parts[0] != "jobs" or len(parts) != 2:
+            self.send_json(404, {"error": "Not found"})
+            return
+        job = self.find_job(parts)
+        if job is None:
+            return
+        if self.daemon.cancel(job):
+            self.send_json(200, job.describe())
+        else:
+            self.send_json(409, {"error": f"Job {job.id} is {job.status}; only queued jobs can be cancelled"})
+
+
+def describe_event(event):
+    kind = event["event"]
+    if kind == "queued":
+        return f"queued at position {event['position']}"
+    if kind == "chunk":
+        how = " (reused)" if event.get("reused") else " (near-duplicate)" if event.get("near_duplicate") else ""
+        return f"summarized chunk {event['chunk']} of section {event['section']}{how}"
+    if kind == "section":
+        return f"summarized section {event['section']}"
+    if kind == "overall":
+        return "summarized the whole document"
+    if kind == "done":
+        return f"done in {event['seconds']:.1f}s: {event['result']['html']}"
+    if kind == "failed":
+        return f"failed: {event['error']}"
+    return kind
+
+
+def submit_job(daemon_url, source, language="", priority=0, incremental=False):
+    """Submits a document to a running daemon and prints its progress until it finishes.
+
+    Parameters:
+    daemon_url (str): The daemon's URL.
+    source (str): A file path or URL, or "-" to submit the text on stdin.
+
+    Returns:
+    int: The exit status: 0 if the job finished, 1 if not.
+    """
+    import requests
+
+    token = load_token()
+    if token is None:
+        print(f"No daemon token in $SUMMARY_DAEMON_TOKEN or {TOKEN_PATH}; start the daemon with python summarize.py --daemon")
+        return 1
+    headers = {"Authorization": f"Bearer {token}"}
+    request = {"language": language, "priority": priority, "incremental": incremental}
+    if source == "-":
+        request["text"] = sys.stdin.read()
+    elif source.startswith("http"):
+        request["source"] = source
+    else:
+        # The daemon may run in another directory
+        request["source"] = os.path.abspath(source)
+
+    url = daemon_url.rstrip("/")
+    try:
+        response = requests.post(url + "/jobs", json=request, headers=headers, timeout=30)
+    except requests.ConnectionError:
+        print(f"No summarization daemon at {url}; start one with python summarize.py --daemon")
+        return 1
+    if response.status_code != 202:
+        print(f"Job rejected: {response.json().get('error', response.text)}")
+        return 1
+    job = response.json()
+    print(f"Submitted job {job['id']} for {job['source']}")
+
+    final = None
+    with requests.get(f"{url}/jobs/{job['id']}/events", headers=headers, stream=True, timeout=(10, None)) as events:
+        for line in events.iter_lines():
+            if line:
+                final = json.loads(line)
+                print(describe_event(final))
+    return 0 if final is not None and final["event"] == "done" else 1
@@ -0,0 +1,251 @@
+"""
+Pooled, concurrent HTTP downloads of the documents to summarize.
+
+A Fetcher downloads over one requests session, so connections (and their
+TLS handshakes) are reused across documents and threads. fetch_all() runs
+downloads concurrently, while per-host politeness limits how many requests
+go to one host at once and how closely they follow each other. Responses
+are streamed to disk rather than held in memory.
+
+Every download is kept in a local cache with its ETag and Last-Modified
+headers. A document fetched again is requested conditionally, and a 304 Not
+Modified answer reuses the cached copy. A copy younger than fresh_seconds is
+reused without any request, so a batch can fetch its URLs up front and its
+worker processes pick them up from the cache.
+
+shared_fetcher() returns one fetcher per process, configured from
+FETCH_CONCURRENCY, FETCH_PER_HOST, FETCH_HOST_INTERVAL, FETCH_TIMEOUT,
+FETCH_FRESH_SECONDS and FETCH_CACHE_DIR.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer", "http")
+PDF_CONTENT_TYPES = {"application/pdf", "application/x-pdf"}
+CHUNK_BYTES = 64 * 1024
+
+
+def copy_file(source, dest):
+    """Copies the file source to dest, replacing dest in one step.
+
+    A copy rather than a hard link, so editing dest can't change a cached download.
+    """
+    # A temporary file of its own, so concurrent copies to the same dest don't collide
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, dest)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+class Fetcher:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_workers=8, per_host=2, host_interval=0.25, timeout=30.0, fresh_seconds=60.0):
+        """Create a fetcher.
+
+        Parameters:
+        cache_dir (str, optional): The directory downloads are cached in.
+        max_workers (int, optional): Downloads run at once by fetch_all(). Default is 8.
+        per_host (int, optional): Requests in flight to one host at once. Default is 2.
+        host_interval (float, optional): The least time between two requests to one host, in seconds. Default is 0.25.
+        timeout (float, optional): The connect and read timeout, in seconds. Default is 30.
+        fresh_seconds (float, optional): How long a download is reused without asking the server. Default is 60.
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.cache_dir = cache_dir
+        self.max_workers = max(1, int(max_workers))
+        self.per_host = max(1, int(per_host))
+        self.host_interval = host_interval
+        self.timeout = timeout
+        self.fresh_seconds = fresh_seconds
+        os.makedirs(cache_dir, exist_ok=True)
+
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = "gpt-summarizer"
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=self.max_workers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.lock = threading.Lock()
+        self.hosts = {}
+        self.counters = {"downloaded": 0, "not_modified": 0, "fresh": 0, "bytes": 0}
+
+    @staticmethod
+    def build():
+        """Builds a fetcher from FETCH_CACHE_DIR, FETCH_CONCURRENCY, FETCH_PER_HOST,
+        FETCH_HOST_INTERVAL, FETCH_TIMEOUT and FETCH_FRESH_SECONDS."""
+        return Fetcher(
+            cache_dir=os.getenv("FETCH_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_workers=int(os.getenv("FETCH_CONCURRENCY", "8")),
+            per_host=int(os.getenv("FETCH_PER_HOST", "2")),
+            host_interval=float(os.getenv("FETCH_HOST_INTERVAL", "0.25")),
+            timeout=float(os.getenv("FETCH_TIMEOUT", "30")),
+            fresh_seconds=float(os.getenv("FETCH_FRESH_SECONDS", "60")))
+
+    @contextmanager
+    def host_slot(self, host):
+        """Waits for a request slot on host, and for its turn after the host's previous request."""
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = [threading.Semaphore(self.per_host), 0.0]
+            semaphore = self.hosts[host][0]
+        with semaphore:
+            with self.lock:
+                start = max(time.monotonic(), self.hosts[host][1])
+                self.hosts[host][1] = start + self.host_interval
+            time.sleep(max(0.0, start - time.monotonic()))
+            yield
+
+    def entry_paths(self, url):
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return (os.path.join(self.cache_dir, digest + ".json"),
+                os.path.join(self.cache_dir, digest + ".body"))
+
+    def fetch(self, url, dest=None):
+        """Downloads url, or reuses the cached copy if the server says it is unchanged.
+
+        Parameters:
+        url (str): The URL to download.
+        dest (str, optional): Where to place the downloaded file.
+
+        Returns:
+        dict: The url, final_url (after redirects), content_type, path (dest, or the
+            cached copy) and status ("downloaded", "not_modified" or "fresh").
+        """
+        meta_path, body_path = self.entry_paths(url)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            if not os.path.exists(body_path):
+                meta = None
+        except (OSError, ValueError):
+            meta = None
+
+        if meta is not None and time.time() - meta["fetched_at"] < self.fresh_seconds:
+            status = "fresh"
+        else:
+            headers = {}
+            if meta is not None:
+                if meta.get("etag"):
+                    headers["If-None-Match"] = meta["etag"]
+                if meta.get("last_modified"):
+                    headers["If-Modified-Since"] = meta["last_modified"]
+            with self.host_slot(urlsplit(url).netloc):
+                response = self.session.get(
+                    url, headers=headers, stream=True, timeout=self.timeout)
+                try:
+                    if response.status_code == 304 and meta is not None:
+                        status = "not_modified"
+                    else:
+                        response.raise_for_status()
+                        status = "downloaded"
+                        size = self.stream_to(response, body_path)
+                        meta = {
+                            "url": url,
+                            "final_url": response.url,
+                            "content_type": response.headers.get("Content-Type", ""),
+                            "etag": response.headers.get("ETag"),
+                            "last_modified": response.headers.get("Last-Modified"),
+                            "bytes": size,
+                        }
+                        with self.lock:
+                            self.counters["bytes"] += size
+                finally:
+                    response.close()
+            meta["fetched_at"] = time.time()
+            self.write_meta(meta_path, meta)
+
+        with self.lock:
+            self.counters[status] += 1
+        path = body_path
+        if dest is not None:
+            copy_file(body_path, dest)
+            path = dest
+        return {"url": url, "final_url": meta["final_url"], "content_type": meta["content_type"],
+                "path": path, "status": status}
+
+    def stream_to(self, response, path):
+        # Write to a temporary file first, so a failed download never replaces a good copy
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for block in response.iter_content(CHUNK_BYTES):
+                    f.write(block)
+                    size += len(block)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return size
+
+    def write_meta(self, path, meta):
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, 'w') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, path)
+
+    def download(self, url, directory="/tmp"):
+        """Downloads a document to directory, named after the last part of its URL.
+
+        PDFs keep their name (".pdf" is added if the server says the document is
+        a PDF but the URL doesn't end in .pdf); anything else gets ".html".
+
+        Returns:
+        str: The path of the downloaded file.
+        """
+        result = self.fetch(url)
+        base_name = url.rstrip("/").split("/")[-1]
+        is_pdf = result["content_type"].split(";")[0].strip() in PDF_CONTENT_TYPES
+        if not base_name.endswith(".pdf"):
+            base_name += ".pdf" if is_pdf else ".html"
+        path = os.path.join(directory, base_name)
+        copy_file(result["path"], path)
+        return path
+
+    def fetch_all(self, urls):
+        """Downloads urls concurrently into the cache.
+
+        Returns:
+        list: One fetch() result per URL, in order, or the exception it raised.
+        """
+        def fetch(url):
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                print(f"Failed to fetch {url}: {e!r}")
+                return e
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(fetch, urls))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_fetcher = None
+_fetcher_lock = threading.Lock()
+
+
+def shared_fetcher():
+    """Returns the process-wide fetcher, building it on first use."""
+    global _fetcher
+    with _fetcher_lock:
+        if _fetcher is None:
+            _fetcher = Fetcher.build()
+        return _fetcher
@@ -1,3 +1,4 @@
+from fetcher import shared_fetcher
 
 
 class TextExtractor:
@@ -8,7 +9,7 @@ class TextExtractor:
 
     def download_file(self, url):
         url = url.split("?")[0]
-        html_path = download_html(url)
+        html_path = shared_fetcher().download(url)
         print(html_path)
         url = url.rstrip("/")
         base_name = "/tmp/" + url.split("/")[-1]
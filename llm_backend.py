@@ -0,0 +1,236 @@
+"""
+Pluggable completion backends.
+
+Every completion request goes through completion_backend().create(), which
+takes the same arguments as openai.Completion.create. LLM_BACKEND selects
+the backend:
+
+- "openai" (the default) calls the OpenAI API. Point OPENAI_API_BASE at
+  benchmarks/stub_server.py to exercise the real HTTP path offline.
+- "fake" answers in-process with FakeCompletionBackend. It needs no network
+  or API key, and is configured with the FAKE_LLM_* variables below.
+
+The fake's outputs are deterministic: the same prompt always gets the same
+completion. Its latency is drawn from a configurable distribution, streamed
+responses arrive in chunks at a configurable cadence, and a configurable
+fraction of requests fail with a 429 rate-limit error.
+"""
+
+import os
+import json
+import time
+import atexit
+import random
+import hashlib
+import threading
+
+from rate_limiter import estimate_tokens
+
+
+def parse_latency(spec):
+    """Parses a latency distribution spec into a function of a random.Random.
+
+    Parameters:
+    spec (str): "constant:S", "uniform:LOW,HIGH", "normal:MEAN,STDDEV" or
+        "lognormal:MU,SIGMA", in seconds (MU and SIGMA of the underlying normal).
+
+    Returns:
+    callable: Returns one latency sample, in seconds, given a random.Random.
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "constant":
+        return lambda rng: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(values[0], values[1])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+class FakeObject(dict):
+    """A dict whose keys can also be read as attributes, like openai's OpenAIObject."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+def to_object(value):
+    if isinstance(value, dict):
+        return FakeObject({key: to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [to_object(item) for item in value]
+    return value
+
+
+class FakeRateLimitError(Exception):
+    """Raised by the fake backend to simulate an HTTP 429 from the API."""
+
+    http_status = 429
+
+    def __init__(self, retry_after):
+        super().__init__("Rate limit reached (simulated)")
+        self.headers = {"retry-after": str(retry_after)}
+
+
+class OpenAIBackend:
+    def __init__(self, pool_size=16):
+        """Set up the openai package once: the API key, and one keep-alive session
+        whose connection pool every thread shares.
+
+        Parameters:
+        pool_size (int, optional): The most connections kept open. Default is 16.
+        """
+        import openai
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        if openai.api_key is None:
+            # Get the API key from the environment variable
+            openai.api_key = os.getenv("GPT_SECRET_KEY")
+        # Without this, openai 0.x opens a new session, and new connections, per thread
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        openai.requestssession = session
+        self.openai = openai
+
+    def create(self, **kwargs):
+        return self.openai.Completion.create(**kwargs)
+
+
+class FakeCompletionBackend:
+    def __init__(self, latency="constant:0", token_seconds=0.0, chunk_tokens=4, error_rate=0.0, retry_after=1.0, output_words=60, seed=0):
+        """Create a fake backend.
+
+        Parameters:
+        latency (str, optional): The distribution of the time to the first token, see
+            parse_latency(). Default is "constant:0".
+        token_seconds (float, optional): The time to generate each completion token. Default is 0.
+        chunk_tokens (int, optional): The tokens in each streamed chunk. Default is 4.
+        error_rate (float, optional): The fraction of requests that fail with a 429. Default is 0.
+        retry_after (float, optional): The Retry-After of simulated 429s, in seconds. Default is 1.
+        output_words (int, optional): The length of each completion, in words. Default is 60.
+        seed (int, optional): Seeds the latency and error draws. Default is 0.
+        """
+        self.latency = parse_latency(latency)
+        self.token_seconds = token_seconds
+        self.chunk_tokens = max(1, int(chunk_tokens))
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.output_words = output_words
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counters = {"calls": 0, "errors": 0,
+                         "prompt_tokens": 0, "completion_tokens": 0}
+
+    @staticmethod
+    def build():
+        """Builds a fake backend from FAKE_LLM_LATENCY, FAKE_LLM_TOKEN_SECONDS,
+        FAKE_LLM_CHUNK_TOKENS, FAKE_LLM_ERROR_RATE, FAKE_LLM_RETRY_AFTER,
+        FAKE_LLM_OUTPUT_WORDS and FAKE_LLM_SEED."""
+        return FakeCompletionBackend(
+            latency=os.getenv("FAKE_LLM_LATENCY", "constant:0"),
+            token_seconds=float(os.getenv("FAKE_LLM_TOKEN_SECONDS", "0")),
+            chunk_tokens=int(os.getenv("FAKE_LLM_CHUNK_TOKENS", "4")),
+            error_rate=float(os.getenv("FAKE_LLM_ERROR_RATE", "0")),
+            retry_after=float(os.getenv("FAKE_LLM_RETRY_AFTER", "1")),
+            output_words=int(os.getenv("FAKE_LLM_OUTPUT_WORDS", "60")),
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")))
+
+    def complete(self, prompt, max_tokens):
+        """Returns the deterministic completion of prompt: a run of its own words."""
+        words = prompt.split() or ["(empty)"]
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        start = int(digest[:8], 16) % len(words)
+        n_words = min(self.output_words, max(1, max_tokens * 3 // 4))
+        picked = [words[(start + i) % len(words)] for i in range(n_words)]
+        return f"Summary {digest[:8]}: " + " ".join(picked)
+
+    def create(self, engine=None, model=None, prompt="", max_tokens=16, stream=False, **kwargs):
+        with self.lock:
+            self.counters["calls"] += 1
+            fail = self.rng.random() < self.error_rate
+            first_token_seconds = self.latency(self.rng)
+            if fail:
+                self.counters["errors"] += 1
+        if fail:
+            time.sleep(first_token_seconds)
+            raise FakeRateLimitError(self.retry_after)
+
+        text = self.complete(prompt, max_tokens)
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(text)
+        with self.lock:
+            self.counters["prompt_tokens"] += prompt_tokens
+            self.counters["completion_tokens"] += completion_tokens
+        response = {
+            "id": "cmpl-fake-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:24],
+            "object": "text_completion",
+            "created": int(time.time()),
+            "model": model or engine,
+        }
+
+        if stream:
+            # Like the API, return once the first token is ready
+            time.sleep(first_token_seconds)
+            return self.stream(response, text)
+
+        time.sleep(first_token_seconds +
+                   completion_tokens * self.token_seconds)
+        response.update(
+            choices=[{"text": text, "index": 0,
+                      "logprobs": None, "finish_reason": "stop"}],
+            usage={"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                   "total_tokens": prompt_tokens + completion_tokens})
+        return to_object(response)
+
+    def stream(self, response, text):
+        # Stream about chunk_tokens tokens (4 characters each) at a time
+        step = self.chunk_tokens * 4
+        for start in range(0, len(text), step):
+            if start:
+                time.sleep(self.chunk_tokens * self.token_seconds)
+            last = start + step >= len(text)
+            yield to_object(dict(response, choices=[{
+                "text": text[start:start + step], "index": 0, "logprobs": None,
+                "finish_reason": "stop" if last else None}]))
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def completion_backend():
+    """Returns the process-wide completion backend selected by LLM_BACKEND."""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            name = os.getenv("LLM_BACKEND", "openai")
+            if name == "fake":
+                _backend = FakeCompletionBackend.build()
+                stats_path = os.getenv("FAKE_LLM_STATS")
+                if stats_path:
+                    # Let a benchmark read the call and token counts after the process exits
+                    atexit.register(write_stats, _backend, stats_path)
+            elif name == "openai":
+                _backend = OpenAIBackend(
+                    int(os.getenv("OPENAI_POOL_SIZE", "16")))
+            else:
+                raise ValueError(f"Unknown LLM_BACKEND: {name}")
+        return _backend
+
+
+def write_stats(backend, path):
+    with open(path, 'w') as f:
+        json.dump(backend.stats(), f)
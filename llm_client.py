@@ -0,0 +1,172 @@
+"""
+The client every completion request goes through.
+
+LLMClient puts the pieces together: the request is queued on the shared
+rate-limited dispatcher (rate_limiter.py), sent through the selected backend
+(llm_backend.py, which for the OpenAI API keeps one pooled keep-alive HTTP
+session and sets the API key once), and timed. complete() is the sync
+interface. acomplete() is the async one; it runs the same call on a worker
+thread, so async callers share the pool and the rate limits.
+
+Every call is recorded as one JSON line: label, model, queue wait, latency,
+time to first token for streams, prompt and completion tokens, retries and
+errors. Lines are appended to the file named by LLM_TELEMETRY (or passed to
+llm_client()), so you can see where summarization time goes.
+"""
+
+import os
+import json
+import time
+import asyncio
+import threading
+
+from rate_limiter import shared_dispatcher, estimate_tokens
+from llm_backend import completion_backend
+
+
+class CallTelemetry:
+    def __init__(self, path=None):
+        """Create a recorder that appends JSON lines to path, if given, and keeps totals.
+
+        Parameters:
+        path (str, optional): The JSON lines file to append to.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.totals = {"calls": 0, "errors": 0, "retries": 0, "queue_wait_seconds": 0.0,
+                       "latency_seconds": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def record(self, record):
+        line = json.dumps(record)
+        with self.lock:
+            self.totals["calls"] += 1
+            self.totals["errors"] += record["status"] == "error"
+            self.totals["retries"] += record["retries"]
+            self.totals["queue_wait_seconds"] += record["queue_wait_s"]
+            self.totals["latency_seconds"] += record["latency_s"]
+            self.totals["prompt_tokens"] += record["prompt_tokens"]
+            self.totals["completion_tokens"] += record["completion_tokens"]
+            if self.path:
+                with open(self.path, 'a') as f:
+                    f.write(line + "\n")
+
+    def summary(self):
+        """Returns the totals over every recorded call, with mean latency and queue wait."""
+        with self.lock:
+            summary = dict(self.totals)
+        calls = summary["calls"] or 1
+        summary["mean_latency_seconds"] = summary["latency_seconds"] / calls
+        summary["mean_queue_wait_seconds"] = summary["queue_wait_seconds"] / calls
+        return summary
+
+
+class LLMClient:
+    def __init__(self, backend, dispatcher, telemetry):
+        """Create a client.
+
+        Parameters:
+        backend (object): The completion backend, e.g. from llm_backend.completion_backend().
+        dispatcher (RequestDispatcher): Rate-limits and retries the requests.
+        telemetry (CallTelemetry): Records every call.
+        """
+        self.backend = backend
+        self.dispatcher = dispatcher
+        self.telemetry = telemetry
+
+    def complete(self, prompt, engine, max_tokens=16, temperature=0, stream=False, label="", **kwargs):
+        """Requests a completion.
+
+        Parameters:
+        prompt (str): The prompt.
+        engine (str): The model to use.
+        max_tokens (int, optional): The most tokens to generate. Default is 16.
+        temperature (float, optional): The sampling temperature. Default is 0.
+        stream (bool, optional): Return the completion as a stream of events. Default is False.
+        label (str, optional): Names the caller in the telemetry.
+        Any other keyword arguments (stop, n, ...) are passed to the API.
+
+        Returns:
+        object: The completion, or an iterator of completion events if stream is True.
+        """
+        record = {"ts": time.time(), "label": label, "model": engine, "stream": stream}
+        call_stats = {}
+        start = time.perf_counter()
+        try:
+            response = self.dispatcher.call(
+                self.backend.create, engine=engine, prompt=prompt, max_tokens=max_tokens,
+                temperature=temperature, stream=stream, call_stats=call_stats, **kwargs)
+        except Exception as e:
+            self.finish(record, start, call_stats, prompt, "", None,
+                        status="error", error=f"{type(e).__name__}: {e}")
+            raise
+
+        if stream:
+            return self.timed_stream(response, record, start, call_stats, prompt)
+
+        try:
+            usage = response["usage"]
+        except (KeyError, TypeError):
+            usage = None
+        self.finish(record, start, call_stats, prompt,
+                    response["choices"][0]["text"], usage)
+        return response
+
+    async def acomplete(self, prompt, engine, **kwargs):
+        """Async form of complete(); takes the same arguments."""
+        return await asyncio.to_thread(self.complete, prompt, engine, **kwargs)
+
+    def timed_stream(self, response, record, start, call_stats, prompt):
+        parts = []
+        first_token_seconds = None
+        status = "ok"
+        try:
+            for event in response:
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - start
+                parts.append(event["choices"][0]["text"])
+                yield event
+        except GeneratorExit:
+            status = "cancelled"
+            raise
+        finally:
+            close = getattr(response, "close", None)
+            if close is not None:
+                # Releases the dispatcher's slot now, not when the stream is garbage collected
+                close()
+            record["ttft_s"] = first_token_seconds
+            self.finish(record, start, call_stats, prompt, "".join(parts), None, status)
+
+    def finish(self, record, start, call_stats, prompt, text, usage, status="ok", error=None):
+        wait_seconds = call_stats.get("wait_seconds", 0.0)
+        record.update(
+            status=status,
+            queue_wait_s=round(wait_seconds, 4),
+            latency_s=round(time.perf_counter() - start - wait_seconds, 4),
+            prompt_tokens=usage["prompt_tokens"] if usage else estimate_tokens(prompt),
+            completion_tokens=usage["completion_tokens"] if usage else (
+                estimate_tokens(text) if text else 0),
+            retries=call_stats.get("retries", 0))
+        record.setdefault("ttft_s", None)
+        if error is not None:
+            record["error"] = error
+        self.telemetry.record(record)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def llm_client(telemetry_path=None):
+    """Returns the process-wide client, building it on first use.
+
+    Parameters:
+    telemetry_path (str, optional): The JSON lines file to record calls in. Defaults to
+        $LLM_TELEMETRY; only takes effect on the call that builds the client.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LLMClient(
+                completion_backend(), shared_dispatcher(),
+                CallTelemetry(telemetry_path or os.getenv("LLM_TELEMETRY")))
+        return _client
@@ -0,0 +1,236 @@
+"""
+Per-document manifest of the files a summarization run produces.
+
+As summarize.py splits a document, it records every section and chunk in a
+DocumentManifest: the chunk's token count, a hash of its content, its
+.full.txt and .summary.txt paths and its position (section index, chunk
+index). Section and overall summaries are recorded as they are written. The
+reduction steps and create_html_file() read their inputs from the manifest
+in document order, instead of globbing the output directory, which costs a
+directory scan per lookup and mixes up documents that share a directory.
+
+The manifest also records the settings the chunks were summarized with and
+how many summaries the run generated or reused. An incremental run loads the
+previous manifest as PreviousSummaries and reuses the summary of every chunk
+whose content hash is unchanged.
+
+The manifest is saved as {base_name}.manifest.json.
+"""
+
+import json
+import hashlib
+import threading
+from collections import Counter
+
+from artifact_store import FileStore
+
+MANIFEST_VERSION = 2
+ABSTRACT_HEADER = "Title-Abstract"
+
+
+def content_hash(text):
+    """Returns the sha256 hex digest of text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class DocumentManifest:
+    def __init__(self, base_name, data=None, store=None):
+        """Create a manifest for the document whose output files start with base_name.
+
+        Parameters:
+        base_name (str): The base path of the output files.
+        data (dict, optional): Previously saved manifest contents.
+        store (object, optional): The artifact store it is saved in. Defaults to a FileStore.
+        """
+        self.base_name = base_name
+        self.store = store or FileStore()
+        self.path = base_name + ".manifest.json"
+        self.data = data or {
+            "version": MANIFEST_VERSION,
+            "base_name": base_name,
+            "source": None,
+            "doctype": "",
+            "summary_settings": None,
+            "sections": [],
+            "overall_summary_path": None,
+            "run": {"chunks": 0, "chunks_reused": 0, "chunks_removed": 0, "chunks_near_duplicate": 0,
+                    "reductions": 0, "reductions_reused": 0},
+        }
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def load(base_name, store=None):
+        """Loads the manifest saved for base_name.
+
+        Raises:
+        FileNotFoundError: If no manifest was saved for base_name.
+        """
+        store = store or FileStore()
+        return DocumentManifest(base_name, json.loads(store.read(base_name + ".manifest.json")), store)
+
+    def save(self):
+        with self.lock:
+            contents = json.dumps(self.data, indent=2)
+        self.store.write(self.path, contents)
+
+    def set_source(self, source, doctype):
+        with self.lock:
+            self.data["source"] = source
+            self.data["doctype"] = doctype
+
+    def set_summary_settings(self, settings):
+        """Records what the chunk summaries depend on besides their content (model, prompt, language)."""
+        with self.lock:
+            self.data["summary_settings"] = settings
+
+    def count(self, name, amount=1):
+        """Adds amount to one of the run's counters."""
+        with self.lock:
+            self.data["run"][name] += amount
+
+    def run_counts(self):
+        with self.lock:
+            return dict(self.data["run"])
+
+    def add_section(self, header, tokens):
+        """Records a section and returns its index."""
+        with self.lock:
+            sections = self.data["sections"]
+            sections.append({
+                "index": len(sections),
+                "header": header,
+                "tokens": tokens,
+                "chunks": [],
+                "summary_path": None,
+            })
+            return len(sections) - 1
+
+    def add_chunk(self, section_index, name, content, tokens, full_path, summary_path):
+        """Records a chunk of a section and returns its index within the section."""
+        with self.lock:
+            chunks = self.data["sections"][section_index]["chunks"]
+            chunks.append({
+                "section": section_index,
+                "index": len(chunks),
+                "name": name,
+                "tokens": tokens,
+                "hash": content_hash(content),
+                "full_path": full_path,
+                "summary_path": summary_path,
+                "summarized": False,
+            })
+            return len(chunks) - 1
+
+    def mark_chunk_summarized(self, section_index, chunk_index):
+        with self.lock:
+            self.data["sections"][section_index]["chunks"][chunk_index]["summarized"] = True
+
+    def chunk(self, section_index, chunk_index):
+        with self.lock:
+            return dict(self.data["sections"][section_index]["chunks"][chunk_index])
+
+    def set_section_summary(self, section_index, summary_path):
+        with self.lock:
+            self.data["sections"][section_index]["summary_path"] = summary_path
+
+    def set_overall_summary(self, summary_path):
+        with self.lock:
+            self.data["overall_summary_path"] = summary_path
+
+    def section(self, section_index):
+        return self.data["sections"][section_index]
+
+    def chunk_summary_paths(self, section_index):
+        """Returns the summary files of a section's chunks, in order."""
+        with self.lock:
+            return [chunk["summary_path"] for chunk in self.data["sections"][section_index]["chunks"]
+                    if chunk["summarized"]]
+
+    def section_summary_paths(self):
+        """Returns the section summary files, in document order."""
+        with self.lock:
+            return [section["summary_path"] for section in self.data["sections"]
+                    if section["summary_path"] is not None]
+
+    def subsection_summary_paths(self):
+        """Returns every chunk summary file, in document order."""
+        with self.lock:
+            return [chunk["summary_path"] for section in self.data["sections"]
+                    for chunk in section["chunks"] if chunk["summarized"]]
+
+    def abstract_path(self):
+        """Returns the .full.txt file of the title/abstract section, or None.
+
+        If the document was not split into sections at all, the first
+        section is the whole document rather than an abstract. If the section
+        spans several chunks, it is too long to stand in for an abstract; its
+        section summary covers it instead.
+        """
+        with self.lock:
+            sections = self.data["sections"]
+            if len(sections) < 2 or sections[0]["header"] != ABSTRACT_HEADER:
+                return None
+            if len(sections[0]["chunks"]) != 1:
+                return None
+            return sections[0]["chunks"][0]["full_path"]
+
+
+class PreviousSummaries:
+    def __init__(self, summaries=None, hashes=None):
+        """The chunk summaries of a document's previous run, by content hash.
+
+        Parameters:
+        summaries (dict, optional): Maps a chunk's content hash to its summary.
+        hashes (list, optional): The content hashes of every previous chunk, in order.
+        """
+        self.summaries = summaries or {}
+        self.hashes = hashes or []
+
+    @staticmethod
+    def load(base_name, settings, store=None):
+        """Reads the summaries recorded in base_name's manifest.
+
+        The summaries are read into memory now, because the new run writes its
+        files over the old ones. Nothing is reused if there is no manifest, or
+        if its chunks were summarized with other settings.
+
+        Parameters:
+        base_name (str): The base path of the output files.
+        settings (dict): The summary settings of the new run.
+        store (object, optional): The artifact store of the previous run. Defaults to a FileStore.
+        """
+        try:
+            previous = DocumentManifest.load(base_name, store)
+        except (OSError, ValueError):
+            return PreviousSummaries()
+        if previous.data.get("summary_settings") != settings:
+            print(f"The previous summaries of {base_name} used other settings; not reusing them")
+            return PreviousSummaries()
+
+        summaries = {}
+        hashes = []
+        for section in previous.data["sections"]:
+            for chunk in section["chunks"]:
+                hashes.append(chunk["hash"])
+                if not chunk["summarized"] or chunk["hash"] in summaries:
+                    continue
+                try:
+                    summaries[chunk["hash"]] = previous.store.read(chunk["summary_path"])
+                except OSError:
+                    continue
+        return PreviousSummaries(summaries, hashes)
+
+    def get(self, text_hash):
+        """Returns the previous summary of the chunk with content hash text_hash, or None."""
+        return self.summaries.get(text_hash)
+
+    def removed(self, hashes):
+        """Returns how many previous chunks are not among hashes."""
+        remaining = Counter(hashes)
+        removed = 0
+        for text_hash in self.hashes:
+            if remaining[text_hash]:
+                remaining[text_hash] -= 1
+            else:
+                removed += 1
+        return removed
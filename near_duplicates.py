@@ -0,0 +1,228 @@
+"""
+Near-duplicate detection of chunks, so boilerplate isn't summarized twice.
+
+The exact summary cache only helps when a chunk is byte-for-byte the same.
+Web pages repeat navigation, cookie banners and footers with small
+differences, and crawled corpora hold near-identical copies of a page. A
+NearDuplicateIndex finds such chunks by the Jaccard similarity of their
+word shingles, estimated with MinHash signatures. Signatures are split into
+bands for locality-sensitive hashing, so a lookup only compares a chunk with
+the few earlier chunks that share a band, not with every chunk seen.
+
+Every summarized chunk's signature and summary are kept in a SQLite file, so
+near-duplicates are found across the documents of a batch and across runs.
+Chunks summarized at the same time are checked against each other too: a
+chunk similar to one still being summarized waits for that summary instead
+of requesting its own.
+
+Signatures are only compared within a scope (summarize.py uses the model,
+prompt and output language), since a summary made with one prompt is not a
+summary for another.
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from array import array
+
+DEFAULT_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer", "near_duplicates.db")
+# Hash values are reduced modulo this Mersenne prime
+PRIME = (1 << 61) - 1
+WORD = re.compile(r"\w+")
+
+
+def shingles(text, size=5):
+    """Returns the set of hashes of text's runs of size consecutive (lowercased) words."""
+    words = WORD.findall(text.lower())
+    if len(words) <= size:
+        runs = [" ".join(words)]
+    else:
+        runs = (" ".join(words[i:i + size]) for i in range(len(words) - size + 1))
+    return {int.from_bytes(hashlib.blake2b(run.encode("utf-8"), digest_size=8).digest(), "little") % PRIME
+            for run in runs}
+
+
+def similarity(signature, other):
+    """Estimates the Jaccard similarity of two chunks from their MinHash signatures."""
+    return sum(a == b for a, b in zip(signature, other)) / len(signature)
+
+
+class NearDuplicateIndex:
+    def __init__(self, db_path=DEFAULT_DB_PATH, threshold=0.85, num_perm=64, bands=16, shingle_words=5, min_words=20):
+        """Open (creating if needed) the index stored in the SQLite file db_path.
+
+        Parameters:
+        db_path (str, optional): The database file.
+        threshold (float, optional): The estimated Jaccard similarity at or above which two chunks
+            are near-duplicates. Default is 0.85.
+        num_perm (int, optional): The length of the MinHash signatures. Default is 64.
+        bands (int, optional): The LSH bands each signature is split into; more bands find
+            candidates at lower similarities. Must divide num_perm. Default is 16.
+        shingle_words (int, optional): The words in each shingle. Default is 5.
+        min_words (int, optional): Shorter chunks are never treated as near-duplicates. Default is 20.
+        """
+        if num_perm % bands:
+            raise ValueError(f"bands ({bands}) must divide num_perm ({num_perm})")
+        self.db_path = db_path
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_words = shingle_words
+        self.min_words = min_words
+        rng = random.Random(1)
+        self.permutations = [(rng.randrange(1, PRIME), rng.randrange(0, PRIME)) for _ in range(num_perm)]
+        # Signatures made with other parameters can't be compared with these
+        self.parameters = f"{num_perm}:{bands}:{shingle_words}"
+        self.lock = threading.Lock()
+        self.pending = []
+        self.pid = None
+        self.connection = None
+        self.counters = {"lookups": 0, "duplicates": 0, "waited": 0}
+
+    @staticmethod
+    def build():
+        """Builds an index from NEAR_DUP_DB, NEAR_DUP_THRESHOLD and NEAR_DUP_BANDS."""
+        return NearDuplicateIndex(
+            db_path=os.getenv("NEAR_DUP_DB", DEFAULT_DB_PATH),
+            threshold=float(os.getenv("NEAR_DUP_THRESHOLD", "0.85")),
+            bands=int(os.getenv("NEAR_DUP_BANDS", "16")))
+
+    def connect(self):
+        # Called under the lock; a connection inherited from a parent process must not be used
+        if self.pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+            self.connection = sqlite3.connect(
+                self.db_path, timeout=30.0, isolation_level=None, check_same_thread=False)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.executescript("""
+                CREATE TABLE IF NOT EXISTS signatures (
+                    id INTEGER PRIMARY KEY,
+                    scope TEXT NOT NULL,
+                    signature BLOB NOT NULL,
+                    summary TEXT NOT NULL,
+                    created REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS bands (
+                    scope TEXT NOT NULL,
+                    band INTEGER NOT NULL,
+                    bucket INTEGER NOT NULL,
+                    id INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS bands_bucket ON bands (scope, band, bucket);
+            """)
+            self.pid = os.getpid()
+        return self.connection
+
+    def signature(self, text):
+        """Returns the MinHash signature of text, or None if it is too short to compare."""
+        if len(WORD.findall(text)) < self.min_words:
+            return None
+        hashes = shingles(text, self.shingle_words)
+        return [min((a * h + b) % PRIME for h in hashes) for a, b in self.permutations]
+
+    def buckets(self, signature):
+        for band in range(self.bands):
+            rows = array("Q", signature[band * self.rows:(band + 1) * self.rows]).tobytes()
+            # Signed, so it fits an SQLite INTEGER
+            yield band, int.from_bytes(hashlib.blake2b(rows, digest_size=8).digest(), "little", signed=True)
+
+    def find(self, scope, signature):
+        """Returns the summary of the most similar indexed chunk at or above the threshold, or None."""
+        scope = f"{self.parameters}:{scope}"
+        connection = self.connect()
+        candidates = set()
+        for band, bucket in self.buckets(signature):
+            candidates.update(row[0] for row in connection.execute(
+                "SELECT id FROM bands WHERE scope = ? AND band = ? AND bucket = ?", (scope, band, bucket)))
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            blob, summary = connection.execute(
+                "SELECT signature, summary FROM signatures WHERE id = ?", (candidate,)).fetchone()
+            score = similarity(signature, array("Q", blob))
+            if score >= best_similarity:
+                best, best_similarity = summary, score
+        return best
+
+    def add(self, scope, signature, summary):
+        scope = f"{self.parameters}:{scope}"
+        connection = self.connect()
+        with connection:
+            connection.execute("BEGIN")
+            row_id = connection.execute(
+                "INSERT INTO signatures (scope, signature, summary, created) VALUES (?, ?, ?, ?)",
+                (scope, array("Q", signature).tobytes(), str(summary), time.time())).lastrowid
+            connection.executemany(
+                "INSERT INTO bands (scope, band, bucket, id) VALUES (?, ?, ?, ?)",
+                [(scope, band, bucket, row_id) for band, bucket in self.buckets(signature)])
+
+    def summarize(self, scope, text, generate):
+        """Returns the summary of a near-duplicate of text, or generates one and indexes it.
+
+        Parameters:
+        scope (str): What the summary depends on besides the text, e.g. the model and prompt.
+        text (str): The chunk to summarize.
+        generate (callable): Returns text's summary; called only if there is no near-duplicate.
+
+        Returns:
+        tuple: (summary, duplicate), where duplicate is True if the summary was reused.
+        """
+        signature = self.signature(text)
+        if signature is None:
+            return generate(), False
+
+        with self.lock:
+            self.counters["lookups"] += 1
+            summary = self.find(scope, signature)
+            if summary is not None:
+                self.counters["duplicates"] += 1
+                return summary, True
+            # A near-duplicate being summarized right now will do as well
+            entry = next((entry for entry in self.pending if entry["scope"] == scope and
+                          similarity(signature, entry["signature"]) >= self.threshold), None)
+            owner = entry is None
+            if owner:
+                entry = {"scope": scope, "signature": signature,
+                         "done": threading.Event(), "summary": None}
+                self.pending.append(entry)
+            else:
+                self.counters["waited"] += 1
+
+        if not owner:
+            entry["done"].wait()
+            if entry["summary"] is not None:
+                with self.lock:
+                    self.counters["duplicates"] += 1
+                return entry["summary"], True
+            # The other chunk's request failed; make our own
+            return generate(), False
+
+        try:
+            entry["summary"] = generate()
+            with self.lock:
+                self.add(scope, signature, entry["summary"])
+            return entry["summary"], False
+        finally:
+            with self.lock:
+                self.pending.remove(entry)
+            entry["done"].set()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+if __name__ == "__main__":
+    # Compare two files: python near_duplicates.py a.txt b.txt
+    index = NearDuplicateIndex(db_path=":memory:")
+    first, second = (index.signature(open(path).read()) for path in sys.argv[1:3])
+    if first is None or second is None:
+        print("Too short to compare")
+    else:
+        print(f"Estimated Jaccard similarity: {similarity(first, second):.3f}")
@@ -0,0 +1,76 @@
+"""
+Token-budget packing of adjacent subsections into summary requests.
+
+Given the token cost of each subsection, pack_subsections() groups adjacent
+subsections so that every group fits the per-request budget and the number
+of groups (API calls) is as small as possible. It is a linear-time dynamic
+program over the prefix of the subsection list: best[i] is the fewest groups
+covering the first i subsections, and the candidates for the start of the
+last group form a sliding window whose minimum is kept in a deque.
+"""
+
+from collections import deque
+
+
+def pack_subsections(costs, budget):
+    """Groups adjacent items so each group's total cost fits budget, using as few groups as possible.
+
+    Parameters:
+    costs (list): The token cost of each item, in order.
+    budget (int): The maximum total cost of a group. An item costing more than
+        budget on its own is put in a group by itself.
+
+    Returns:
+    list: A list of (start, end) index ranges, one per group, covering every item in order.
+    """
+    n = len(costs)
+    if n == 0:
+        return []
+
+    best = [0] * (n + 1)
+    prev = [0] * (n + 1)
+    window = deque()
+    lo = 0
+    total = 0
+    for i in range(1, n + 1):
+        # Items [j, i) may form the last group for any j in the window [lo, i - 1]
+        j = i - 1
+        while window and best[window[-1]] >= best[j]:
+            window.pop()
+        window.append(j)
+        total += costs[i - 1]
+        while total > budget and lo < i - 1:
+            total -= costs[lo]
+            lo += 1
+        while window[0] < lo:
+            window.popleft()
+        best[i] = best[window[0]] + 1
+        prev[i] = window[0]
+
+    groups = []
+    i = n
+    while i > 0:
+        groups.append((prev[i], i))
+        i = prev[i]
+    groups.reverse()
+    return groups
+
+
+def legacy_request_count(token_counts):
+    """Counts the requests the previous greedy combine_subsections would have made.
+
+    It merged a subsection into the current group only while the subsection had
+    fewer than 1000 tokens and the group stayed under 2000 tokens.
+    """
+    requests = 0
+    current_tokens = 0
+    started = False
+    for n_tokens in token_counts:
+        if current_tokens + n_tokens < 2000 and n_tokens < 1000:
+            current_tokens += n_tokens
+        else:
+            if started:
+                requests += 1
+            current_tokens = n_tokens
+        started = True
+    return requests + 1 if started else 0
@@ -0,0 +1,84 @@
+"""
+Page-level, streaming PDF text extraction.
+
+iter_pdf_pages() yields the text of a PDF one page at a time, so callers can
+start sectioning and summarizing before the last page is parsed. With more
+than one worker, page ranges are spread across a process pool (pdfminer's
+layout analysis is CPU-bound) and the pages are still yielded in order, each
+as soon as it and every page before it are done.
+"""
+
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+
+from pdfminer.pdfpage import PDFPage
+from pdfminer.layout import LAParams
+from pdfminer.converter import TextConverter
+from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
+
+
+def count_pages(pdf_path):
+    """Returns the number of pages in a PDF without extracting any text."""
+    with open(pdf_path, 'rb') as fh:
+        return sum(1 for _ in PDFPage.get_pages(fh, check_extractable=True))
+
+
+def _iter_page_texts(fh, pagenos=None):
+    # Create a PDF resource manager object that stores shared resources
+    rsrcmgr = PDFResourceManager()
+
+    # Create a StringIO object to hold the text of the current page
+    output = StringIO()
+
+    # Create a TextConverter object to convert PDF pages to text
+    device = TextConverter(rsrcmgr, output, laparams=LAParams())
+
+    # Create a PDF page interpreter object
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+
+    try:
+        for page in PDFPage.get_pages(fh, pagenos, caching=True, check_extractable=True):
+            interpreter.process_page(page)
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+            # Replace the ^L page break with a newline
+            yield text.replace('\x0c', '\n')
+    finally:
+        device.close()
+        output.close()
+
+
+def extract_page_range(pdf_path, first, last):
+    """Extracts the text of pages first..last-1 (zero-based) of a PDF.
+
+    Returns:
+    list: The text of each page, in order.
+    """
+    with open(pdf_path, 'rb') as fh:
+        return list(_iter_page_texts(fh, set(range(first, last))))
+
+
+def iter_pdf_pages(pdf_path, workers=1, pages_per_task=2):
+    """Yields the text of each page of a PDF, in order.
+
+    Parameters:
+    pdf_path (str): The file path to the PDF file.
+    workers (int, optional): The number of processes to extract pages with. With 1,
+        pages are extracted in this process. Default is 1.
+    pages_per_task (int, optional): The number of pages each worker task extracts. Default is 2.
+
+    Yields:
+    str: The text of one page.
+    """
+    if workers <= 1:
+        with open(pdf_path, 'rb') as fh:
+            yield from _iter_page_texts(fh)
+        return
+
+    n_pages = count_pages(pdf_path)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(extract_page_range, pdf_path, first, min(first + pages_per_task, n_pages))
+                   for first in range(0, n_pages, pages_per_task)]
+        for future in futures:
+            yield from future.result()
@@ -0,0 +1,208 @@
+"""
+Per-stage profiling of summarize.py runs.
+
+The process-wide profiler records spans: a named stage, when it started, how
+long it took, and what it handled (tokens, bytes). Stages are timed with the
+span() context manager, the traced() decorator, iterate() for generators such
+as PDF page extraction, and proxies that time a tokenizer's or an artifact
+store's methods. Spans are only recorded after enable(), so an unprofiled run
+pays for little more than a flag check.
+
+write_trace() saves the spans in the Chrome trace event format, to open in
+chrome://tracing or https://ui.perfetto.dev: one row per thread, with spans
+on the same thread nested. print_summary() prints the time, call count,
+tokens and bytes of each stage. Stages nest (an API request is inside its
+generate_summary) and run on several threads at once, so their totals can
+add up to more than the run's wall time.
+
+Spans recorded in worker processes are sent back with drain() and merged
+into the parent's with merge().
+"""
+
+import os
+import json
+import time
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+
+class Traced:
+    def __init__(self, profiler, target, methods):
+        """Wrap target so that some of its methods are timed as spans.
+
+        Parameters:
+        profiler (Profiler): Where the spans are recorded.
+        target (object): The object to forward every attribute to.
+        methods (dict): (stage name, measure) by method name; see Profiler.traced().
+        """
+        self._profiler = profiler
+        self._target = target
+        self._methods = methods
+
+    def __getattr__(self, name):
+        attribute = getattr(self._target, name)
+        if name in self._methods:
+            return self._profiler.traced(*self._methods[name])(attribute)
+        return attribute
+
+    def __call__(self, *args, **kwargs):
+        return self.__getattr__("__call__")(*args, **kwargs)
+
+
+def measure_encoding(result, text, *args, **kwargs):
+    ids = result["input_ids"] if isinstance(result, dict) else result
+    return {"tokens": len(ids), "bytes": len(text)}
+
+
+def measure_read(result, path, *args, **kwargs):
+    return {"bytes": len(result)}
+
+
+def measure_write(result, path, text, *args, **kwargs):
+    return {"bytes": len(text)}
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.events = []
+        self.local = threading.local()
+        self.tokenizers = {}
+
+    def enable(self):
+        self.enabled = True
+
+    @contextmanager
+    def span(self, name, **args):
+        """Times the block as one span of stage name.
+
+        Keyword arguments (e.g. tokens=, bytes=) are recorded with it; more can be
+        added from inside the block with annotate().
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self.local.__dict__.setdefault("stack", [])
+        stack.append(args)
+        # Wall-clock start, so spans from several processes line up; perf_counter duration
+        ts = time.time_ns() // 1000
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            duration = time.perf_counter() - start
+            stack.pop()
+            event = {"name": name, "cat": "summarize", "ph": "X", "ts": ts,
+                     "dur": round(duration * 1e6, 1), "pid": os.getpid(),
+                     "tid": threading.get_ident(), "args": args}
+            with self.lock:
+                self.events.append(event)
+
+    def annotate(self, **args):
+        """Adds counts (e.g. tokens=) to the innermost open span of this thread."""
+        stack = self.local.__dict__.get("stack")
+        if self.enabled and stack:
+            for key, value in args.items():
+                stack[-1][key] = stack[-1].get(key, 0) + value
+
+    def traced(self, name, measure=None):
+        """Decorates a function so every call is a span of stage name.
+
+        Parameters:
+        name (str): The stage.
+        measure (callable, optional): Called as measure(result, *args, **kwargs); returns
+            counts to record with the span, e.g. {"bytes": len(result)}.
+        """
+        def decorate(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                with self.span(name):
+                    result = function(*args, **kwargs)
+                    if measure is not None:
+                        self.annotate(**measure(result, *args, **kwargs))
+                    return result
+            return wrapper
+        return decorate
+
+    def iterate(self, name, iterable, measure=len):
+        """Yields from iterable, timing the production of each item as a span of stage name.
+
+        measure(item) is recorded as the span's bytes.
+        """
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        while True:
+            with self.span(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                self.annotate(bytes=measure(item))
+            yield item
+
+    def wrap_tokenizer(self, enc):
+        """Returns enc with its encode() and calls timed as "tokenize" spans, if profiling."""
+        if not self.enabled:
+            return enc
+        with self.lock:
+            if id(enc) not in self.tokenizers:
+                self.tokenizers[id(enc)] = Traced(self, enc, {
+                    "encode": ("tokenize", measure_encoding),
+                    "__call__": ("tokenize", measure_encoding)})
+            return self.tokenizers[id(enc)]
+
+    def wrap_store(self, store):
+        """Returns the artifact store with its reads and writes timed, if profiling."""
+        if not self.enabled:
+            return store
+        return Traced(self, store, {"read": ("artifact_read", measure_read),
+                                    "write": ("artifact_write", measure_write)})
+
+    def drain(self):
+        """Returns and forgets the spans recorded so far, e.g. to send them to another process."""
+        with self.lock:
+            events, self.events = self.events, []
+        return events
+
+    def merge(self, events):
+        with self.lock:
+            self.events.extend(events)
+
+    def summary(self):
+        """Returns the calls, seconds, tokens and bytes of each stage, most time first."""
+        stages = {}
+        with self.lock:
+            events = list(self.events)
+        for event in events:
+            stage = stages.setdefault(event["name"], {
+                "calls": 0, "seconds": 0.0, "max_seconds": 0.0, "tokens": 0, "bytes": 0})
+            seconds = event["dur"] / 1e6
+            stage["calls"] += 1
+            stage["seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+            stage["tokens"] += event["args"].get("tokens", 0)
+            stage["bytes"] += event["args"].get("bytes", 0)
+        return dict(sorted(stages.items(), key=lambda item: -item[1]["seconds"]))
+
+    def write_trace(self, path):
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        with open(path, 'w') as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def print_summary(self):
+        print(f"{'stage':<24} {'calls':>7} {'total s':>9} {'mean ms':>9} {'max ms':>9} {'tokens':>9} {'bytes':>11}")
+        for name, stage in self.summary().items():
+            print(f"{name:<24} {stage['calls']:>7} {stage['seconds']:>9.3f} "
+                  f"{stage['seconds'] * 1000 / stage['calls']:>9.2f} {stage['max_seconds'] * 1000:>9.2f} "
+                  f"{stage['tokens']:>9} {stage['bytes']:>11}")
+
+
+# The process-wide profiler; summarize.py enables it with --profile
+profiler = Profiler()
@@ -0,0 +1,294 @@
+"""
+Rate-limited dispatch of OpenAI requests.
+
+A RequestDispatcher sits in front of every openai.Completion.create call.
+It keeps two token buckets, one for requests per minute and one for tokens
+per minute, and charges each request its estimated prompt plus completion
+tokens before sending it. Requests wait in a first-come, first-served queue
+until both buckets hold enough and a concurrency slot is free. When the
+response reports its usage, the estimate is corrected. Rate-limit (429) and
+server (5xx) errors are retried with jittered exponential backoff, honouring
+Retry-After when the server sends it.
+
+shared_dispatcher() returns one dispatcher per process. summarize.py,
+_services/GptService.py, Leo's GptService and CliService.py all use it, so
+their requests are budgeted together. Its limits come from OPENAI_RPM,
+OPENAI_TPM, OPENAI_MAX_RETRIES and OPENAI_CONCURRENCY.
+"""
+
+import os
+import time
+import random
+import threading
+from collections import deque
+
+# Exceptions of the openai package worth retrying, by class name, so this
+# module doesn't need to import openai
+RETRYABLE_ERRORS = {"RateLimitError", "ServiceUnavailableError",
+                    "APIConnectionError", "Timeout", "TryAgain"}
+# Rate-limit errors that waiting won't fix
+FATAL_ERROR_CODES = {"insufficient_quota"}
+
+
+def estimate_tokens(text):
+    """Estimates the token count of text without a tokenizer (about 4 characters per token)."""
+    return len(text) // 4 + 1
+
+
+def is_retryable(error):
+    """Returns True if a failed request should be retried."""
+    if getattr(error, "code", None) in FATAL_ERROR_CODES:
+        return False
+    status = getattr(error, "http_status", None)
+    if status == 429 or (status is not None and status >= 500):
+        return True
+    return type(error).__name__ in RETRYABLE_ERRORS
+
+
+def retry_after(error):
+    """Returns the Retry-After delay sent with an error, in seconds, or None."""
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, capacity, refill_per_second):
+        """Create a full bucket.
+
+        Parameters:
+        capacity (float): The most the bucket holds.
+        refill_per_second (float): How fast the bucket refills.
+        """
+        self.capacity = float(capacity)
+        self.rate = float(refill_per_second)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level +
+                         (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """Returns how long to wait until amount can be taken."""
+        self.refill(now)
+        # A request bigger than the bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount, now):
+        self.refill(now)
+        self.level -= min(amount, self.capacity)
+
+    def give(self, amount):
+        """Returns (or, if negative, charges) amount to the bucket."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class RequestDispatcher:
+    def __init__(self, rpm=3000, tpm=250000, max_concurrency=8, max_retries=6, base_delay=1.0, max_delay=60.0):
+        """Create a dispatcher.
+
+        Parameters:
+        rpm (int, optional): Requests per minute. Default is 3000.
+        tpm (int, optional): Prompt plus completion tokens per minute. Default is 250000.
+        max_concurrency (int, optional): Requests in flight at once. Default is 8.
+        max_retries (int, optional): Retries of a rate-limited or failed request. Default is 6.
+        base_delay (float, optional): The first backoff ceiling, in seconds. Default is 1.
+        max_delay (float, optional): The largest backoff ceiling, in seconds. Default is 60.
+        """
+        self.requests = TokenBucket(rpm, rpm / 60.0)
+        self.tokens = TokenBucket(tpm, tpm / 60.0)
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.condition = threading.Condition()
+        self.queue = deque()
+        self.in_flight = 0
+        self.stats = {
+            "requests": 0,
+            "completed": 0,
+            "failed": 0,
+            "retries": 0,
+            "max_queue_depth": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "estimated_tokens": 0,
+            "used_tokens": 0,
+        }
+
+    @staticmethod
+    def build(**kwargs):
+        """Builds a dispatcher from OPENAI_RPM, OPENAI_TPM, OPENAI_MAX_RETRIES and
+        OPENAI_CONCURRENCY, with keyword arguments taking precedence."""
+        settings = {
+            "rpm": int(os.getenv("OPENAI_RPM", "3000")),
+            "tpm": int(os.getenv("OPENAI_TPM", "250000")),
+            "max_retries": int(os.getenv("OPENAI_MAX_RETRIES", "6")),
+            "max_concurrency": int(os.getenv("OPENAI_CONCURRENCY", "8")),
+        }
+        settings.update(kwargs)
+        return RequestDispatcher(**settings)
+
+    def acquire(self, tokens):
+        """Waits in line until a request costing tokens may be sent.
+
+        Returns:
+        float: The time spent waiting, in seconds.
+        """
+        start = time.monotonic()
+        waiter = object()
+        with self.condition:
+            self.queue.append(waiter)
+            self.stats["max_queue_depth"] = max(
+                self.stats["max_queue_depth"], len(self.queue))
+            try:
+                while True:
+                    if self.queue[0] is waiter and self.in_flight < self.max_concurrency:
+                        now = time.monotonic()
+                        delay = max(self.requests.delay(1, now),
+                                    self.tokens.delay(tokens, now))
+                        if delay <= 0:
+                            self.requests.take(1, now)
+                            self.tokens.take(tokens, now)
+                            self.in_flight += 1
+                            break
+                        self.condition.wait(delay)
+                    else:
+                        self.condition.wait()
+            finally:
+                self.queue.remove(waiter)
+                self.condition.notify_all()
+
+            waited = time.monotonic() - start
+            self.stats["requests"] += 1
+            self.stats["estimated_tokens"] += tokens
+            self.stats["total_wait_seconds"] += waited
+            self.stats["max_wait_seconds"] = max(
+                self.stats["max_wait_seconds"], waited)
+        return waited
+
+    def release(self, estimated_tokens, used_tokens):
+        """Frees the request's slot and corrects its token charge to what it used."""
+        with self.condition:
+            self.in_flight -= 1
+            self.tokens.give(estimated_tokens - used_tokens)
+            self.stats["used_tokens"] += used_tokens
+            self.condition.notify_all()
+
+    def backoff(self, attempt, error):
+        """Returns how long to wait before retry number attempt (from 0)."""
+        delay = random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        server_delay = retry_after(error)
+        if server_delay is not None:
+            delay = max(delay, server_delay)
+        return delay
+
+    def call(self, fn, *args, estimated_tokens=None, call_stats=None, **kwargs):
+        """Calls fn(*args, **kwargs) once the rate limits allow, retrying retryable errors.
+
+        Parameters:
+        fn (callable): The request, e.g. openai.Completion.create.
+        estimated_tokens (int, optional): The request's prompt plus completion tokens.
+            Defaults to an estimate from the prompt and max_tokens keyword arguments.
+        call_stats (dict, optional): Filled in with this call's wait_seconds (time spent
+            queued, over all attempts) and retries.
+
+        With stream=True, the returned stream holds the request's slot until it is read
+        to the end or closed, and its token charge is then settled from the text streamed.
+
+        Returns:
+        object: Whatever fn returns.
+        """
+        if estimated_tokens is None:
+            estimated_tokens = estimate_tokens(
+                str(kwargs.get("prompt", ""))) + kwargs.get("max_tokens", 0)
+
+        if call_stats is None:
+            call_stats = {}
+        call_stats.update(wait_seconds=0.0, retries=0)
+
+        attempt = 0
+        while True:
+            call_stats["wait_seconds"] += self.acquire(estimated_tokens)
+            try:
+                response = fn(*args, **kwargs)
+            except Exception as e:
+                # The request may have counted against the limits; keep the charge
+                self.release(estimated_tokens, estimated_tokens)
+                if attempt >= self.max_retries or not is_retryable(e):
+                    with self.condition:
+                        self.stats["failed"] += 1
+                    raise
+                delay = self.backoff(attempt, e)
+                attempt += 1
+                call_stats["retries"] = attempt
+                with self.condition:
+                    self.stats["retries"] += 1
+                print(
+                    f"Request failed ({type(e).__name__}), retry {attempt} of {self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+
+            with self.condition:
+                self.stats["completed"] += 1
+            if kwargs.get("stream"):
+                return self.held_stream(response, estimated_tokens, estimate_tokens(str(kwargs.get("prompt", ""))))
+            self.release(estimated_tokens,
+                         self.used_tokens(response, estimated_tokens))
+            return response
+
+    def held_stream(self, events, estimated_tokens, prompt_tokens):
+        # The request is in flight until its last event arrives, so its slot is released only then
+        parts = []
+        try:
+            for event in events:
+                parts.append(event["choices"][0]["text"])
+                yield event
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                close()
+            self.release(estimated_tokens, prompt_tokens + estimate_tokens("".join(parts)))
+
+    @staticmethod
+    def used_tokens(response, estimated_tokens):
+        try:
+            return int(response["usage"]["total_tokens"])
+        except (KeyError, TypeError, ValueError):
+            return estimated_tokens
+
+    def metrics(self):
+        """Returns the dispatcher's counters, current queue depth and wait times."""
+        with self.condition:
+            metrics = dict(self.stats)
+            metrics["queue_depth"] = len(self.queue)
+            metrics["in_flight"] = self.in_flight
+        metrics["mean_wait_seconds"] = (
+            metrics["total_wait_seconds"] / metrics["requests"] if metrics["requests"] else 0.0)
+        return metrics
+
+
+_shared_dispatcher = None
+_shared_lock = threading.Lock()
+
+
+def shared_dispatcher(**kwargs):
+    """Returns the process-wide dispatcher, building it on first use.
+
+    Keyword arguments (see RequestDispatcher.build) only take effect on the
+    call that builds it.
+    """
+    global _shared_dispatcher
+    with _shared_lock:
+        if _shared_dispatcher is None:
+            _shared_dispatcher = RequestDispatcher.build(**kwargs)
+        return _shared_dispatcher
@@ -0,0 +1,209 @@
+"""
+Writing streamed completions to the console, files and sockets.
+
+A StreamWriter reads a streamed completion on a background thread and hands
+the text to one or more sinks. Chunks are collected in a list (joined once at
+the end, not concatenated per token) and written to the sinks in batches,
+once flush_bytes have accumulated or flush_seconds have passed, so a long
+generation doesn't flood the terminal with one write per token. Between the
+reader and the sinks is a bounded queue: if the sinks fall behind, reading
+pauses instead of buffering without limit.
+
+A stream can be cancelled with StreamWriter.cancel() or by setting a
+StopSignal passed to pump(). Either wakes the writer at once; it stops reading,
+closes the stream and returns the text so far. A plain threading.Event also
+works, but is only checked as text arrives.
+"""
+
+import sys
+import time
+import queue
+import threading
+
+DONE = object()
+
+
+class StopSignal(threading.Event):
+    """A threading.Event that calls its callbacks when set, so nothing has to poll it."""
+
+    def __init__(self):
+        super().__init__()
+        self.callbacks = []
+        self.callbacks_lock = threading.Lock()
+
+    def add_callback(self, callback):
+        """Calls callback() when the signal is set, or now if it already is."""
+        with self.callbacks_lock:
+            if not self.is_set():
+                self.callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback):
+        with self.callbacks_lock:
+            if callback in self.callbacks:
+                self.callbacks.remove(callback)
+
+    def set(self):
+        super().set()
+        with self.callbacks_lock:
+            callbacks, self.callbacks = self.callbacks, []
+        for callback in callbacks:
+            callback()
+
+
+class ConsoleSink:
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, text):
+        self.stream.write(text)
+        self.stream.flush()
+
+    def close(self):
+        pass
+
+
+class FileSink:
+    def __init__(self, file):
+        """Create a sink that writes to file, a path (opened for appending) or an open file."""
+        self.owned = isinstance(file, str)
+        self.file = open(file, 'a') if self.owned else file
+
+    def write(self, text):
+        self.file.write(text)
+        self.file.flush()
+
+    def close(self):
+        if self.owned:
+            self.file.close()
+
+
+class SocketSink:
+    def __init__(self, sock, encoding="utf-8"):
+        self.sock = sock
+        self.encoding = encoding
+
+    def write(self, text):
+        self.sock.sendall(text.encode(self.encoding))
+
+    def close(self):
+        pass
+
+
+class StreamWriter:
+    def __init__(self, sinks=(), flush_bytes=1024, flush_seconds=0.1, max_pending=256):
+        """Create a writer.
+
+        Parameters:
+        sinks (iterable, optional): Objects with write(text) and close() methods, e.g.
+            ConsoleSink, FileSink or SocketSink. Every sink gets all of the text.
+        flush_bytes (int, optional): Write to the sinks once this much text is waiting. Default is 1024.
+        flush_seconds (float, optional): Write to the sinks at least this often while text is
+            waiting. Default is 0.1.
+        max_pending (int, optional): Chunks read ahead of the sinks before reading pauses. Default is 256.
+        """
+        self.sinks = list(sinks)
+        self.flush_bytes = flush_bytes
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.queue = None
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        """Stops the stream being pumped; pump() returns the text read so far."""
+        self.cancelled.set()
+        if self.queue is not None:
+            try:
+                # Wake pump() even if the reader is stalled
+                self.queue.put_nowait(DONE)
+            except queue.Full:
+                pass
+
+    def read(self, events, chunks, cancelled):
+        try:
+            for event in events:
+                text = event["choices"][0]["text"]
+                while not cancelled.is_set():
+                    try:
+                        chunks.put(text, timeout=self.flush_seconds)
+                        break
+                    except queue.Full:
+                        continue
+                if cancelled.is_set():
+                    break
+        finally:
+            close = getattr(events, "close", None)
+            if close is not None:
+                # Drops the connection of a stream that was cancelled
+                close()
+            try:
+                chunks.put_nowait(DONE)
+            except queue.Full:
+                pass
+
+    def write(self, text):
+        for sink in list(self.sinks):
+            try:
+                sink.write(text)
+            except Exception as e:
+                # A failed consumer (e.g. a closed socket) shouldn't stop the others
+                print(f"Dropping stream sink {type(sink).__name__}: {e!r}", file=sys.stderr)
+                self.sinks.remove(sink)
+
+    def pump(self, events, stop_event=None):
+        """Reads a streamed completion and writes it to the sinks.
+
+        Parameters:
+        events (iterable): Completion events, each with choices[0]["text"].
+        stop_event (threading.Event, optional): Cancels the stream when set.
+
+        Returns:
+        str: The text of the completion, or as much as was read before it was cancelled.
+        """
+        # Fresh state per stream, so the reader of a cancelled stream can't feed the next one
+        self.queue = queue.Queue(maxsize=self.max_pending)
+        self.cancelled = threading.Event()
+        if stop_event is not None and hasattr(stop_event, "add_callback"):
+            stop_event.add_callback(self.cancel)
+        reader = threading.Thread(
+            target=self.read, args=(events, self.queue, self.cancelled), daemon=True)
+        reader.start()
+
+        parts = []
+        pending = []
+        pending_bytes = 0
+        last_flush = time.monotonic()
+        try:
+            while not self.cancelled.is_set():
+                timeout = None
+                if pending:
+                    timeout = max(0.0, last_flush + self.flush_seconds - time.monotonic())
+                try:
+                    text = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    text = None
+                if text is DONE:
+                    break
+                if text is not None:
+                    parts.append(text)
+                    pending.append(text)
+                    pending_bytes += len(text)
+                    if stop_event is not None and stop_event.is_set():
+                        self.cancel()
+                if pending and (pending_bytes >= self.flush_bytes or
+                                time.monotonic() - last_flush >= self.flush_seconds):
+                    self.write("".join(pending))
+                    pending = []
+                    pending_bytes = 0
+                    last_flush = time.monotonic()
+        finally:
+            if pending:
+                self.write("".join(pending))
+            if stop_event is not None and hasattr(stop_event, "remove_callback"):
+                stop_event.remove_callback(self.cancel)
+        return "".join(parts)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
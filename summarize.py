@@ -10,117 +10,182 @@ where each tuple contains a section header and the corresponding text. The
 split_section_into_subsections() function takes in a section header, the
 corresponding text, and an encoder object and splits the section into smaller
 parts, each of which is returned as a tuple containing a subsection header and
-the corresponding text. The split_subsection_into_paragraphs() function takes
+the corresponding text. The split_subsection_into_chunks() function takes
 in a subsection header, the corresponding text, the encoder object, and a
-maximum number of tokens and splits the subsection into smaller parts, each of
-which is returned as a tuple containing a paragraph header and the
-corresponding text.
+maximum number of tokens and splits the subsection into parts of at most that
+many tokens, cutting at paragraph, sentence or word boundaries, each of which
+is returned as a tuple containing the subsection header and the corresponding
+text.
 
 This script was written by ChatGPT with direction by Scott Leibrand,
 then edited by Scott Leibrand w/ CoPilot and ChatGPT.
 """
 
-import html2text
-from pdfminer.pdfpage import PDFPage
-from pdfminer.layout import LAParams
-from pdfminer.converter import TextConverter
-from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
-from io import StringIO
-from transformers import GPT2TokenizerFast
 import sys
 import re
 import os
-import openai
-import glob
+import io
+import argparse
 from dotenv import load_dotenv
+from summary_engine import SummaryEngine
+from summary_cache import SummaryCache, cache_key
+from tokenization import TokenizedText, as_tokenized, count_tokens, load_tokenizer
+from chunker import chunk_text
+from packing import pack_subsections, legacy_request_count
+from summary_tree import SummaryTree
+from manifest import DocumentManifest, PreviousSummaries, content_hash
+from artifact_store import FileStore, open_store
+from near_duplicates import NearDuplicateIndex
+from compressor import Compressor, parse_ratios
+from profiler import profiler
+from rate_limiter import shared_dispatcher
+from llm_client import llm_client
+
+# html2text, pdfminer, openai and transformers are slow to import, so they are
+# imported only once the input actually needs them
 
 load_dotenv()  # This will load the environment variables from the .env file
 
 
 # import tiktoken
 
-
-def extract_text_from_pdf(pdf_path):
+# Prompt templates; {content} is filled in with the text being summarized
+SUBSECTION_PROMPT = "Please provide a detailed summary of the following section, but if the section content is mostly website context/description, just return 'Section has no content':\n{content}\nPlease provide a detailed summary of the section above. If the section content is mostly website context/description, just return 'Section has no content'.{output_language_prompt}"
+SECTION_PROMPT = "Please provide a detailed summary of the following sections:\n{content}\nPlease provide a detailed summary of the sections above.{output_language_prompt}"
+OVERALL_PROMPT = "Please provide a detailed summary of the following {doctype}, based on its abstract and summaries of each section:\n{content}\nPlease provide a detailed summary of the {doctype} described above, based on the provided abstract/introduction and summaries of each section.{output_language_prompt}"
+# Names each kind of request in the completion telemetry
+PROMPT_LABELS = {SUBSECTION_PROMPT: "subsection", SECTION_PROMPT: "section"}
+# What SUBSECTION_PROMPT asks for when a section is only website boilerplate
+NO_CONTENT_SUMMARY = "Section has no content"
+
+# The "References" section, which is dropped along with everything after it
+REFERENCES_PATTERN = re.compile(r'(\n\nReferences[^\n]*)\n')
+# Section headers that start with a number followed by a period or colon,
+# or markdown-style headers that start with one to six hash marks followed by a space
+SECTION_PATTERN = re.compile(r'\n\n(#+\s+[^\n]+|\d+[\.:]\s+[^\n]+)\n\n')
+
+# Content-addressed cache consulted by generate_summary(); set up in __main__
+summary_cache = None
+# Number of nodes of one summary tree level reduced at once; set from --concurrency
+tree_concurrency = 8
+# Whether section and overall reductions are persisted and reused; off with --no-cache
+persist_tree_nodes = True
+# Where chunks, summaries and manifests are kept: files, or a SQLite store set from --store
+artifact_store = FileStore()
+# Near-duplicate chunk index, set up from --dedup; near_duplicate_action is "reuse" or "skip"
+near_duplicates = None
+near_duplicate_action = "reuse"
+# Extractive pre-compression of chunks before they are summarized; set up from --compress
+compressor = None
+
+
+@profiler.traced("extract_text_from_pdf", lambda text, *args, **kwargs: {"bytes": len(text)})
+def extract_text_from_pdf(pdf_path, workers=1):
     """Extracts the text from a PDF file and returns it as a string.
 
     Parameters:
     pdf_path (str): The file path to the PDF file.
+    workers (int, optional): The number of processes to extract pages with. Default is 1.
 
     Returns:
     str: The extracted text.
     """
-    with open(pdf_path, 'rb') as fh:
-        # Create a PDF resource manager object that stores shared resources
-        rsrcmgr = PDFResourceManager()
+    from pdf_extract import iter_pdf_pages
+    return "".join(iter_pdf_pages(pdf_path, workers))
 
-        # Create a StringIO object to store the extracted text
-        output = StringIO()
 
-        # Create a TextConverter object to convert PDF pages to text
-        device = TextConverter(rsrcmgr, output, laparams=LAParams())
+@profiler.traced("split_into_sections", lambda sections, text: {"bytes": len(text)})
+def split_into_sections(text):
+    """Splits a string of text into a list of tuples, where each tuple contains a section header and the corresponding text.
 
-        # Create a PDF page interpreter object
-        interpreter = PDFPageInterpreter(rsrcmgr, device)
+    Parameters:
+    text (str): The input text to split into sections. If it is a TokenizedText,
+        each section is returned as a TokenizedText slice of it.
 
-        # Process each page contained in the PDF document
-        for page in PDFPage.get_pages(fh, caching=True, check_extractable=True):
-            interpreter.process_page(page)
+    Returns:
+    list: A list of tuples, where each tuple contains a section header and the corresponding text.
+    """
+    # Use a regular expression to match the "References" section
+    match = REFERENCES_PATTERN.search(text)
+    end = match.start() if match else len(text)
 
-        # Get the extracted text as a string and close the StringIO object
-        text = output.getvalue()
-        output.close()
+    # Split the text into sections, ignoring the "References" section and everything that follows
+    sections = split_on_headers(text, SECTION_PATTERN, "Title-Abstract", end)
+    print("Found", 2 * len(sections) - 1, "sections.")
 
-        # Close the PDF file and text converter objects
-        device.close()
+    return sections
 
-    # Remove ^L page breaks from the text
-    text = text.replace('\x0c', '\n')
 
-    return text
+def iter_sections(text_chunks):
+    """Splits text that arrives in pieces (e.g. PDF pages) into sections, yielding each
+    section as soon as the header of the next one has been seen.
 
+    The sections are the same as split_into_sections() would return for the
+    concatenated text.
 
-def split_into_sections(text):
-    """Splits a string of text into a list of tuples, where each tuple contains a section header and the corresponding text.
+    Parameters:
+    text_chunks (iterable): The pieces of the text, in order.
+
+    Yields:
+    tuple: A section header and the corresponding text.
+    """
+    header = "Title-Abstract"
+    buffer = ""
+    for chunk in text_chunks:
+        # Find the sections this piece completes, then yield them outside the span
+        with profiler.span("split_into_sections", bytes=len(chunk)):
+            buffer += chunk
+            # Stop at the "References" section, if it has arrived
+            match = REFERENCES_PATTERN.search(buffer)
+            end = match.start() if match else len(buffer)
+            start = 0
+            sections = []
+            for section_match in SECTION_PATTERN.finditer(buffer, 0, end):
+                sections.append((header, buffer[start:section_match.start()]))
+                header = section_match.group(1)
+                start = section_match.end()
+            buffer = buffer[start:end] if match else buffer[start:]
+        yield from sections
+        if match:
+            break
+    yield header, buffer
+
+
+def split_on_headers(text, pattern, first_header, end=None):
+    """Splits text on the headers matched by pattern, without copying its tokens.
 
     Parameters:
-    text (str): The input text to split into sections.
+    text (str): The text to split. If it is a TokenizedText, each part is a slice of it.
+    pattern (re.Pattern): A compiled pattern whose first group is the header.
+    first_header (str): The header of the text preceding the first match.
+    end (int, optional): The character position at which to stop. Default is the end of text.
 
     Returns:
-    list: A list of tuples, where each tuple contains a section header and the corresponding text.
+    list: A list of (header, content) tuples.
     """
-    # Use a regular expression to match the "References" section
-    pattern = r'(\n\nReferences[^\n]*)\n'
-    match = re.search(pattern, text)
-    if match:
-        # Remove the "References" section and everything that follows
-        text = text[:match.start()]
-
-    # Use a regular expression to split the text into sections
-    # pattern = r'\n\n(\d+[\.:]\s+[^\n]+)\n\n'
-    # Match section headers that start with a number followed by a period or colon,
-    # or markdown-style headers that start with one to six hash marks followed by a space
-    pattern = r'\n\n(#+\s+[^\n]+|\d+[\.:]\s+[^\n]+)\n\n'
-    sections = re.split(pattern, text)
-    print("Found", len(sections), "sections.")
-
-    # Extract the section headers and their corresponding text
-    headers = ["Title-Abstract"]
-    content = []
-    for i, section in enumerate(sections):
-        if i % 2 == 0:
-            # This is a section of content
-            content.append(section)
-        else:
-            # This is a section header
-            headers.append(section)
-            # print(section)
+    if end is None:
+        end = len(text)
+    parts = []
+    header = first_header
+    start = 0
+    for match in pattern.finditer(text, 0, end):
+        parts.append((header, slice_text(text, start, match.start())))
+        header = match.group(1)
+        start = match.end()
+    parts.append((header, slice_text(text, start, end)))
+    return parts
 
-    # Zip the section headers and content together
-    sections = list(zip(headers, content))
 
-    # print(headers)
+def slice_text(text, start, end):
+    """Returns text[start:end], keeping the tokens if text is a TokenizedText."""
+    if isinstance(text, TokenizedText):
+        return text.slice_chars(start, end)
+    return text[start:end]
 
-    return sections
+
+def header_cost(header, enc):
+    """Returns the tokens a subsection's header adds to a request, as combine_subsections() counts them."""
+    return TokenizedText.from_text(enc, "\n\n" + header + "\n").token_count
 
 
 def split_section_into_subsections(section_header, section_content, enc, max_tokens=3000):
@@ -129,165 +194,114 @@ def split_section_into_subsections(section_header, section_content, enc, max_tok
 
     Parameters:
     section_header (str): The header for the section to be split.
-    section_content (str): The content of the section to be split.
+    section_content (str): The content of the section to be split. If it is not
+        already a TokenizedText, it is encoded once here.
     enc (object): An encoder object used to encode the section content as a sequence of tokens.
-    max_tokens (int, optional): The maximum number of tokens allowed in each subsection. Default is 3000.
+    max_tokens (int, optional): The maximum number of tokens allowed in each subsection, its header
+        included. Default is 3000.
 
     Returns:
-    list: A list of tuples, where each tuple contains a subsection header and the corresponding text.
+    list: A list of tuples, where each tuple contains a subsection header and the corresponding TokenizedText.
     """
-    # Encode the section content as a sequence of tokens
-    tokens = enc.encode(section_content)
+    # Encode the section content as a sequence of tokens, unless it already is
+    section_content = as_tokenized(section_content, enc)
 
-    if len(tokens) <= max_tokens:
+    if section_content.token_count + header_cost(section_header, enc) <= max_tokens:
         # The section does not need to be split into subsections
         return [(section_header, section_content)]
 
     # Split the section into numbered subsections
-    pattern = r'\n\n(\d+\.\d+[\.:]\s+[^\n]+)\n\n'
-    subsections = re.split(pattern, section_content)
-
-    # Extract the subsection headers and their corresponding text
-    headers = [f"{section_header.split('.')[0]}. Section intro"]
-    content = []
-    for i, subsection in enumerate(subsections):
-        if i % 2 == 0:
-            # This is a subsection of content
-            content.append(subsection)
-        else:
-            # This is a subsection header
-            headers.append(subsection)
-
-    # Zip the subsection headers and content together
-    subsections = list(zip(headers, content))
+    pattern = re.compile(r'\n\n(\d+\.\d+[\.:]\s+[^\n]+)\n\n')
+    subsections = split_on_headers(
+        section_content, pattern, f"{section_header.split('.')[0]}. Section intro")
 
-    # Split any subsections that are still too long into smaller parts
+    # Split any subsections that are still too long into smaller parts, leaving
+    # room for the header each part is sent with
     result = []
     for header, content in subsections:
-        parts = split_subsection_into_paragraphs(
-            header, content, enc, max_tokens)
+        parts = split_subsection_into_chunks(
+            header, content, enc, max(1, max_tokens - header_cost(header, enc)))
         result.extend(parts)
 
     return result
 
 
-def split_subsection_into_parts_broken(subsection_header, subsection_content, enc, max_tokens=3000):
-    # Encode the subsection content as a sequence of tokens
-    tokens = enc.encode(subsection_content)
-
-    if len(tokens) <= max_tokens:
-        # The subsection does not need to be split into parts
-        return [(subsection_header, subsection_content)]
-
-    # Split the subsection into parts
-    start = 0
-    parts = []
-    while start < len(tokens):
-        # Calculate the size of the next part
-        end = start + max_tokens
-
-        # Find the nearest newline boundary within the part
-        print(enc)
-        while end < len(tokens) and tokens[end] != enc.encoder['\n']:
-            end += 1
-
-        # Extract the part
-        part_tokens = tokens[start:end]
-        part_content = enc.decode(part_tokens)
-
-        # Add the part to the list of parts
-        parts.append((subsection_header, part_content))
-
-        # Update the start index
-        start = end + 1
-
-    return parts
-
-
-def split_subsection_into_paragraphs(subsection_header, subsection_content, enc, max_tokens=3000):
-    # Encode the subsection content as a sequence of tokens
-    tokens = enc.encode(subsection_content)
+def split_subsection_into_chunks(subsection_header, subsection_content, enc, max_tokens=3000):
+    """Splits a subsection into parts of at most max_tokens tokens, cutting at
+    paragraph breaks where possible, then at sentence ends, then between words.
 
-    if len(tokens) <= max_tokens:
-        # The subsection does not need to be split into parts
-        return [(subsection_header, subsection_content)]
-
-    # Split the subsection into parts
-    start = 0
-    parts = []
-    while start < len(tokens):
-        # Calculate the size of the next part
-        end = start + max_tokens
-
-        # Find the nearest newline boundary within the part
-        newline_pos = subsection_content[start:end].find('\n\n')
-        if newline_pos != -1:
-            end = start + newline_pos
+    Parameters:
+    subsection_header (str): The header for the subsection to be split.
+    subsection_content (str): The content of the subsection to be split.
+    enc (object): An encoder object, used only if subsection_content is not already a TokenizedText.
+    max_tokens (int, optional): The maximum number of tokens allowed in each part. Default is 3000.
 
-        # Extract the part
-        part_tokens = tokens[start:end]
-        part_content = enc.decode(part_tokens)
+    Returns:
+    list: A list of tuples, where each tuple contains the subsection header and the corresponding TokenizedText.
+    """
+    chunks = chunk_text(subsection_content, enc, max_tokens)
+    return [(subsection_header, chunk) for chunk in chunks]
 
-        # Add the part to the list of parts
-        parts.append((subsection_header, part_content))
 
-        # Update the start index
-        start = end + 2
+def combine_subsections(subsections, enc, max_tokens=3000):
+    """Combines adjacent subsections into as few requests as fit max_tokens each.
 
-    return parts
+    Parameters:
+    subsections (list): A list of (header, content) tuples, in order.
+    enc (object): An encoder object, used for the headers and for any content that is not a TokenizedText.
+    max_tokens (int, optional): The token budget of each combined subsection, headers included. Default is 3000.
 
+    Returns:
+    list: A list of (header, TokenizedText) tuples, one per combined subsection.
+    """
+    # Reuse each subsection's tokens, and count every header as if it had to be
+    # repeated, so no combined subsection can go over budget
+    contents = [as_tokenized(content, enc) for _, content in subsections]
+    header_lines = [TokenizedText.from_text(enc, "\n\n" + header + "\n")
+                    for header, _ in subsections]
+    costs = [content.token_count + header_line.token_count
+             for content, header_line in zip(contents, header_lines)]
 
-def combine_subsections(subsections):
-    # Initialize the list of combined subsections
     combined_subsections = []
+    for start, end in pack_subsections(costs, max_tokens):
+        # Keep the group's header on top, and the header of every subsection that differs from it
+        current_subsection_header = subsections[start][0]
+        parts = [TokenizedText.from_text(enc, current_subsection_header + "\n")]
+        for i in range(start, end):
+            if i > start and subsections[i][0] != current_subsection_header:
+                parts.append(header_lines[i])
+            parts.append(contents[i])
+        combined_subsections.append(
+            (current_subsection_header, TokenizedText.concat(parts)))
 
-    # Initialize the current combined subsection
-    current_subsection_header = ""
-    current_subsection_content = ""
-    current_subsection_tokens = 0
-
-    # Iterate through the subsections
-    for header, content in subsections:
-        # Encode the content as a sequence of tokens
-        tokens = enc.encode(content)
-
-        # If the current combined subsection has less than 1000 tokens and the current subsection has less than 1000 tokens, combine them
-        if current_subsection_tokens + len(tokens) < 2000 and len(tokens) < 1000:
-            # Update the current combined subsection header
-            if current_subsection_header == "":
-                current_subsection_header = header
-                current_subsection_content = header + "\n"
-            else:
-                if current_subsection_header != header:
-                    current_subsection_content += "\n\n" + header + "\n"
-                # current_subsection_header += header
-
-            # Update the current combined subsection content
-            current_subsection_content += content
-
-            # Update the current combined subsection token count
-            current_subsection_tokens += len(tokens)
-        else:
-            # Add the current combined subsection to the list of combined subsections
-            combined_subsections.append(
-                (current_subsection_header, current_subsection_content))
-
-            # Reset the current combined subsection
-            current_subsection_header = header
-            current_subsection_content = header + "\n" + content
-            current_subsection_tokens = len(tokens)
+    return combined_subsections
 
-    # Add the final combined subsection to the list of combined subsections
-    combined_subsections.append(
-        (current_subsection_header, current_subsection_content))
 
-    return combined_subsections
+@profiler.traced("generate_summary")
+def generate_summary(content, prompt, model_engine="text-davinci-003", max_tokens=3000, prompt_template=None, output_language_prompt="", cache=None):
+    """Generates a summary with the OpenAI Completions API, reusing a cached one if available.
 
+    Parameters:
+    content (str): The text being summarized.
+    prompt (str): The full prompt sent to the model.
+    model_engine (str, optional): The model to use. Default is "text-davinci-003".
+    max_tokens (int, optional): Unused; the completion length is set from the model.
+    prompt_template (str, optional): The template prompt was built from; used for the cache key.
+    output_language_prompt (str, optional): The language instructions in the prompt; used for the cache key.
+    cache (SummaryCache, optional): The cache to consult. Defaults to the module's summary_cache.
 
-def generate_summary(content, prompt, model_engine="text-davinci-003", max_tokens=3000):
-    # Get the API key from the environment variable
-    api_key = os.getenv("GPT_SECRET_KEY")
-    openai.api_key = api_key
+    Returns:
+    str: The generated summary.
+    """
+    if cache is None:
+        cache = summary_cache
+    if cache is not None:
+        key = cache_key(model_engine, prompt_template or prompt,
+                        content, output_language_prompt)
+        summary = cache.get(key)
+        if summary is not None:
+            profiler.annotate(cached=1)
+            return summary
 
     # Set the model to use, if not specified
     if model_engine is None:
@@ -302,21 +316,40 @@ def generate_summary(content, prompt, model_engine="text-davinci-003", max_token
     else:
         max_tokens = 500
 
-    # Generate completions
-    completions = openai.Completion.create(
-        engine=model_engine,
-        prompt=prompt,
-        max_tokens=max_tokens,
-        temperature=temperature
-    )
+    # Generate completions once the shared rate limits allow, retrying 429s and 5xx errors
+    with profiler.span("api_request", bytes=len(prompt)):
+        completions = llm_client().complete(
+            prompt,
+            model_engine,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            label=PROMPT_LABELS.get(prompt_template, "overall")
+        )
+        usage = completions.get("usage") or {}
+        profiler.annotate(tokens=usage.get("total_tokens", 0))
 
     # Get the summary from the first completion
     summary = completions.choices[0].text
 
+    if cache is not None:
+        cache.put(key, summary)
+
     return summary
 
 
+def summary_settings(model_engine, output_language_prompt="", compression=None):
+    """Returns what a chunk's summary depends on besides its content; recorded in the manifest."""
+    settings = {"model": model_engine, "prompt": content_hash(SUBSECTION_PROMPT),
+                "language": output_language_prompt}
+    if compression is not None:
+        settings["compression"] = compression.settings()
+    return settings
+
+
+@profiler.traced("extract_text_from_html", lambda text, html_path: {"bytes": len(text)})
 def extract_text_from_html(html_path):
+    import html2text
+
     # Read the HTML file
     with open(html_path, "r") as html_file:
         html = html_file.read()
@@ -327,9 +360,14 @@ def extract_text_from_html(html_path):
     return text
 
 
-def create_html_file(basename, url):
-    # Create the HTML file
-    html_file = open(basename + ".summary.html", "w")
+@profiler.traced("create_html_file")
+def create_html_file(basename, url, manifest=None):
+    # Read the summary files from the document's manifest
+    if manifest is None:
+        manifest = DocumentManifest.load(basename, artifact_store)
+
+    # Build the HTML page, then write it to the artifact store
+    html_file = io.StringIO()
 
     # Strip the path from the basename to get the filename
     filename = os.path.basename(basename)
@@ -348,26 +386,25 @@ def create_html_file(basename, url):
 
     # Write the overall summary section
     html_file.write("<h2>Overall Summary</h2>\n")
-    overall_summary_file = open(basename + ".overall_summary.txt", "r")
-    overall_summary_content = overall_summary_file.read()
+    overall_summary_content = artifact_store.read(
+        manifest.data["overall_summary_path"])
     html_file.write("<p>" + overall_summary_content + "</p>\n")
-    overall_summary_file.close()
 
     # Write the subsection summary section
     html_file.write("<h2>Subsection Summary</h2>\n")
-    subsection_summary_files = glob.glob(basename + ".*.summary.txt")
-    subsection_summary_files.sort()
+    subsection_summary_files = manifest.subsection_summary_paths()
     for subsection_summary_file in subsection_summary_files:
-        subsection_summary_file_handle = open(subsection_summary_file, "r")
-        subsection_summary_content = subsection_summary_file_handle.read()
+        subsection_summary_content = artifact_store.read(
+            subsection_summary_file)
         html_file.write("<p>" + subsection_summary_content + "</p>\n")
-        subsection_summary_file_handle.close()
 
     # Write the HTML footer
     html_file.write("<a href='" + url + "'>Original URL</a>\n")
     html_file.write("</article>\n")
     html_file.write("</body>\n")
     html_file.write("</html>\n")
+    artifact_store.write(basename + ".summary.html", html_file.getvalue())
+    profiler.annotate(bytes=len(html_file.getvalue()))
 
     # Print a message indicating that the HTML file was created
     print("Created HTML file: " + basename + ".summary.html")
@@ -376,35 +413,343 @@ def create_html_file(basename, url):
 
 
 def download_html(url):
-    # Strip any trailing /'s from the end of the URL
-    stripped_url = url.rstrip("/")
+    """Downloads a document to /tmp over the shared, pooled fetcher, reusing an unchanged cached copy.
 
-    # Get the base name of the URL
-    base_name = stripped_url.split("/")[-1]
+    Returns:
+    str: The path of the downloaded file; it ends in .pdf if the document is a PDF.
+    """
+    from fetcher import shared_fetcher
 
-    # Download the HTML file
-    if base_name.endswith(".pdf"):
-        html_path = "/tmp/" + base_name
-    else:
-        html_path = "/tmp/" + base_name + ".html"
-    print("HTML path: " + html_path)
     print("URL: " + url)
-    os.system("curl -s -o " + html_path + " " + url)
+    html_path = shared_fetcher().download(url)
+    print("HTML path: " + html_path)
 
     return html_path
 
 
-if __name__ == '__main__':
-    model_engine = "text-davinci-003"
-    max_tokens = 3000
+def write_subsections(base_name, combined_subsections, enc):
+    """Writes each combined subsection to its own .full.txt file.
+
+    Parameters:
+    base_name (str): The base path of the output files.
+    combined_subsections (list): A list of (subheader, subcontent) tuples.
+    enc (object): An encoder object used to count the tokens of each subsection.
+
+    Returns:
+    list: A list of (section_name, subcontent, summary_path) tuples, one per written subsection.
+    """
+    chunks = []
+
+    # Initialize the counter for numbering sequential identical subheaders
+    subheader_count = 1
+
+    # Process each combined subsection
+    for subheader, subcontent in combined_subsections:
+        # Update the subheader if there are multiple sequential identical subheaders
+        if subheader_count > 1:
+            subheader += f"-part{subheader_count}"
+        subheader_count += 1
+
+        # Count the subsection's tokens without encoding it again
+        subcontent_tokens = count_tokens(subcontent, enc)
+
+        # Get the name of the output file
+        section_name = re.sub(r'[^a-zA-Z0-9]', '',
+                              subheader.replace('/', '-'))
+        output_path = f"{base_name}.{section_name}.full.txt"
+
+        if (len(subcontent) == 0):
+            subheader_count = subheader_count - 1
+        else:
+            # Write the content to the output file
+            artifact_store.write(output_path, subcontent, subcontent_tokens)
+            print(
+                f"{subheader} ({len(subcontent)} characters, {subcontent_tokens} tokens) written to {output_path}")
+            # Get the name of the summary file
+            summary_path = f"{base_name}.{section_name}.summary.txt"
+            chunks.append((section_name, subcontent, summary_path))
+
+    return chunks
+
+
+def summarize_subsection(subcontent, summary_path, enc, output_language_prompt="", model_engine="text-davinci-003", max_tokens=3000, doctype=""):
+    """Generates the summary of one subsection and writes it to summary_path.
+
+    With pre-compression on, only the subsection's highest-scoring sentences
+    (a share of its tokens set by doctype) are sent.
+
+    With near-duplicate detection on, a subsection nearly identical to one
+    summarized before gets that summary ("reuse"), or NO_CONTENT_SUMMARY
+    ("skip"), without a request.
+
+    enc is the document's tokenizer, used by the compressor.
+
+    Returns:
+    tuple: (summary_path, duplicate), where duplicate is True if the subsection was a near-duplicate.
+    """
+    if compressor is not None:
+        subcontent = compressor.compress(subcontent, enc, doctype)
+    # Set the prompt for the summary
+    prompt = SUBSECTION_PROMPT.format(
+        content=subcontent, output_language_prompt=output_language_prompt)
+
+    # Generate a summary for the subsection, or reuse the cached one
+    def generate():
+        return generate_summary(
+            subcontent, prompt, model_engine, max_tokens, SUBSECTION_PROMPT, output_language_prompt)
+
+    duplicate = False
+    if near_duplicates is None:
+        summary = generate()
+    else:
+        scope = cache_key(model_engine, SUBSECTION_PROMPT, "", output_language_prompt)
+        summary, duplicate = near_duplicates.summarize(scope, subcontent, generate)
+        if duplicate and near_duplicate_action == "skip":
+            summary = NO_CONTENT_SUMMARY
+    # Write the summary to a summary file
+    artifact_store.write(summary_path, summary)
+    print(f"Summary written to {summary_path}" + (" (near-duplicate)" if duplicate else ""))
+    return summary_path, duplicate
+
+
+def build_summary_tree(base_name, prompt_template, output_language_prompt="", enc=None, model_engine="text-davinci-003", max_tokens=3000, root_prompt_template=None):
+    """Builds a SummaryTree that reduces summaries with the given prompts.
+
+    Parameters:
+    base_name (str): The base path of the output files; tree nodes are kept in {base_name}.tree.
+    prompt_template (str): The prompt used to combine summaries below the root.
+    output_language_prompt (str, optional): Language instructions appended to the prompt.
+    enc (object): An encoder object used to count tokens.
+    root_prompt_template (str, optional): The prompt used for the root. Defaults to prompt_template.
+
+    Returns:
+    SummaryTree: The tree reducer.
+    """
+    if root_prompt_template is None:
+        root_prompt_template = prompt_template
+
+    def reduce_group(summaries, is_root):
+        template = root_prompt_template if is_root else prompt_template
+        subcontent = "\n\n".join(summaries)
+        prompt = template.format(
+            content=subcontent, output_language_prompt=output_language_prompt)
+        return generate_summary(
+            subcontent, prompt, model_engine, max_tokens, template, output_language_prompt)
+
+    return SummaryTree(
+        reduce_group, lambda text: len(enc.encode(text)), max_tokens,
+        base_name + ".tree" if persist_tree_nodes else None, tree_concurrency, artifact_store)
+
+
+def read_summaries(summary_paths):
+    summaries = []
+    for summary_path in summary_paths:
+        if summary_path is None:
+            continue
+        print(f"Reading summary from {summary_path}")
+        summaries.append(artifact_store.read(summary_path))
+    return summaries
+
+
+def summarize_section(base_name, manifest, section_index, output_language_prompt="", enc=None, model_engine="text-davinci-003", max_tokens=3000, tree_nodes=None):
+    """Combines the subsection summaries of one section into a section summary.
+
+    Parameters:
+    base_name (str): The base path of the output files.
+    manifest (DocumentManifest): The document's manifest; the section summary is recorded in it.
+    section_index (int): The index of the section in the manifest.
+    output_language_prompt (str, optional): Language instructions appended to the prompt.
+    enc (object): An encoder object used to count tokens.
+    tree_nodes (set, optional): The paths of the persisted tree nodes used are added to it.
+
+    Returns:
+    str: The path of the section summary file, or None if the section has no summaries.
+    """
+    # Read the section's subsection summaries, in order, from the manifest
+    section = manifest.section(section_index)
+    summary_paths = manifest.chunk_summary_paths(section_index)
+    if len(summary_paths) < 1:
+        print(f"No summary files found for section {section['header']}")
+        return None
+    # Name the section summary after the section's last subsection
+    section_name = section["chunks"][-1]["name"]
+    section_summary_path = f"{base_name}.{section_name}.section_summary.txt"
+    if len(summary_paths) == 1:
+        print(
+            f"Only one summary file found for section {section_name}, promoting it to section summary")
+        # Read the summary file and write it to the section summary file
+        section_summary = artifact_store.read(summary_paths[0])
+        artifact_store.write(section_summary_path, section_summary)
+        print(
+            f"Summary promoted to section summary at {section_summary_path}")
+        manifest.set_section_summary(section_index, section_summary_path)
+        manifest.save()
+        return section_summary_path
+
+    # Reduce the subsection summaries level by level until they fit in one request
+    summaries = read_summaries(summary_paths)
+    tree = build_summary_tree(
+        base_name, SECTION_PROMPT, output_language_prompt, enc, model_engine, max_tokens)
+    section_summary = tree.reduce(
+        summaries, key=model_engine + SECTION_PROMPT + output_language_prompt)
+    if tree_nodes is not None:
+        tree_nodes.update(tree.nodes)
+    manifest.count("reductions", tree.calls)
+    manifest.count("reductions_reused", tree.reused)
+    # Write the overall section summary to a file
+    artifact_store.write(section_summary_path, section_summary)
+    print(
+        f"Overall section summary of {len(summaries)} summaries written to {section_summary_path}")
+    manifest.set_section_summary(section_index, section_summary_path)
+    manifest.save()
+    return section_summary_path
+
+
+def summarize_overall(base_name, doctype, manifest, output_language_prompt="", enc=None, model_engine="text-davinci-003", max_tokens=3000, tree_nodes=None):
+    """Generates the overall summary of the document from the section summaries.
+
+    Parameters:
+    base_name (str): The base path of the output files.
+    doctype (str): The kind of document being summarized, e.g. "paper" or "article".
+    manifest (DocumentManifest): The document's manifest; the overall summary is recorded in it.
+    output_language_prompt (str, optional): Language instructions appended to the prompt.
+    enc (object): An encoder object used to count tokens.
+    tree_nodes (set, optional): The paths of the persisted tree nodes used are added to it.
+
+    Returns:
+    str: The path of the overall summary file.
+    """
+    overall_summary_path = f"{base_name}.overall_summary.txt"
+    # Read in the abstract, if it exists
+    abstract_path = manifest.abstract_path()
+    if abstract_path is not None:
+        abstract = artifact_store.read(abstract_path)
+    else:
+        print(f"No abstract found for {base_name}")
+        abstract = ""
+    # Read in every section summary; none are dropped, the tree reduces them to fit
+    summaries = read_summaries(manifest.section_summary_paths())
+    print(
+        f"Summarizing the abstract and {len(summaries)} section summaries")
+
+    # Combine section summaries with the section prompt and write the root with the overall prompt
+    overall_prompt = OVERALL_PROMPT.replace("{doctype}", doctype)
+    tree = build_summary_tree(
+        base_name, SECTION_PROMPT, output_language_prompt, enc, model_engine, max_tokens, overall_prompt)
+    overall_summary = tree.reduce(
+        [abstract] + summaries, key=model_engine + overall_prompt + output_language_prompt)
+    if tree_nodes is not None:
+        tree_nodes.update(tree.nodes)
+    manifest.count("reductions", tree.calls)
+    manifest.count("reductions_reused", tree.reused)
+    # Append a newline to the overall summary
+    overall_summary += "\n"
+    # Write the overall summary to a file
+    artifact_store.write(overall_summary_path, overall_summary)
+    print(f"Overall summary written to {overall_summary_path}")
+    manifest.set_overall_summary(overall_summary_path)
+    manifest.save()
+    return overall_summary_path
+
+
+def plan_sections(base_name, text_chunks, enc, pack_tokens=3000, stats=None, manifest=None, previous=None):
+    """Writes the extracted text and each combined subsection to disk as the text arrives,
+    yielding the summary work of each section as soon as that section is complete.
+
+    Parameters:
+    base_name (str): The base path of the output files.
+    text_chunks (iterable): The extracted text, in pieces (e.g. one per PDF page).
+    enc (object): An encoder object used to encode each section once.
+    pack_tokens (int, optional): The token budget of each subsection summary request. Default is 3000.
+    stats (dict, optional): Updated with the token, section and request counts of the document.
+    manifest (DocumentManifest, optional): Every section and chunk is recorded in it.
+    previous (PreviousSummaries, optional): The previous run's summaries. Chunks whose content
+        is unchanged get their previous summary, and are marked summarized in the manifest.
+
+    Yields:
+    tuple: (section_index, chunks), where section_index is the section's index in the manifest
+        and chunks are (section_name, subcontent, summary_path, section_index, chunk_index) tuples.
+    """
+    if stats is None:
+        stats = {}
+    if manifest is None:
+        manifest = DocumentManifest(base_name, store=artifact_store)
+    stats.update(tokens=0, sections=0, packed_requests=0, legacy_requests=0,
+                 reused_chunks=0, removed_chunks=0)
+    chunk_hashes = []
+
+    with artifact_store.writer(base_name + ".full.txt") as full_text_file:
+        def write_through(chunks):
+            # Write the extracted text to the output file as it is extracted
+            for chunk in chunks:
+                full_text_file.write(chunk)
+                full_text_file.flush()
+                yield chunk
+
+        for header, content in iter_sections(write_through(text_chunks)):
+            print("Header: ", header)
+            # Encode the section once; every split below slices its tokens
+            content = TokenizedText.from_text(enc, content)
+            stats["tokens"] += content.token_count
+            stats["sections"] += 1
+
+            # Split the section into subsections if necessary
+            subsections = split_section_into_subsections(header, content, enc, pack_tokens)
+
+            # Pack adjacent subsections into as few requests as fit the per-request budget
+            combined_subsections = combine_subsections(
+                subsections, enc, pack_tokens)
+            stats["packed_requests"] += len(combined_subsections)
+            stats["legacy_requests"] += legacy_request_count(
+                count_tokens(subcontent, enc) for _, subcontent in subsections)
+
+            # Record the section and its chunks, with their files and position, in the manifest
+            section_index = manifest.add_section(header, content.token_count)
+            chunks = []
+            for section_name, subcontent, summary_path in write_subsections(base_name, combined_subsections, enc):
+                chunk_index = manifest.add_chunk(
+                    section_index, section_name, subcontent, count_tokens(subcontent, enc),
+                    f"{base_name}.{section_name}.full.txt", summary_path)
+                manifest.count("chunks")
+                chunk_hash = manifest.chunk(section_index, chunk_index)["hash"]
+                chunk_hashes.append(chunk_hash)
+                summary = previous.get(chunk_hash) if previous else None
+                if summary is not None:
+                    # The chunk is unchanged since the previous run; keep its summary
+                    artifact_store.write(summary_path, summary)
+                    manifest.mark_chunk_summarized(section_index, chunk_index)
+                    manifest.count("chunks_reused")
+                    stats["reused_chunks"] += 1
+                chunks.append((section_name, subcontent, summary_path,
+                               section_index, chunk_index))
+            manifest.save()
+            yield section_index, chunks
+
+    if previous:
+        stats["removed_chunks"] = previous.removed(chunk_hashes)
+        manifest.count("chunks_removed", stats["removed_chunks"])
+        manifest.save()
+
+
+def open_source(source, pdf_workers=1):
+    """Resolves a source to its output base name and a stream of its extracted text.
+
+    Parameters:
+    source (str): A PDF, HTML or text file path, or an HTML/PDF URL.
+    pdf_workers (int, optional): The number of processes to extract PDF pages with. Default is 1.
+
+    Returns:
+    tuple: (base_name, doctype, url, text_chunks), where text_chunks yields the extracted text in pieces.
+    """
     doctype = ""
+    url = source
     # get the base filename of the first argument without the extension
-    base_name = os.path.splitext(sys.argv[1])[0]
+    base_name = os.path.splitext(source)[0]
 
-    # If the command line argument starts with http, use curl to download it to an HTML file
-    if sys.argv[1].startswith("http"):
+    # If the command line argument starts with http, download it to an HTML (or PDF) file
+    if source.startswith("http"):
         # Get the URL from the command line arguments
-        url = sys.argv[1]
+        url = source
         doctype = "article"
 
         # Strip any query parameters from the URL
@@ -420,264 +765,393 @@ if __name__ == '__main__':
         base_name = "/tmp/" + url.split("/")[-1]
         print(base_name)
 
-        if sys.argv[1].endswith(".pdf"):
-            text = extract_text_from_pdf(html_path)
+        if html_path.endswith(".pdf"):
+            from pdf_extract import iter_pdf_pages
+            # Extract the text from the PDF file one page at a time
+            text_chunks = profiler.iterate("extract_text_from_pdf", iter_pdf_pages(html_path, pdf_workers))
         else:
             # Extract the text from the HTML file
-            text = extract_text_from_html(html_path)
+            text_chunks = [extract_text_from_html(html_path)]
     # If the command line argument references a pdf file
-    elif sys.argv[1].endswith(".pdf"):
+    elif source.endswith(".pdf"):
+        from pdf_extract import iter_pdf_pages
         # Get the PDF file path from the command line arguments
-        pdf_path = sys.argv[1]
+        pdf_path = source
         doctype = "paper"
 
-        # Extract the text from the PDF file
-        text = extract_text_from_pdf(pdf_path)
-    elif sys.argv[1].endswith(".html") or sys.argv[1].endswith(".htm"):
+        # Extract the text from the PDF file one page at a time
+        text_chunks = profiler.iterate("extract_text_from_pdf", iter_pdf_pages(pdf_path, pdf_workers))
+    elif source.endswith(".html") or source.endswith(".htm"):
 
         # Get the HTML file path from the command line arguments
-        html_path = sys.argv[1]
+        html_path = source
         doctype = "article"
 
         # Extract the text from the HTML file
-        text = extract_text_from_html(html_path)
+        text_chunks = [extract_text_from_html(html_path)]
     else:
         # Get the text file path from the command line arguments
-        text_path = sys.argv[1]
+        text_path = source
 
         # Read the text file
         with open(text_path, "r") as text_file:
-            text = text_file.read()
+            text_chunks = [text_file.read()]
 
-    # Checking if output language is set: if not, leave off any language instructions from the prompt
-    try:
-        arg = sys.argv[2]
-        output_language_prompt = " Please use " + \
-            sys.argv[2]+" language for the output."
-    except IndexError:
-        output_language_prompt = ""
+    return base_name, doctype, url, text_chunks
 
-    # Split the text into sections
-    sections = split_into_sections(text)
 
-    # encode the text as a sequence of tokens
-    # enc = tiktoken.get_encoding("gpt2")
-    enc = GPT2TokenizerFast.from_pretrained("gpt2")
+def prepare_document(source, pack_tokens=3000, settings=None, incremental=False, store_path=None, profile=False):
+    """Extracts and chunks one document, writing its .full.txt files and manifest.
 
-    tokens = enc.encode(text)
+    This runs in batch mode's worker processes, so it returns only plain,
+    picklable data.
 
-    # Get the base name of the output file
-    # base_name, _ = os.path.splitext(pdf_path)
+    Parameters:
+    source (str): A PDF, HTML or text file path, or an HTML/PDF URL.
+    pack_tokens (int, optional): The token budget of each subsection summary request. Default is 3000.
+    settings (dict, optional): The summary settings, see summary_settings().
+    incremental (bool, optional): Reuse the previous run's summaries of unchanged chunks. Default is False.
+    store_path (str, optional): The SQLite artifact store to write to, instead of files.
+    profile (bool, optional): Record profiling spans and return them in stats["profile_events"]. Default is False.
 
-    # Write the extracted text to the output file
-    with open(base_name + ".full.txt", 'w') as f:
-        f.write(text)
+    Returns:
+    tuple: (base_name, doctype, url, sections, stats), where sections is a list of
+        (section_index, chunks) tuples as yielded by plan_sections().
+    """
+    global artifact_store
+    if profile:
+        profiler.enable()
+        # Drop any spans inherited from the parent process
+        profiler.drain()
+    artifact_store = profiler.wrap_store(open_store(store_path))
+    base_name, doctype, url, text_chunks = open_source(source)
+    previous = PreviousSummaries.load(
+        base_name, settings, artifact_store) if incremental else None
+    manifest = DocumentManifest(base_name, store=artifact_store)
+    manifest.set_source(url, doctype)
+    manifest.set_summary_settings(settings)
+    stats = {}
+    sections = []
+    for section_index, chunks in plan_sections(base_name, text_chunks, profiler.wrap_tokenizer(load_tokenizer("gpt2")), pack_tokens, stats, manifest, previous):
+        # Drop the tokens; a TokenizedText can't be pickled back to the parent
+        sections.append((section_index, [(name, str(subcontent), summary_path, s, c)
+                                         for name, subcontent, summary_path, s, c in chunks]))
+    if profile:
+        stats["profile_events"] = profiler.drain()
+    return base_name, doctype, url, sections, stats
+
+
+def summarize_document(base_name, doctype, url, planned_sections, manifest, enc, output_language_prompt="", concurrency=8, model_engine="text-davinci-003", max_tokens=3000, progress=None):
+    """Summarizes every subsection, then every section, then the whole document,
+    and writes the HTML page.
 
+    Parameters:
+    base_name (str): The base path of the output files.
+    doctype (str): The kind of document being summarized, e.g. "paper" or "article".
+    url (str): The document's source, linked from the HTML page.
+    planned_sections (iterable): (section_index, chunks) tuples, as yielded by plan_sections().
+    manifest (DocumentManifest): The document's manifest.
+    enc (object): An encoder object used to count tokens.
+    output_language_prompt (str, optional): Language instructions appended to the prompts.
+    concurrency (int, optional): The number of summaries of this document requested at once. Default is 8.
+    progress (callable, optional): Called with an event dict as each chunk, section and the
+        overall summary is done, e.g. {"event": "chunk", "section": 2, "chunk": 0}.
+
+    Returns:
+    dict: The run's counts of chunks and reductions, generated and reused.
+    """
+    report = progress or (lambda event: None)
+
+    def summarize_chunk(chunk):
+        section_name, subcontent, summary_path, section_index, chunk_index = chunk
+        if manifest.chunk(section_index, chunk_index)["summarized"]:
+            # Reused from the previous run
+            report({"event": "chunk", "section": section_index, "chunk": chunk_index, "reused": True})
+            return
+        _, duplicate = summarize_subsection(subcontent, summary_path, enc,
+                                            output_language_prompt, model_engine, max_tokens, doctype)
+        if duplicate:
+            manifest.count("chunks_near_duplicate")
+        manifest.mark_chunk_summarized(section_index, chunk_index)
+        report({"event": "chunk", "section": section_index, "chunk": chunk_index, "near_duplicate": duplicate})
+
+    tree_nodes = set()
+
+    def reduce_section(section_index, _):
+        summarize_section(base_name, manifest, section_index, output_language_prompt, enc, model_engine, max_tokens,
+                          tree_nodes)
+        report({"event": "section", "section": section_index})
+
+    def reduce_overall(_):
+        summarize_overall(base_name, doctype, manifest, output_language_prompt, enc, model_engine, max_tokens,
+                          tree_nodes)
+        report({"event": "overall"})
+
+    # Summarize every subsection concurrently, reducing each section and then
+    # the whole document as soon as their inputs are ready
+    engine = SummaryEngine(max_workers=concurrency)
+    engine.run(planned_sections, summarize_chunk, reduce_section, reduce_overall)
+    if persist_tree_nodes:
+        # Drop the nodes of earlier runs' trees, e.g. over summaries that have since changed
+        for path in artifact_store.paths(base_name + ".tree" + os.sep):
+            if path not in tree_nodes:
+                artifact_store.delete(path)
+
+    # Call create_html_file() to create an HTML file with the overall summary
+    create_html_file(base_name, url, manifest)
+
+    counts = manifest.run_counts()
+    artifact_store.record_run(base_name, dict(
+        counts, source=url, summary_settings=manifest.data["summary_settings"]))
     print(
-        f"Text extracted from {sys.argv[1]} and written to {base_name}.full.txt")
-
-    print(f"Total token count: {len(tokens)}")
-
-    # Write each section to a separate text file
-    for header, content in sections:
-        print("Header: ", header)
-        # Split the section into subsections if necessary
-        subsections = split_section_into_subsections(header, content, enc)
-
-        # Combine adjacent tuples with less than 1000 tokens until they exceed 1000 tokens
-        combined_subsections = combine_subsections(subsections)
-
-        # Initialize the counter for numbering sequential identical subheaders
-        subheader_count = 1
-
-        # Process each combined subsection
-        for subheader, subcontent in combined_subsections:
-            # Update the subheader if there are multiple sequential identical subheaders
-            if subheader_count > 1:
-                subheader += f"-part{subheader_count}"
-            subheader_count += 1
-
-            # Use tiktoken to encode the subsection content as a sequence of tokens
-            subcontent_tokens = enc.encode(subcontent)
-
-            # Get the name of the output file
-            # print("Subheader: ",subheader)
-            section_name = re.sub(r'[^a-zA-Z0-9]', '',
-                                  subheader.replace('/', '-'))
-
-            # print("Section name: ",section_name)
-            output_path = f"{base_name}.{section_name}.full.txt"
-
-            if (len(subcontent) == 0):
-                subheader_count = subheader_count - 1
-            else:
-                # Write the content to the output file
-                with open(output_path, 'w') as f:
-                    f.write(subcontent)
-                print(
-                    f"{subheader} ({len(subcontent)} characters, {len(subcontent_tokens)} tokens) written to {output_path}")
-                # Get the name of the summary file
-                summary_path = f"{base_name}.{section_name}.summary.txt"
-                # If the summary file does not exist, generate a summary
-                if os.path.exists(summary_path):
-                    print(f"Summary already exists at {summary_path}")
-                else:
-                    # Set the prompt for the summary
-                    prompt = f"Please provide a detailed summary of the following section, but if the section content is mostly website context/description, just return 'Section has no content':\n{subcontent}\nPlease provide a detailed summary of the section above. If the section content is mostly website context/description, just return 'Section has no content'.{output_language_prompt}"
-                    # Generate a summary for the subsection
-                    summary = generate_summary(
-                        subcontent, prompt, model_engine, max_tokens)
-                    # Write the summary to a summary file
-                    with open(summary_path, 'w') as f:
-                        f.write(summary)
-                    print(f"Summary written to {summary_path}")
-
-        # If there is more than one summary file matching {base_name}.*{section_number}.summary.txt, generate a combined section summary
-        section_number = section_name.split('.')[0]
-        if len(glob.glob(f"{base_name}.{section_number}.*.summary.txt")) < 1:
-            print(f"No summary files found for section {section_number}")
-        elif len(glob.glob(f"{base_name}.{section_number}.*.summary.txt")) == 1:
+        f"Reused {counts['chunks_reused']} of {counts['chunks']} chunk summaries ({counts['chunks_removed']} previous chunks removed, "
+        f"{counts['chunks_near_duplicate']} near-duplicates) "
+        f"and {counts['reductions_reused']} of {counts['reductions'] + counts['reductions_reused']} section/overall summaries")
+    return counts
 
-            print(
-                f"Only one summary file found for section {section_number}, promoting it to section summary")
-            # Get the path of the summary file
-            # print(glob.glob(f"{base_name}.{section_number}.*.summary.txt"))
-            summary_path = glob.glob(
-                f"{base_name}.{section_number}.*.summary.txt")[0]
-            # Get the path of the section summary file
-            section_summary_path = f"{base_name}.{section_name}.section_summary.txt"
-            # Read the summary file and write it to the section summary file
-            with open(summary_path, 'r') as f:
-                summary = f.read()
-            with open(section_summary_path, 'w') as f:
-                f.write(summary)
 
-            print(
-                f"Summary promoted to section summary at {section_summary_path}")
+def summarize_source(source, settings, output_language_prompt="", pack_tokens=3000, pdf_workers=1, incremental=False, concurrency=8, model_engine="text-davinci-003", max_tokens=3000, progress=None, output_dir=None):
+    """Extracts, chunks and summarizes one document in this process.
 
-        else:
-            # Read in the section summaries
-            summaries = []
-
-            summary_pattern = f"{base_name}.*{section_number}.summary.txt"
-            print(f"Reading summary from {summary_pattern}")
-            summary_paths = glob.glob(summary_pattern)
-            # sort file names by modification time, oldest first
-            summary_paths.sort(key=os.path.getmtime)
-            for summary_path in summary_paths:
-                print(f"Reading summary from {summary_path}")
-                with open(summary_path, 'r') as f:
-                    summaries.append(f.read())
-            # Concatenate the summaries into a single string
-            subcontent = "\n\n".join(summaries)
-            # Tokenize the concatenated summaries
-            subcontent_tokens = enc.encode(subcontent)
-            print(
-                f"Concatenated {len(summaries)} summaries into a single summary with {len(subcontent)} characters and {len(subcontent_tokens)} tokens")
-            if len(subcontent_tokens) == 0:
-                summary_pattern = f"{base_name}.*.summary.txt"
-                print(f"Reading summary from {summary_pattern}")
-                summary_paths = glob.glob(summary_pattern)
-                # sort file names by modification time, oldest first
-                summary_paths.sort(key=os.path.getmtime)
-
-                summaries = []
-                subcontent_tokens = []
-                for summary_path in summary_paths:
-                    print(f"Reading summary from {summary_path}")
-                    with open(summary_path, 'r') as f:
-                        summary = f.read()
-                    summary_tokens = enc.encode(summary)
-                    if len(subcontent_tokens) + len(summary_tokens) > max_tokens:
-                        break
-                    summaries.append(summary)
-                    subcontent_tokens += summary_tokens
-                # Concatenate the summaries into a single string
-                subcontent = "\n\n".join(summaries)
-                # Tokenize the concatenated summaries
-                subcontent_tokens = enc.encode(subcontent)
-                print(
-                    f"Concatenated {len(summaries)} out of {len(summary_paths)} section summaries into a single summary with {len(subcontent)} characters and {len(subcontent_tokens)} tokens")
-
-            # Set the prompt for the overall section summary
-            prompt = f"Please provide a detailed summary of the following sections:\n{subcontent}\nPlease provide a detailed summary of the sections above.{output_language_prompt}"
-            # Get the path of the overall section summary file
-            section_summary_path = f"{base_name}.{section_number}.section_summary.txt"
-            # If the overall section summary file does not exist, generate a summary
-            if os.path.exists(section_summary_path):
-                print(
-                    f"Overall section summary already exists at {section_summary_path}")
-            else:
-                # Generate the overall section summary
-                section_summary = generate_summary(
-                    content, prompt, model_engine, max_tokens)
-                # Write the overall section summary to a file
-                with open(section_summary_path, 'w') as f:
-                    f.write(section_summary)
-                print(
-                    f"Overall section summary written to {section_summary_path}")
-
-    # Check if the overall summary file already exists
-    overall_summary_path = f"{base_name}.overall_summary.txt"
-    if os.path.exists(overall_summary_path):
-        print(f"Overall summary already exists at {overall_summary_path}")
-    else:
-        # Read in the abstract, if it exists
-        try:
-            abstract_filename = glob.glob(
-                f"{base_name}.Title-Abstract*.full.txt")[0]
-            with open(f"{abstract_filename}", 'r') as f:
-                abstract = f.read()
-        except IndexError:
-            print(f"No abstract found for {base_name}")
-            abstract = ""
-        # Read in the section summaries
-        summaries = []
-        summary_pattern = f"{base_name}.*.section_summary.txt"
-        for summary_path in glob.glob(summary_pattern):
-            with open(summary_path, 'r') as f:
-                summaries.append(f.read())
-        # Concatenate the abstract and summaries into a single string
-        subcontent = abstract + "\n\n" + "\n\n".join(summaries)
-        # Tokenize the concatenated abstract and summaries
-        subcontent_tokens = enc.encode(subcontent)
-        for summary in summaries:
-            summary_tokens = enc.encode(summary)
-            if len(subcontent_tokens) + len(summary_tokens) > max_tokens:
-                print(
-                    f"Exceeded {max_tokens} tokens, stopping concatenation of summaries")
-                break
-            subcontent += summary + "\n\n"
-            subcontent_tokens += summary_tokens
+    Parameters:
+    source (str): A PDF, HTML or text file path, or an HTML/PDF URL.
+    settings (dict): The summary settings, see summary_settings().
+    progress (callable, optional): Called with progress events, see summarize_document().
+    output_dir (str, optional): Write the outputs here rather than next to the source.
+    The other parameters are as for prepare_document() and summarize_document().
+
+    Returns:
+    dict: The document's base_name, doctype, html path, run counts and chunking stats.
+    """
+    base_name, doctype, url, text_chunks = open_source(source, pdf_workers)
+    if output_dir is not None:
+        base_name = os.path.join(output_dir, os.path.basename(base_name))
+
+    # enc = tiktoken.get_encoding("gpt2")
+    # Loaded from a local snapshot after the first run, without importing transformers
+    enc = profiler.wrap_tokenizer(load_tokenizer("gpt2"))
+
+    # Write the extracted text and each subsection to disk as pages arrive, and plan
+    # each section's summaries as soon as the section is complete
+    stats = {}
+    # Read the previous run's summaries before this run writes over its files
+    previous = PreviousSummaries.load(
+        base_name, settings, artifact_store) if incremental else None
+    manifest = DocumentManifest(base_name, store=artifact_store)
+    manifest.set_source(url, doctype)
+    manifest.set_summary_settings(settings)
+    planned_sections = plan_sections(
+        base_name, text_chunks, enc, pack_tokens, stats, manifest, previous)
+
+    counts = summarize_document(base_name, doctype, url, planned_sections, manifest, enc,
+                                output_language_prompt, concurrency, model_engine, max_tokens, progress)
+    return {"base_name": base_name, "doctype": doctype, "html": base_name + ".summary.html",
+            "counts": counts, "stats": stats}
+
+
+def language_prompt(language):
+    """Returns the instructions appended to the prompts to get output in language, if any."""
+    # If the output language is not set, leave off any language instructions from the prompt
+    if language:
+        return " Please use " + language + " language for the output."
+    return ""
+
+
+def configure(args):
+    """Sets up the caches, artifact store, optional stages and API client shared by every document.
+
+    Returns:
+    RequestDispatcher: The shared, rate-limited dispatcher.
+    """
+    global summary_cache, tree_concurrency, persist_tree_nodes, artifact_store, near_duplicates, near_duplicate_action, compressor
+    if args.profile:
+        profiler.enable()
+    if not args.no_cache:
+        summary_cache = SummaryCache.build()
+    # --no-cache always calls the API, for sections and the overall summary too
+    persist_tree_nodes = not args.no_cache
+    tree_concurrency = args.concurrency
+    artifact_store = profiler.wrap_store(open_store(args.store))
+    if args.dedup:
+        near_duplicates = NearDuplicateIndex.build()
+        near_duplicates.threshold = args.dedup_threshold
+        near_duplicate_action = args.dedup
+    if args.compress:
+        compressor = Compressor(parse_ratios(args.compress_ratio), args.compress_method)
+    # Every document's requests share one rate-limited dispatcher; build it before
+    # the client, which would otherwise build it with the defaults
+    dispatcher = shared_dispatcher(max_concurrency=args.concurrency)
+    llm_client(args.telemetry)
+    return dispatcher
+
+
+def print_dispatcher_metrics(dispatcher):
+    metrics = dispatcher.metrics()
+    print(
+        f"API requests: {metrics['completed']} completed, {metrics['failed']} failed, {metrics['retries']} retried; "
+        f"max queue depth {metrics['max_queue_depth']}, mean wait {metrics['mean_wait_seconds']:.2f}s, max wait {metrics['max_wait_seconds']:.2f}s")
+    calls = llm_client().telemetry.summary()
+    print(
+        f"Completion calls: {calls['calls']}, mean latency {calls['mean_latency_seconds']:.2f}s, "
+        f"{calls['prompt_tokens']} prompt and {calls['completion_tokens']} completion tokens")
+    if near_duplicates is not None:
+        dedup = near_duplicates.stats()
         print(
-            f"Concatenated {len(summaries)} summaries into a single summary with {len(subcontent)} characters and {len(subcontent_tokens)} tokens")
-        if len(subcontent_tokens) < 500:
-            print(
-                f"Concatenated subsection summaries have less than 500 tokens, reading in all summaries")
-            summary_pattern = f"{base_name}.*.summary.txt"
-            for summary_path in glob.glob(summary_pattern):
-                with open(summary_path, 'r') as f:
-                    summaries.append(f.read())
-            for summary in summaries:
-                summary_tokens = enc.encode(summary)
-                if len(subcontent_tokens) + len(summary_tokens) > max_tokens:
-                    print(
-                        f"Exceeded {max_tokens} tokens, stopping concatenation of summaries")
-                    break
-                subcontent += summary + "\n\n"
-                subcontent_tokens += summary_tokens
-
-        # Set the prompt for the overall summary
-        prompt = f"Please provide a detailed summary of the following {doctype}, based on its abstract and summaries of each section:\n{subcontent}\nPlease provide a detailed summary of the {doctype} described above, based on the provided abstract/introduction and summaries of each section.{output_language_prompt}"
-        # Generate the overall summary
-        overall_summary = generate_summary(
-            subcontent, prompt, model_engine, max_tokens)
-        # Append a newline to the overall summary
-        overall_summary += "\n"
-        # Write the overall summary to a file
-        with open(overall_summary_path, 'w') as f:
-            f.write(overall_summary)
-        print(f"Overall summary written to {overall_summary_path}")
+            f"Near-duplicate chunks: {dedup['duplicates']} of {dedup['lookups']} ({dedup['waited']} waited for a concurrent summary), "
+            f"{dedup['duplicates']} summary requests avoided")
+    if compressor is not None:
+        compression = compressor.stats()
+        print(
+            f"Pre-compression: {compression['compressed']} of {compression['chunks']} chunks compressed, "
+            f"{compression['tokens_in']} to {compression['tokens_out']} tokens")
 
-    # Call create_html_file() to create an HTML file with the overall summary
-    create_html_file(base_name, url)
+
+def print_profile(trace_path):
+    if trace_path:
+        profiler.print_summary()
+        profiler.write_trace(trace_path)
+        print(f"Profile trace written to {trace_path}")
+
+
+def parse_args(argv):
+    """Parses the command line arguments of summarize.py.
+
+    Parameters:
+    argv (list): The command line arguments, without the script name.
+
+    Returns:
+    argparse.Namespace: The parsed arguments.
+    """
+    parser = argparse.ArgumentParser(
+        description="Extract text, summarize each section w/ GPT, and provide a summarized outline of a paper/article")
+    parser.add_argument("source", nargs="?",
+                        help="PDF, HTML or text file path, or an HTML/PDF URL; with --submit, - submits text from stdin")
+    parser.add_argument("language", nargs="?", default="",
+                        help="Optional language to generate the summaries in")
+    parser.add_argument("--pack-tokens", type=int, default=3000,
+                        help="Token budget of each subsection summary request (default: 3000)")
+    parser.add_argument("--pdf-workers", type=int,
+                        default=int(os.getenv("PDF_WORKERS", os.cpu_count() or 1)),
+                        help="Processes used to extract PDF pages (default: $PDF_WORKERS or the CPU count)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="Always call the API instead of reusing cached summaries")
+    parser.add_argument("--concurrency", type=int,
+                        default=int(os.getenv("SUMMARY_CONCURRENCY", "8")),
+                        help="Maximum number of summaries requested at once (default: $SUMMARY_CONCURRENCY or 8)")
+    parser.add_argument("--batch", action="store_true",
+                        help="Summarize a corpus: source is a directory, a glob pattern, or a file listing paths/URLs (a JSON list like files.txt, or one per line)")
+    parser.add_argument("--batch-workers", type=int, default=os.cpu_count() or 1,
+                        help="Processes used to extract and chunk documents in batch mode (default: the CPU count)")
+    parser.add_argument("--report", default="batch_report.json",
+                        help="Where batch mode writes its run report (default: batch_report.json)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-summarize only the chunks that changed since the previous run of the same document")
+    parser.add_argument("--store", default=os.getenv("SUMMARY_STORE"),
+                        help="Keep chunks, summaries and manifests in this SQLite file instead of separate files "
+                             "(default: $SUMMARY_STORE); export them with artifact_store.py")
+    parser.add_argument("--dedup", choices=["reuse", "skip"],
+                        help="Detect chunks nearly identical to ones summarized before (in this or earlier runs) and "
+                             "reuse their summary, or skip them as boilerplate, instead of requesting a new one")
+    parser.add_argument("--dedup-threshold", type=float, default=float(os.getenv("NEAR_DUP_THRESHOLD", "0.85")),
+                        help="Estimated Jaccard similarity of word shingles at which chunks are near-duplicates "
+                             "(default: $NEAR_DUP_THRESHOLD or 0.85)")
+    parser.add_argument("--compress", action="store_true",
+                        help="Shrink each chunk to its highest-scoring sentences before summarizing it")
+    parser.add_argument("--compress-ratio", default=os.getenv("SUMMARY_COMPRESS_RATIO", ""),
+                        help="Share of each chunk's tokens kept: one number, or per doctype like "
+                             "'paper=0.6,article=0.4' (default: $SUMMARY_COMPRESS_RATIO or paper=0.6,article=0.4, others 0.5)")
+    parser.add_argument("--compress-method", choices=["textrank", "tfidf"], default="textrank",
+                        help="How sentences are scored for pre-compression (default: textrank)")
+    parser.add_argument("--profile", nargs="?", const="summarize_trace.json",
+                        help="Time each stage (extraction, sectioning, tokenization, API calls, artifact I/O), print a "
+                             "summary table and write a Chrome trace to this file (default: summarize_trace.json)")
+    parser.add_argument("--daemon", action="store_true",
+                        help="Run as a daemon that keeps the tokenizer, HTTP pools and caches loaded and "
+                             "summarizes jobs submitted over HTTP at --daemon-url")
+    parser.add_argument("--submit", action="store_true",
+                        help="Submit source to the daemon at --daemon-url and stream its progress, instead of "
+                             "summarizing it here")
+    parser.add_argument("--daemon-url", default=os.getenv("SUMMARY_DAEMON_URL", "http://127.0.0.1:8765"),
+                        help="Where the daemon listens (default: $SUMMARY_DAEMON_URL or http://127.0.0.1:8765)")
+    parser.add_argument("--daemon-root", action="append",
+                        help="With --daemon, a directory jobs may summarize files from; repeat for several "
+                             f"(default: $SUMMARY_DAEMON_ROOTS, separated by '{os.pathsep}', or the current directory)")
+    parser.add_argument("--priority", type=int, default=0,
+                        help="With --submit, the job's priority; higher runs first (default: 0)")
+    parser.add_argument("--jobs", type=int, default=int(os.getenv("SUMMARY_DAEMON_JOBS", "4")),
+                        help="With --daemon, documents summarized at once (default: $SUMMARY_DAEMON_JOBS or 4)")
+    parser.add_argument("--telemetry", default=os.getenv("LLM_TELEMETRY"),
+                        help="Append one JSON line per completion call to this file (default: $LLM_TELEMETRY)")
+    args = parser.parse_args(argv)
+    if args.source is None and not args.daemon:
+        parser.error("a source is required unless running --daemon")
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args(sys.argv[1:])
+    model_engine = "text-davinci-003"
+    max_tokens = 3000
+
+    if args.submit:
+        from daemon import submit_job
+        # Hand the document to a running daemon instead of starting up here
+        sys.exit(submit_job(args.daemon_url, args.source, args.language, args.priority, args.incremental))
+
+    output_language_prompt = language_prompt(args.language)
+    dispatcher = configure(args)
+    settings = summary_settings(model_engine, output_language_prompt, compressor)
+
+    if args.daemon:
+        from daemon import SummaryDaemon
+
+        def run_job(source, options, progress, output_dir):
+            job_language_prompt = language_prompt(options.get("language", ""))
+            return summarize_source(
+                source, summary_settings(model_engine, job_language_prompt, compressor), job_language_prompt,
+                args.pack_tokens, args.pdf_workers, options.get("incremental", args.incremental),
+                args.concurrency, model_engine, max_tokens, progress, output_dir)
+
+        # Load the tokenizer before the first job arrives
+        load_tokenizer("gpt2")
+        roots = args.daemon_root or [root for root in os.getenv("SUMMARY_DAEMON_ROOTS", "").split(os.pathsep) if root]
+        SummaryDaemon(run_job, args.jobs, roots=roots or None).serve(args.daemon_url)
+        print_dispatcher_metrics(dispatcher)
+        sys.exit(0)
+
+    if args.batch:
+        from batch import collect_sources, run_batch
+
+        sources = collect_sources(args.source)
+        urls = [source.split("?")[0] for source in sources if source.startswith("http")]
+        if urls:
+            from fetcher import shared_fetcher
+            # Download every URL concurrently over one pooled session; the worker
+            # processes then find them in the fetch cache
+            shared_fetcher().fetch_all(urls)
+
+        # Extract and chunk documents in a process pool, summarizing each as soon as it is ready
+        enc = profiler.wrap_tokenizer(load_tokenizer("gpt2"))
+        report = run_batch(
+            sources,
+            prepare_document, (args.pack_tokens, settings, args.incremental, args.store, bool(args.profile)),
+            lambda base_name, doctype, url, sections: summarize_document(
+                base_name, doctype, url, sections, DocumentManifest.load(base_name, artifact_store), enc,
+                output_language_prompt, args.concurrency, model_engine, max_tokens),
+            args.batch_workers, args.concurrency, args.report, dispatcher.metrics)
+        print_dispatcher_metrics(dispatcher)
+        print_profile(args.profile)
+        sys.exit(1 if report["failed"] else 0)
+
+    result = summarize_source(args.source, settings, output_language_prompt, args.pack_tokens, args.pdf_workers,
+                              args.incremental, args.concurrency, model_engine, max_tokens)
+    stats = result["stats"]
+
+    print(
+        f"Text extracted from {args.source} and written to {result['base_name']}.full.txt")
+    print("Found", 2 * stats["sections"] - 1, "sections.")
+    print(f"Total token count: {stats['tokens']}")
+    print(
+        f"Packed subsections into {stats['packed_requests']} requests ({stats['legacy_requests'] - stats['packed_requests']} fewer than the previous greedy packing's {stats['legacy_requests']})")
+    print_dispatcher_metrics(dispatcher)
+    print_profile(args.profile)
@@ -0,0 +1,124 @@
+"""
+Persistent, content-addressed cache of generated summaries.
+
+Entries are keyed by a hash of (model engine, prompt template, chunk text,
+output language), so a summary is reused whenever the same chunk is
+summarized the same way, no matter which file or URL it came from or where
+the output files are written. Each entry is a small text file in the cache
+directory; the least recently used entries are evicted once the directory
+grows past its size limit.
+"""
+
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def cache_key(model_engine, prompt_template, content, output_language=""):
+    """Returns the hex digest identifying one summary request.
+
+    Parameters:
+    model_engine (str): The model used to generate the summary.
+    prompt_template (str): The prompt template, before the chunk text is filled in.
+    content (str): The chunk text being summarized.
+    output_language (str, optional): The output language instructions, if any.
+
+    Returns:
+    str: A SHA-256 hex digest.
+    """
+    payload = json.dumps(
+        [model_engine, prompt_template, content, output_language or ""])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """Open (creating if needed) the cache stored in cache_dir.
+
+        Parameters:
+        cache_dir (str, optional): The directory holding the cache entries.
+        max_bytes (int, optional): The total size above which least recently used entries are evicted.
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def build():
+        """Build a cache configured from SUMMARY_CACHE_DIR and SUMMARY_CACHE_MAX_BYTES."""
+        return SummaryCache(
+            cache_dir=os.getenv("SUMMARY_CACHE_DIR", DEFAULT_CACHE_DIR),
+            max_bytes=int(os.getenv("SUMMARY_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+
+    def _load_index(self):
+        # Rebuild the LRU order from the entries' modification times
+        entries = []
+        for filename in os.listdir(self.cache_dir):
+            if not filename.endswith(".txt"):
+                continue
+            stat = os.stat(os.path.join(self.cache_dir, filename))
+            entries.append((stat.st_mtime, filename[:-4], stat.st_size))
+        entries.sort()
+        for _, key, size in entries:
+            self._entries[key] = size
+            self._total_bytes += size
+        self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".txt")
+
+    def get(self, key):
+        """Returns the cached summary for key, or None if there is none."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    summary = f.read()
+                # Touch the entry so it survives the next index rebuild as recently used
+                os.utime(self._path(key))
+            except FileNotFoundError:
+                # Evicted by another process sharing the cache directory
+                self._total_bytes -= self._entries.pop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return summary
+
+    def put(self, key, summary):
+        """Stores summary under key, evicting least recently used entries if needed."""
+        data = summary.encode("utf-8")
+        with self._lock:
+            # Write to a temporary file first so readers never see a partial entry
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            self._total_bytes -= self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data)
+            self._evict()
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,90 @@
+"""
+Concurrent summarization engine used by summarize.py.
+
+Every subsection summary is independent of the others, so all of them are
+dispatched at once to a bounded thread pool. A section's reduction is
+submitted the moment its last subsection finishes, and the overall reduction
+runs as soon as every section has been reduced. Wall-clock time therefore
+tracks the critical path of the summary tree (one subsection call, one
+section call, one overall call) rather than the number of chunks.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class SummaryEngine:
+    def __init__(self, max_workers=8):
+        """Create an engine that runs at most max_workers API calls at once.
+
+        Parameters:
+        max_workers (int, optional): The concurrency limit. Default is 8.
+        """
+        self.max_workers = max(1, int(max_workers))
+
+    def run(self, sections, summarize_chunk, reduce_section, reduce_overall):
+        """Summarizes every chunk, then every section, then the whole document.
+
+        Parameters:
+        sections (iterable): (section_key, chunks) tuples, in document order. It may be
+            a generator; each section's chunks are dispatched as soon as it is produced.
+        summarize_chunk (callable): Called as summarize_chunk(chunk) for every chunk.
+        reduce_section (callable): Called as reduce_section(section_key, chunk_results)
+            once all chunks of that section are summarized.
+        reduce_overall (callable): Called as reduce_overall(section_results) once
+            every section has been reduced.
+
+        Returns:
+        object: Whatever reduce_overall returns.
+        """
+        section_keys = []
+        chunk_results = []
+        remaining = []
+        section_results = []
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = {}
+
+            def submit_section(section_index):
+                future = pool.submit(
+                    reduce_section, section_keys[section_index], chunk_results[section_index])
+                pending[future] = (section_index, None)
+
+            def collect(timeout):
+                done, _ = wait(pending, timeout=timeout,
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    section_index, chunk_index = pending.pop(future)
+                    result = future.result()
+                    if chunk_index is None:
+                        section_results[section_index] = result
+                        continue
+                    chunk_results[section_index][chunk_index] = result
+                    remaining[section_index] -= 1
+                    if remaining[section_index] == 0:
+                        # Every input of this section is ready
+                        submit_section(section_index)
+
+            try:
+                # Dispatch every subsection prompt as soon as its section is available
+                for section_key, chunks in sections:
+                    section_index = len(section_keys)
+                    section_keys.append(section_key)
+                    chunk_results.append([None] * len(chunks))
+                    remaining.append(len(chunks))
+                    section_results.append(None)
+                    if not chunks:
+                        submit_section(section_index)
+                    for chunk_index, chunk in enumerate(chunks):
+                        future = pool.submit(summarize_chunk, chunk)
+                        pending[future] = (section_index, chunk_index)
+                    if pending:
+                        collect(0)
+
+                while pending:
+                    collect(None)
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        return reduce_overall(section_results)
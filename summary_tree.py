@@ -0,0 +1,132 @@
+"""
+Hierarchical map-reduce of summaries under a token budget.
+
+SummaryTree.reduce() takes the summaries of a document's parts, in order,
+and reduces them to a single root summary without dropping any of them. As
+long as the concatenated summaries exceed the budget, adjacent summaries are
+packed into groups that fit it and each group is summarized, giving the next,
+shorter level of the tree. The groups of one level are independent and are
+summarized in parallel. Once a level fits the budget it is summarized into
+the root.
+
+Every node is written to the node directory under a hash of its inputs, so
+a run that is interrupted and started again reads back the levels it already
+finished and resumes at the deepest one. The paths of the nodes a tree used
+are kept in its nodes set, so nodes no tree uses any more can be deleted.
+"""
+
+import os
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from packing import pack_subsections
+from artifact_store import FileStore
+
+SEPARATOR = "\n\n"
+
+
+class SummaryTree:
+    def __init__(self, reduce_group, count_tokens, budget=3000, node_dir=None, max_workers=8, store=None):
+        """Create a tree reducer.
+
+        Parameters:
+        reduce_group (callable): Called as reduce_group(summaries, is_root) to summarize a
+            list of summaries into one.
+        count_tokens (callable): Returns the token count of a string.
+        budget (int, optional): The maximum tokens of the summaries reduced in one call. Default is 3000.
+        node_dir (str, optional): The directory nodes are persisted in. If None, nothing is persisted.
+        max_workers (int, optional): The number of nodes of one level summarized at once. Default is 8.
+        store (object, optional): The artifact store nodes are persisted in. Defaults to a FileStore.
+        """
+        self.reduce_group = reduce_group
+        self.count_tokens = count_tokens
+        self.budget = budget
+        self.node_dir = node_dir
+        self.max_workers = max(1, int(max_workers))
+        self.store = store or FileStore()
+        self.calls = 0
+        self.reused = 0
+        self.nodes = set()
+        self.lock = threading.Lock()
+
+    def reduce(self, summaries, key=""):
+        """Reduces summaries to one root summary.
+
+        Parameters:
+        summaries (list): The summaries to reduce, in document order. Empty ones are skipped.
+        key (str, optional): Distinguishes trees over the same summaries, e.g. the prompt,
+            language and model used; it is part of every node's hash.
+
+        Returns:
+        str: The root summary, or "" if there is nothing to summarize.
+        """
+        nodes = [summary for summary in summaries if summary.strip()]
+        if not nodes:
+            return ""
+
+        level = 0
+        costs = self.costs(nodes)
+        while sum(costs) > self.budget:
+            groups = self.group(costs)
+            print(
+                f"Reducing {len(nodes)} summaries ({sum(costs)} tokens) into {len(groups)} at level {level + 1}")
+            nodes = self.reduce_level(
+                [nodes[start:end] for start, end in groups], level, key)
+            costs = self.costs(nodes)
+            level += 1
+
+        return self.reduce_node(nodes, level, key, True)
+
+    def costs(self, nodes):
+        separator_tokens = self.count_tokens(SEPARATOR)
+        return [self.count_tokens(node) + separator_tokens for node in nodes]
+
+    def group(self, costs):
+        """Packs adjacent nodes into groups that fit the budget."""
+        groups = pack_subsections(costs, self.budget)
+        if all(end - start == 1 for start, end in groups):
+            # No two neighbours fit together; reduce pairs so the level still shrinks
+            groups = [(start, min(start + 2, len(costs)))
+                      for start in range(0, len(costs), 2)]
+        return groups
+
+    def reduce_level(self, groups, level, key):
+        def reduce_group(group):
+            if len(group) == 1 and sum(self.costs(group)) <= self.budget:
+                # A node that fits on its own moves up a level unchanged
+                return group[0]
+            return self.reduce_node(group, level, key, False)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(reduce_group, groups))
+
+    def node_path(self, summaries, level, key, is_root):
+        digest = hashlib.sha256()
+        for part in (key, str(level), str(is_root)) + tuple(summaries):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return os.path.join(self.node_dir, f"L{level}-{digest.hexdigest()[:24]}.txt")
+
+    def reduce_node(self, summaries, level, key, is_root):
+        path = None
+        if self.node_dir is not None:
+            path = self.node_path(summaries, level, key, is_root)
+            with self.lock:
+                self.nodes.add(path)
+            try:
+                summary = self.store.read(path)
+            except FileNotFoundError:
+                pass
+            else:
+                with self.lock:
+                    self.reused += 1
+                return summary
+
+        summary = self.reduce_group(summaries, is_root)
+        with self.lock:
+            self.calls += 1
+
+        if path is not None:
+            self.store.write(path, summary)
+        return summary
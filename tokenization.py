@@ -0,0 +1,181 @@
+"""
+Single-pass tokenization for the chunking pipeline.
+
+load_tokenizer() returns the GPT-2 tokenizer. The first time, it is loaded
+with transformers and serialized to a snapshot file; after that it is loaded
+straight from the snapshot with the Rust tokenizers library, which skips the
+slow transformers import. It is loaded at most once per process.
+
+The document is encoded once with the tokenizer's offset mapping. Every
+section, subsection and chunk is then a TokenizedText: a str that also
+carries the token ids of that slice and each token's character span, so the
+splitting and budgeting functions in summarize.py count and cut tokens
+without encoding the same text again.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+
+# Where the serialized tokenizer is kept between runs
+TOKENIZER_SNAPSHOT_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "gpt-summarizer", "tokenizers")
+
+
+class TokenizedText(str):
+    """A string together with its token ids and their character offsets.
+
+    Because it is a str, it can be written, printed and concatenated like
+    any other text; len() is still the number of characters, and
+    token_count is the number of tokens.
+    """
+
+    def __new__(cls, text, ids, offsets):
+        self = super().__new__(cls, text)
+        self.ids = ids
+        self.offsets = offsets
+        self.starts = [start for start, _ in offsets]
+        return self
+
+    @classmethod
+    def from_text(cls, enc, text):
+        """Encodes text once, keeping the token <-> character mapping.
+
+        Parameters:
+        enc (object): A fast tokenizer, e.g. GPT2TokenizerFast.
+        text (str): The text to encode.
+
+        Returns:
+        TokenizedText: The encoded text.
+        """
+        encoding = enc(text, return_offsets_mapping=True,
+                       add_special_tokens=False)
+        return cls(text, list(encoding["input_ids"]), [tuple(o) for o in encoding["offset_mapping"]])
+
+    @staticmethod
+    def concat(parts):
+        """Joins TokenizedText pieces without re-encoding them."""
+        text = ""
+        ids = []
+        offsets = []
+        for part in parts:
+            base = len(text)
+            text += part
+            ids.extend(part.ids)
+            offsets.extend((start + base, end + base)
+                           for start, end in part.offsets)
+        return TokenizedText(text, ids, offsets)
+
+    @property
+    def token_count(self):
+        return len(self.ids)
+
+    def char_to_token(self, char_pos):
+        """Returns the index of the first token starting at or after char_pos."""
+        return bisect_left(self.starts, char_pos)
+
+    def token_to_char(self, token_index):
+        """Returns the character position where token token_index starts."""
+        if token_index >= len(self.starts):
+            return len(self)
+        return self.starts[token_index]
+
+    def slice_chars(self, start, end):
+        """Returns the text between two character positions, with its tokens.
+
+        Tokens are assigned to the slice their first character falls in, so
+        adjacent slices never share or drop a token.
+        """
+        first = self.char_to_token(start)
+        last = self.char_to_token(end)
+        offsets = [(max(s, start) - start, min(e, end) - start)
+                   for s, e in self.offsets[first:last]]
+        return TokenizedText(str.__getitem__(self, slice(start, end)), self.ids[first:last], offsets)
+
+    def slice_tokens(self, first, last):
+        """Returns the text covered by tokens first..last-1, with those tokens."""
+        return self.slice_chars(self.token_to_char(first), self.token_to_char(last))
+
+
+def as_tokenized(text, enc):
+    """Returns text as a TokenizedText, encoding it only if it is a plain str."""
+    if isinstance(text, TokenizedText):
+        return text
+    return TokenizedText.from_text(enc, text)
+
+
+def count_tokens(text, enc):
+    """Returns the token count of text, reusing its tokens if it has them."""
+    if isinstance(text, TokenizedText):
+        return text.token_count
+    return len(enc.encode(text))
+
+
+class SnapshotTokenizer:
+    """A fast tokenizer loaded from a serialized tokenizers snapshot.
+
+    It implements the parts of the GPT2TokenizerFast interface used here:
+    encode(), decode() and calling it with return_offsets_mapping.
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    @staticmethod
+    def from_file(path):
+        from tokenizers import Tokenizer
+        return SnapshotTokenizer(Tokenizer.from_file(path))
+
+    def encode(self, text, add_special_tokens=True):
+        return self.tokenizer.encode(text, add_special_tokens=add_special_tokens).ids
+
+    def decode(self, ids):
+        return self.tokenizer.decode(ids)
+
+    def __call__(self, text, return_offsets_mapping=False, add_special_tokens=True):
+        encoding = self.tokenizer.encode(
+            text, add_special_tokens=add_special_tokens)
+        result = {"input_ids": encoding.ids}
+        if return_offsets_mapping:
+            result["offset_mapping"] = encoding.offsets
+        return result
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def load_tokenizer(name="gpt2", snapshot_path=None):
+    """Returns the named tokenizer, loading it at most once per process.
+
+    Parameters:
+    name (str, optional): The pretrained tokenizer name. Default is "gpt2".
+    snapshot_path (str, optional): The snapshot file to load from, or to create if it
+        does not exist. Defaults to $SUMMARY_TOKENIZER, or a file under ~/.cache/gpt-summarizer.
+
+    Returns:
+    object: A tokenizer with the GPT2TokenizerFast encode/decode/offsets interface.
+    """
+    if snapshot_path is None:
+        snapshot_path = os.getenv("SUMMARY_TOKENIZER") or os.path.join(
+            TOKENIZER_SNAPSHOT_DIR, name + ".json")
+
+    with _tokenizers_lock:
+        if name in _tokenizers:
+            return _tokenizers[name]
+
+        if os.path.exists(snapshot_path):
+            enc = SnapshotTokenizer.from_file(snapshot_path)
+        else:
+            from transformers import GPT2TokenizerFast
+            enc = GPT2TokenizerFast.from_pretrained(name)
+            backend = getattr(enc, "backend_tokenizer", None)
+            if backend is not None:
+                # Save a snapshot so later runs can skip importing transformers
+                os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+                tmp_path = snapshot_path + ".tmp"
+                backend.save(tmp_path)
+                os.replace(tmp_path, snapshot_path)
+
+        _tokenizers[name] = enc
+        return enc